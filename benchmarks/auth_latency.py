@@ -0,0 +1,79 @@
+# Login latency and throughput of the auth service: single logins at a given
+# bcrypt work factor, concurrent logins through the bounded auth pool, and how
+# long the calling (UI) thread is blocked by login_async().
+#
+#   python benchmarks/auth_latency.py --rounds 12 --users 8 --logins 32
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt work factor")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--logins", type=int, default=32, help="logins per measurement")
+    parser.add_argument("--workers", type=int, default=None, help="auth pool size (default: AUTH_WORKERS)")
+    args = parser.parse_args(argv)
+
+    tmp = tempfile.mkdtemp()
+    os.environ["FINANCE_MANAGER_DB"] = os.path.join(tmp, "auth.db")
+    from finance_manager import auth
+    from finance_manager.database import create_tables
+
+    auth.BCRYPT_ROUNDS = args.rounds
+    if args.workers:
+        auth.AUTH_WORKERS = args.workers
+    auth.MAX_PENDING = max(auth.MAX_PENDING, args.logins)
+    auth._pending = auth.threading.BoundedSemaphore(auth.MAX_PENDING)
+    create_tables()
+
+    users = [(f"user{i}", f"password {i}") for i in range(args.users)]
+    start = time.perf_counter()
+    for username, password in users:
+        auth.register_user(username, password)
+    print(f"register: {(time.perf_counter() - start) / len(users) * 1000:.0f} ms per user at {args.rounds} rounds")
+
+    # Sequential logins on the calling thread
+    latencies = []
+    for i in range(args.logins):
+        username, password = users[i % len(users)]
+        start = time.perf_counter()
+        assert auth.login_user(username, password)
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(f"login: median {statistics.median(latencies):.0f} ms, p95 {percentile(latencies, 0.95):.0f} ms")
+
+    # The same logins submitted at once to the auth pool
+    blocked = []
+    start = time.perf_counter()
+    futures = []
+    for i in range(args.logins):
+        username, password = users[i % len(users)]
+        submitted = time.perf_counter()
+        futures.append(auth.login_async(username, password))
+        blocked.append((time.perf_counter() - submitted) * 1000)
+    assert all(future.result() for future in futures)
+    elapsed = time.perf_counter() - start
+    print(f"concurrent: {args.logins} logins in {elapsed:.2f}s ({args.logins / elapsed:.1f} logins/s, {auth.AUTH_WORKERS} workers)")
+    print(f"caller blocked by login_async: max {max(blocked):.2f} ms")
+
+    # Failed attempts are throttled without hashing
+    username = users[0][0]
+    for _ in range(auth.FREE_ATTEMPTS + 1):
+        auth.login_user(username, "wrong")
+    start = time.perf_counter()
+    try:
+        auth.login_user(username, "wrong")
+    except auth.TooManyAttempts as e:
+        print(f"throttled attempt rejected in {(time.perf_counter() - start) * 1000:.2f} ms (retry after {e.retry_after:.1f}s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+# Seeded synthetic ledgers for benchmarks. The same (rows, users, seed) always
+# produces the same database, built through the app's own schema and
+# migrations, so rollups, triggers and indexes are exactly what the app uses.
+#
+#   python benchmarks/ledger.py --rows 1M --out /tmp/ledger-1M.db
+import argparse
+import datetime
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+# (category, type, share of transactions, median amount in cents, spread,
+#  merchants). Amounts are log-normal around the median; spread is sigma.
+CATEGORIES = [
+    ("Groceries", "expense", 0.22, 4500, 0.6, ["Whole Foods", "Trader Joe's", "Safeway", "Aldi", "Costco"]),
+    ("Dining", "expense", 0.18, 2200, 0.7, ["Chipotle", "Starbucks", "Pizza Place", "Sushi Bar", "Diner"]),
+    ("Transport", "expense", 0.12, 1800, 0.8, ["Uber", "Lyft", "Shell", "Chevron", "Metro Card"]),
+    ("Shopping", "expense", 0.10, 3900, 1.0, ["Amazon", "Target", "Best Buy", "IKEA", "Etsy"]),
+    ("Entertainment", "expense", 0.07, 1500, 0.7, ["Netflix", "Spotify", "Cinema", "Steam", "Concert"]),
+    ("Health", "expense", 0.05, 3500, 0.9, ["Pharmacy", "Dentist", "Clinic", "Gym"]),
+    ("Utilities", "expense", 0.05, 9000, 0.3, ["Electricity", "Water", "Internet", "Phone"]),
+    ("Travel", "expense", 0.03, 25000, 1.0, ["Airline", "Hotel", "Car Rental", "Airbnb"]),
+    ("Rent", "expense", 0.04, 180000, 0.1, ["Landlord"]),
+    ("Salary", "income", 0.08, 350000, 0.15, ["Employer payroll"]),
+    ("Freelance", "income", 0.03, 60000, 0.8, ["Client invoice", "Consulting"]),
+    ("Interest", "income", 0.02, 800, 0.9, ["Savings interest"]),
+    ("Gift", "income", 0.01, 5000, 0.9, ["Birthday gift", "Refund"]),
+]
+
+# Month-bound categories land on fixed days instead of random ones
+FIXED_DAYS = {"Rent": (1,), "Salary": (1, 15), "Utilities": (20,)}
+
+def parse_rows(text):
+    text = text.strip().lower()
+    multiplier = {"k": 1000, "m": 1000000}.get(text[-1], 1)
+    return int(float(text.rstrip("km")) * multiplier)
+
+# Yield (user_id, date, amount_cents, category, description, type) rows.
+# Dates span `years` years ending at `end`, weighted towards weekends for
+# discretionary spending.
+def generate_rows(rows, users=10, years=10, seed=0, end=datetime.date(2024, 12, 31)):
+    rng = random.Random(seed)
+    start = end - datetime.timedelta(days=365 * years)
+    span = (end - start).days
+    names = [category[0] for category in CATEGORIES]
+    weights = [category[2] for category in CATEGORIES]
+    by_name = {category[0]: category for category in CATEGORIES}
+    # Some users are much more active than others
+    user_weights = [1 / (rank + 1) for rank in range(users)]
+    user_ids = list(range(1, users + 1))
+
+    for number in range(rows):
+        name = rng.choices(names, weights)[0]
+        _, transaction_type, _, median, sigma, merchants = by_name[name]
+        day = start + datetime.timedelta(days=rng.randrange(span + 1))
+        if name in FIXED_DAYS:
+            day = day.replace(day=rng.choice(FIXED_DAYS[name]))
+        elif transaction_type == "expense" and day.weekday() < 5 and rng.random() < 0.3:
+            day += datetime.timedelta(days=5 - day.weekday())  # move to Saturday
+            day = min(day, end)
+        amount = max(1, int(rng.lognormvariate(math.log(median), sigma)))
+        description = f"{rng.choice(merchants)} #{number % 9973}"
+        yield (rng.choices(user_ids, user_weights)[0], day.isoformat(), amount, name, description, transaction_type)
+
+# Build (or reuse) a ledger database at path. Returns the path. The file is
+# built under a temporary name, so an interrupted build is never reused.
+def build_ledger(path, rows, users=10, seed=0, batch_size=50000):
+    if os.path.exists(path):
+        return path
+    from finance_manager import database
+    from finance_manager.categories import TYPE_IDS, category_id
+    from finance_manager.transactions import INSERT_TRANSACTION
+    building = path + ".building"
+    for leftover in (building, building + "-wal", building + "-shm"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    database.DB_PATH = building
+    database.close_connection()
+    database.create_tables()
+
+    start = time.perf_counter()
+    with database.transaction() as conn:
+        conn.executemany("INSERT INTO users (id, username, password) VALUES (?, ?, ?)",
+                         ((user_id, f"user{user_id}", b"") for user_id in range(1, users + 1)))
+    generated = generate_rows(rows, users, seed=seed)
+    inserted = 0
+    while inserted < rows:
+        batch = [row for _, row in zip(range(batch_size), generated)]
+        with database.transaction() as conn:
+            conn.executemany(INSERT_TRANSACTION, [(user_id, date, amount, category_id(category), description, TYPE_IDS[transaction_type])
+                                                  for user_id, date, amount, category, description, transaction_type in batch])
+        inserted += len(batch)
+    database.get_connection().execute("ANALYZE")
+    database.close_connection()
+    os.replace(building, path)
+    print(f"Built {rows:,} rows for {users} users in {time.perf_counter() - start:.1f}s: {path}", file=sys.stderr)
+    return path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="10k", help="e.g. 10k, 1M, 10M")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="database path (default: ledger-<rows>-<users>-<seed>.db in the temp directory)")
+    args = parser.parse_args(argv)
+    rows = parse_rows(args.rows)
+    path = args.out or os.path.join(tempfile.gettempdir(), f"ledger-{args.rows}-{args.users}-{args.seed}.db")
+    build_ledger(path, rows, args.users, args.seed)
+
+if __name__ == "__main__":
+    main()
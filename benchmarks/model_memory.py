@@ -0,0 +1,60 @@
+# Memory and load time of a ledger held as plain row tuples, as slotted
+# Transaction objects and as a columnar TransactionBatch.
+#
+#   python benchmarks/model_memory.py --rows 1000000
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from finance_manager.models import TRANSACTION_COLUMNS, TransactionBatch, transaction_row_factory
+
+CATEGORIES = ["Food", "Rent", "Transport", "Utilities", "Fun", "Health", "Salary", "Gift"]
+
+def build_ledger(rows, seed=0):
+    rng = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    conn.execute(f"CREATE TABLE transactions (id INTEGER PRIMARY KEY, user_id INTEGER, date TEXT, amount_cents INTEGER, category TEXT, description TEXT, transaction_type TEXT)")
+    conn.executemany(f"INSERT INTO transactions ({TRANSACTION_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                     ((i, 1, f"20{rng.randint(10, 24)}-{rng.randint(1, 12):02}-{rng.randint(1, 28):02}", rng.randint(1, 500000),
+                       rng.choice(CATEGORIES), f"description {i % 1000}", rng.choice(("income", "expense")))
+                      for i in range(1, rows + 1)))
+    conn.commit()
+    return conn
+
+def measure(label, load):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<20} {elapsed:8.2f}s  retained {current / 2**20:8.1f} MiB  peak {peak / 2**20:8.1f} MiB")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    args = parser.parse_args()
+
+    conn = build_ledger(args.rows)
+    print(f"{args.rows} rows")
+
+    measure("tuples", lambda: conn.execute(f"SELECT {TRANSACTION_COLUMNS} FROM transactions").fetchall())
+
+    def load_objects():
+        cursor = conn.cursor()
+        cursor.row_factory = transaction_row_factory
+        return cursor.execute(f"SELECT {TRANSACTION_COLUMNS} FROM transactions").fetchall()
+    measure("Transaction objects", load_objects)
+
+    measure("TransactionBatch", lambda: TransactionBatch.from_cursor(
+        conn.execute("SELECT id, date, amount_cents, category, transaction_type = 'income' FROM transactions")))
+
+if __name__ == "__main__":
+    main()
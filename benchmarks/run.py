@@ -0,0 +1,247 @@
+# Benchmark harness: times the public functions of transactions, reports,
+# aggregation and visualization (charts rendered to PNG on Agg) against a
+# seeded synthetic ledger, and writes the timings as JSON. Passing an earlier
+# result file with --compare prints the change per benchmark and exits
+# non-zero when any median got slower than --threshold allows.
+#
+#   python benchmarks/run.py --rows 1M --out results.json
+#   python benchmarks/run.py --rows 1M --compare results.json
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from ledger import build_ledger, generate_rows, parse_rows
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Context shared by the benchmarks: the busiest user, a year with data, some
+# ids spread over the ledger and a scratch directory
+class Context:
+    def __init__(self, conn, workdir):
+        self.user_id, self.count = conn.execute("SELECT user_id, COUNT(*) FROM transactions GROUP BY user_id ORDER BY 2 DESC LIMIT 1").fetchone()
+        self.year = conn.execute("SELECT MAX(substr(date, 1, 4)) FROM transactions WHERE user_id = ?", (self.user_id,)).fetchone()[0]
+        self.ids = [row[0] for row in conn.execute("SELECT id FROM transactions WHERE user_id = ? ORDER BY id", (self.user_id,))]
+        self.middle_id = self.ids[len(self.ids) // 2]
+        self.categories = [row[0] for row in conn.execute('''SELECT name FROM categories WHERE id IN
+                                                             (SELECT category_id FROM monthly_rollups r JOIN transaction_types y ON y.id = r.type_id
+                                                              WHERE r.user_id = ? AND y.name = 'expense')''', (self.user_id,))]
+        self.workdir = workdir
+        self.csv_path = os.path.join(workdir, "import.csv")
+
+# (name, setup, func): setup runs untimed before every repetition and its
+# return value is passed to func
+def benchmarks(ctx, rows):
+    from finance_manager import aggregation, balances, budgets, recurring, reports, statements, transactions, visualization
+    from finance_manager.database import bump_data_version
+    from finance_manager.models import Transaction
+
+    user = ctx.user_id
+    start_date, end_date = f"{ctx.year}-01-01", f"{ctx.year}-12-31"
+    new_rows = lambda n: [Transaction(f"{ctx.year}-06-15", 1234, "Benchmark", "benchmark row") for _ in range(n)]
+
+    def added_ids(n):
+        transactions.add_transactions(user, new_rows(n))
+        return [transaction.id for transaction in transactions.get_transactions_before(user, sys.maxsize, n)]
+
+    # Rent, salary, a subscription, a weekly and a daily rule, ten years back
+    def add_rules():
+        start = int(ctx.year) - 10
+        for date, amount, category, transaction_type, interval in [
+                (f"{start}-01-01", 180000, "Rent", "expense", "monthly"), (f"{start}-01-15", 350000, "Salary", "income", "monthly"),
+                (f"{start}-03-31", 1599, "Entertainment", "expense", "monthly"), (f"{start}-01-03", 4500, "Groceries", "expense", "weekly"),
+                (f"{start}-01-01", 350, "Dining", "expense", "daily")]:
+            recurring.add_recurring_rule(user, Transaction(date, amount, category, "benchmark rule", transaction_type), interval)
+
+    def cold():
+        bump_data_version(user)
+
+    # Setup that fills a cache first, so every repetition times a hit
+    def warm(func):
+        def setup():
+            func()
+        return setup
+
+    # Reads
+    yield "transactions.get_transactions_after", None, lambda: transactions.get_transactions_after(user, ctx.middle_id, 50)
+    yield "transactions.get_transactions_before", None, lambda: transactions.get_transactions_before(user, ctx.middle_id, 50)
+    yield "transactions.get_transactions_at (middle)", None, lambda: transactions.get_transactions_at(user, len(ctx.ids) // 2, 50)
+    yield "transactions.count_transactions", None, lambda: transactions.count_transactions(user)
+    yield "transactions.get_transaction_by_id", None, lambda: transactions.get_transaction_by_id(user, ctx.middle_id)
+    yield "transactions.transaction_position", None, lambda: transactions.transaction_position(user, ctx.middle_id)
+    yield "transactions.iter_transactions (10k)", None, lambda: sum(1 for _ in transactions.iter_transactions(user, limit=10000))
+    yield "transactions.load_transaction_batch", None, lambda: transactions.load_transaction_batch(user)
+    yield "transactions.search_transactions (word)", None, lambda: transactions.search_transactions(user, "starbucks")
+    yield "transactions.search_transactions (prefix)", None, lambda: transactions.search_transactions(user, "gr")
+    yield "transactions.query_transactions (year)", None, lambda: transactions.query_transactions(user, start_date=start_date, end_date=end_date).fetchall()
+    yield "transactions.export_transactions (year, csv)", None, lambda: quiet_call(transactions.export_transactions, user, os.path.join(ctx.workdir, "export.csv"), None, start_date, end_date)
+    if rows <= 1000000:
+        # Loads and prints the whole ledger; too slow to be useful beyond this
+        yield "transactions.view_transactions", None, lambda: quiet_call(transactions.view_transactions, user)
+
+    yield "reports.summary (cold)", cold, lambda: reports.summary(user)
+    summary = lambda: reports.summary(user)
+    yield "reports.summary (cached)", warm(summary), summary
+    yield "reports.generate_monthly_report", None, lambda: reports.generate_monthly_report(user, ctx.year, "06")
+    yield "reports.generate_yearly_summary", None, lambda: reports.generate_yearly_summary(user, ctx.year)
+    yield "reports.generate_custom_report", None, lambda: quiet_call(reports.generate_custom_report, user, start_date, end_date)
+    yield "reports.export_monthly_summary", None, lambda: reports.export_monthly_summary(user, os.path.join(ctx.workdir, "summary.csv"))
+    yield "statements.write_statements (all users, month)", None, lambda: statements.write_statements(f"{ctx.year}-06", jsonl_path=os.path.join(ctx.workdir, "statements.jsonl"))
+
+    yield "aggregation.period_totals", None, lambda: aggregation.period_totals(user)
+    yield "aggregation.date_range_totals (year)", None, lambda: aggregation.date_range_totals(user, start_date, end_date)
+    yield "aggregation.monthly_totals", None, lambda: aggregation.monthly_totals(user, ctx.year)
+    yield "aggregation.category_totals", None, lambda: aggregation.category_totals(user, "expense")
+    for resolution in ("day", "auto"):
+        yield f"aggregation.daily_totals ({resolution})", None, lambda resolution=resolution: aggregation.daily_totals(user, resolution)
+        yield f"aggregation.cumulative_net ({resolution})", None, lambda resolution=resolution: aggregation.cumulative_net(user, resolution)
+        yield f"aggregation.category_daily_series ({resolution})", None, lambda resolution=resolution: aggregation.category_daily_series(user, "expense", resolution)
+    yield "aggregation.category_amounts", None, lambda: aggregation.category_amounts(user, "expense")
+    yield "aggregation.transaction_amounts", None, lambda: aggregation.transaction_amounts(user)
+    yield "aggregation.cumulative_net (month)", None, lambda: aggregation.cumulative_net(user, "month")
+    yield "aggregation.cumulative_net (day, from June)", None, lambda: aggregation.cumulative_net(user, "day", f"{ctx.year}-06-15")
+    yield "balances.balance_at", None, lambda: balances.balance_at(user, f"{ctx.year}-06-15")
+    yield "balances.month_end_balances", None, lambda: balances.month_end_balances(user)
+
+    for kind in visualization.CHARTS:
+        params = {"year": ctx.year} if kind.startswith("monthly") else {}
+        yield f"visualization.render_chart {kind}", visualization.clear_render_cache, lambda kind=kind, params=params: visualization.render_chart(user, kind, **params)
+    render = lambda: visualization.render_chart(user, "income_expense_trend")
+    yield "visualization.render_chart (cached)", warm(render), render
+
+    # Budgets on every expense category, so the writes below also run the
+    # budget alert triggers
+    yield "budgets.set_budget (all categories)", None, lambda: [budgets.set_budget(user, category, 100000) for category in ctx.categories]
+    yield "budgets.budget_status", None, lambda: budgets.budget_status(user, f"{ctx.year}-06")
+    yield "budgets.take_budget_alerts", None, lambda: budgets.take_budget_alerts(user)
+
+    # Writes, last, on the working copy
+    yield "transactions.add_transaction", None, lambda: transactions.add_transaction(user, new_rows(1)[0])
+    yield "transactions.add_transactions (1k)", None, lambda: transactions.add_transactions(user, new_rows(1000))
+    yield "transactions.edit_transaction", None, lambda: transactions.edit_transaction(user, ctx.middle_id, f"{ctx.year}-06-15", 999, "Dining", "edited", "expense")
+    yield "transactions.bulk_update (10k recategorize)", None, lambda: transactions.bulk_update(user, ctx.ids[:10000], category="Groceries")
+    yield "transactions.delete_transaction", lambda: added_ids(1)[0], lambda transaction_id: transactions.delete_transaction(user, transaction_id)
+    yield "transactions.bulk_delete (1k)", lambda: added_ids(1000), lambda ids: transactions.bulk_delete(user, ids)
+    yield "transactions.import_csv (10k)", None, lambda: quiet_call(transactions.import_csv, user, ctx.csv_path)
+    # Editing the oldest transaction leaves every later checkpoint to repair
+    yield "balances.balance_at (after editing the oldest transaction)", lambda: transactions.bulk_update(user, ctx.ids[:1], amount_cents=4321), lambda _: balances.balance_at(user, f"{ctx.year}-06-15")
+    yield "recurring.materialize_due (5 rules, 10 years)", add_rules, lambda: recurring.materialize_due(f"{ctx.year}-12-31", user)
+    yield "recurring.forecast (10 years)", None, lambda: recurring.forecast(user, 120)
+
+def quiet_call(func, *args):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return func(*args)
+
+def run(name, setup, func, repeat):
+    timings = []
+    for _ in range(repeat):
+        args = setup() if setup else None
+        start = time.perf_counter()
+        func() if args is None else func(args)
+        timings.append((time.perf_counter() - start) * 1000)
+    return {"runs": repeat, "min_ms": min(timings), "median_ms": statistics.median(timings), "mean_ms": statistics.fmean(timings)}
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline_path, threshold, min_delta_ms):
+    with open(baseline_path, encoding="utf-8") as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+    regressions = []
+    print(f"\n{'benchmark':<55} {'before':>10} {'after':>10} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        before, after = baseline[name]["median_ms"], result["median_ms"]
+        ratio = after / before if before else 1.0
+        # Sub-millisecond benchmarks are too noisy to judge by ratio alone
+        flag = " SLOWER" if ratio > threshold and after - before > min_delta_ms else ""
+        print(f"{name:<55} {before:10.2f} {after:10.2f} {ratio:7.2f}x{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", default="10k", help="ledger size, e.g. 10k, 1M, 10M")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--cache-dir", default=os.path.join(tempfile.gettempdir(), "finance-manager-benchmarks"),
+                        help="where generated ledgers are kept between runs")
+    parser.add_argument("--filter", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--out", help="write results as JSON to this file")
+    parser.add_argument("--compare", help="earlier JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio that counts as a regression")
+    parser.add_argument("--min-delta-ms", type=float, default=0.5, help="smallest slowdown in ms that counts as a regression")
+    parser.add_argument("--profile", action="store_true", help="print the slowest queries and renders seen during the run")
+    args = parser.parse_args(argv)
+
+    rows = parse_rows(args.rows)
+    os.makedirs(args.cache_dir, exist_ok=True)
+    ledger = build_ledger(os.path.join(args.cache_dir, f"ledger-{rows}-{args.users}-{args.seed}.db"), rows, args.users, args.seed)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        # Writes go to a copy, so the cached ledger stays pristine
+        working_copy = os.path.join(workdir, "ledger.db")
+        shutil.copyfile(ledger, working_copy)
+        from finance_manager import database
+        database.DB_PATH = working_copy
+        database.close_connection()
+        database.create_tables()
+        # A cached ledger built by an older schema was just migrated; fold the
+        # rewrite into the database file so it does not weigh on the timings
+        database.get_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+        ctx = Context(database.get_connection(), workdir)
+        with open(ctx.csv_path, "w", encoding="utf-8") as csv_file:
+            for _, date, amount, category, description, transaction_type in generate_rows(10000, 1, seed=args.seed + 1):
+                csv_file.write(f"{date},{amount / 100:.2f},{category},{description},{transaction_type}\n")
+
+        print(f"{rows:,} rows; user {ctx.user_id} has {ctx.count:,} transactions")
+        if args.profile:
+            from finance_manager.instrumentation import HistogramSink, add_sink
+            histogram = add_sink(HistogramSink())
+        for name, setup, func in benchmarks(ctx, rows):
+            if args.filter and args.filter not in name:
+                continue
+            results[name] = result = run(name, setup, func, args.repeat)
+            print(f"{name:<55} median {result['median_ms']:10.2f} ms   min {result['min_ms']:10.2f} ms")
+        database.close_connection()
+        if args.profile:
+            print(f"\n{histogram.report(limit=30)}")
+
+    output = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "rows": rows, "users": args.users, "seed": args.seed, "repeat": args.repeat,
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as out_file:
+            json.dump(output, out_file, indent=2)
+    if args.compare and compare(results, args.compare, args.threshold, args.min_delta_ms):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
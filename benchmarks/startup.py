@@ -0,0 +1,108 @@
+# Cold-start time of the GUI: how long until the login window is on screen,
+# and which imports that time goes to. Exits non-zero when startup is over
+# budget or pulls in a module that should only load on first use, so it can
+# guard against regressions.
+#
+#   python benchmarks/startup.py --runs 5 --budget-ms 300
+#
+# Without a display the login window cannot be measured, which is a failure
+# unless --allow-headless is given (then only the import checks run).
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+# Modules that must not be imported before the login window is shown
+DEFERRED = ["numpy", "matplotlib", "bcrypt", "tkcalendar", "finance_manager.reports", "finance_manager.visualization"]
+
+# Runs the same steps as main.py, but replaces mainloop() with one update so
+# the process exits as soon as the login window has been drawn.
+FIRST_WINDOW = """
+import sys
+import tkinter as tk
+
+def mainloop(self, n=0):
+    self.update()
+    print("deferred:" + ",".join(m for m in {deferred!r} if m in sys.modules), flush=True)
+    self.destroy()
+tk.Tk.mainloop = mainloop
+
+from finance_manager.database import create_tables
+from finance_manager.gui import show_login_window
+create_tables()
+show_login_window()
+"""
+
+def run_child(args, db_path):
+    env = dict(os.environ, FINANCE_MANAGER_DB=db_path)
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable] + args, cwd=ROOT, env=env, capture_output=True, text=True)
+    return time.perf_counter() - start, result
+
+# Parse -X importtime output into {module: (self_us, cumulative_us)}
+def parse_importtime(stderr):
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=300.0, help="maximum median time to the login window")
+    parser.add_argument("--top", type=int, default=10, help="number of slowest imports to list")
+    parser.add_argument("--allow-headless", action="store_true", help="pass when the login window cannot be opened (e.g. no display)")
+    args = parser.parse_args(argv)
+
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "startup.db")
+
+        # Import cost of the GUI module alone
+        _, result = run_child(["-X", "importtime", "-c", "import finance_manager.gui"], db_path)
+        modules = parse_importtime(result.stderr)
+        total = modules.get("finance_manager.gui", (0, 0))[1] / 1000
+        print(f"import finance_manager.gui: {total:.1f} ms cumulative")
+        for name, (self_us, _) in sorted(modules.items(), key=lambda item: -item[1][0])[:args.top]:
+            print(f"  {self_us / 1000:8.1f} ms  {name}")
+        loaded = [name for name in DEFERRED if name in modules]
+        if loaded:
+            failures.append(f"imported at startup: {', '.join(loaded)}")
+
+        # Process start to login window drawn, as main.py runs it
+        timings = []
+        for _ in range(args.runs):
+            elapsed, result = run_child(["-c", FIRST_WINDOW.format(deferred=DEFERRED)], db_path)
+            if result.returncode != 0:
+                error = result.stderr.strip().splitlines()[-1] if result.stderr.strip() else f"exit code {result.returncode}"
+                if args.allow_headless:
+                    print(f"time to first window: skipped ({error})")
+                else:
+                    failures.append(f"time to first window could not be measured ({error})")
+                break
+            timings.append(elapsed * 1000)
+            loaded = [name for name in result.stdout.strip().partition("deferred:")[2].split(",") if name]
+            if loaded:
+                failures.append(f"imported before the login window: {', '.join(loaded)}")
+                break
+
+        if timings:
+            median = statistics.median(timings)
+            print(f"time to first window: median {median:.0f} ms, min {min(timings):.0f} ms over {len(timings)} runs (budget {args.budget_ms:.0f} ms)")
+            if median > args.budget_ms:
+                failures.append(f"time to first window {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
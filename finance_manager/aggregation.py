@@ -0,0 +1,223 @@
+from bisect import bisect_left
+from datetime import date, timedelta
+
+import numpy as np
+
+from .archive import archived_amounts
+from .balances import balance_at, month_end_balances
+from .categories import TYPE_IDS, TYPE_NAMES, category_name
+from .database import get_connection, ledger_source
+from .errors import ValidationError
+from .models import parse_date
+
+# Shared aggregation queries for reports and charts. Each function answers its
+# question with a single grouped query (or one pass over a single cursor), so
+# the number of round trips does not grow with the number of months or
+# categories a user has.
+#
+# All amounts are integer cents. Series that Python has to combine further are
+# returned as NumPy int64 arrays, which keeps the arithmetic exact and
+# vectorized.
+#
+# Rows store category and type ids (see categories.py), so grouping compares
+# integers; names are attached to the (few) grouped results afterwards.
+#
+# Archived years (see archive.py) stay in monthly_rollups, and their per-day
+# totals are part of database.ledger_source(), so every series below covers
+# hot and archived transactions alike.
+
+INCOME, EXPENSE = TYPE_IDS['income'], TYPE_IDS['expense']
+MONTHS = [f"{i:02}" for i in range(1, 13)]
+
+def next_year_month(year_month):
+    year, month = int(year_month[:4]), int(year_month[5:7])
+    return f"{year + 1:04}-01" if month == 12 else f"{year:04}-{month + 1:02}"
+
+# Income and expense totals read from monthly_rollups, for months in
+# [start_month, end_month) given as 'YYYY-MM'. Either bound may be None.
+def period_totals(user_id, start_month=None, end_month=None):
+    query = "SELECT type_id, SUM(total_cents) FROM monthly_rollups WHERE user_id = ?"
+    params = [user_id]
+    if start_month:
+        query += " AND year_month >= ?"
+        params.append(start_month)
+    if end_month:
+        query += " AND year_month < ?"
+        params.append(end_month)
+    totals = dict(get_connection().execute(query + " GROUP BY type_id", params).fetchall())
+    return totals.get(INCOME) or 0, totals.get(EXPENSE) or 0
+
+# Income and expense totals for an arbitrary inclusive date range. Partial
+# months cannot come from the rollup, so this reads the indexed raw table
+# (and the day totals of archived years).
+def date_range_totals(user_id, start_date, end_date):
+    conn = get_connection()
+    cursor = conn.execute(f"SELECT type_id, SUM(amount_cents) FROM {ledger_source(conn)} WHERE user_id = ? AND date BETWEEN ? AND ? GROUP BY type_id", (user_id, start_date, end_date))
+    totals = dict(cursor.fetchall())
+    return totals.get(INCOME) or 0, totals.get(EXPENSE) or 0
+
+# Twelve monthly totals per transaction type for one year, as int64 arrays:
+# {'income': [jan, ..., dec], 'expense': [jan, ..., dec]}
+def monthly_totals(user_id, year):
+    year = int(year)
+    series = {'income': np.zeros(12, dtype=np.int64), 'expense': np.zeros(12, dtype=np.int64)}
+    cursor = get_connection().execute("SELECT year_month, type_id, SUM(total_cents) FROM monthly_rollups WHERE user_id = ? AND year_month >= ? AND year_month < ? GROUP BY year_month, type_id",
+                                      (user_id, f"{year:04}-01", f"{year + 1:04}-01"))
+    for year_month, type_id, total in cursor:
+        if type_id in TYPE_NAMES:
+            series[TYPE_NAMES[type_id]][int(year_month[5:7]) - 1] = total
+    return series
+
+# Totals per category for one transaction type, from the rollup, by name
+def category_totals(user_id, transaction_type):
+    cursor = get_connection().execute("SELECT category_id, SUM(total_cents) FROM monthly_rollups WHERE user_id = ? AND type_id = ? GROUP BY category_id", (user_id, TYPE_IDS.get(transaction_type)))
+    return sorted((category_name(category), total) for category, total in cursor)
+
+# Trend series can be grouped by day, week, month or quarter. Each bucket is
+# labelled with its first day ('YYYY-MM-DD'); weeks start on Monday. Month and
+# quarter buckets are read from monthly_rollups instead of the raw table.
+RESOLUTIONS = ['day', 'week', 'month', 'quarter']
+BUCKET_DAYS = {'day': 1, 'week': 7, 'month': 30.44, 'quarter': 91.31}
+MAX_BUCKETS = 2000
+
+BUCKETS = {
+    'day': "date",
+    'week': "date(date, 'weekday 0', '-6 days')",
+}
+ROLLUP_BUCKETS = {
+    'month': "year_month || '-01'",
+    'quarter': "substr(year_month, 1, 5) || printf('%02d', (CAST(substr(year_month, 6, 2) AS INTEGER) - 1) / 3 * 3 + 1) || '-01'",
+}
+
+# The finest resolution that keeps a user's whole history under max_buckets
+# points. The span comes from the two ends of the (user_id, date) index.
+def choose_resolution(user_id, max_buckets=MAX_BUCKETS):
+    conn = get_connection()
+    span = conn.execute(f"SELECT julianday(MAX(date)) - julianday(MIN(date)) FROM {ledger_source(conn)} WHERE user_id = ?", (user_id,)).fetchone()[0] or 0
+    for resolution in RESOLUTIONS[:-1]:
+        if span / BUCKET_DAYS[resolution] < max_buckets:
+            return resolution
+    return RESOLUTIONS[-1]
+
+# (bucket expression, table, amount column) for a resolution, or 'auto'
+def _bucket_source(user_id, resolution):
+    if resolution == 'auto':
+        resolution = choose_resolution(user_id)
+    if resolution in ROLLUP_BUCKETS:
+        return ROLLUP_BUCKETS[resolution], 'monthly_rollups', 'total_cents'
+    if resolution in BUCKETS:
+        return BUCKETS[resolution], ledger_source(get_connection()), 'amount_cents'
+    raise ValueError(f"Unknown resolution: {resolution}")
+
+# Income and expense totals per bucket (per day by default):
+# (dates, incomes, expenses)
+def daily_totals(user_id, resolution='day'):
+    bucket, table, amount = _bucket_source(user_id, resolution)
+    cursor = get_connection().execute(f"SELECT {bucket} AS bucket, SUM(CASE WHEN type_id = {INCOME} THEN {amount} ELSE 0 END), SUM(CASE WHEN type_id = {EXPENSE} THEN {amount} ELSE 0 END) FROM {table} WHERE user_id = ? GROUP BY bucket ORDER BY bucket", (user_id,))
+    dates, incomes, expenses = [], [], []
+    for date, income, expense in cursor:
+        dates.append(date)
+        incomes.append(income)
+        expenses.append(expense)
+    return dates, incomes, expenses
+
+# Net (income minus expenses) per bucket: (dates, int64 nets)
+def daily_net(user_id, resolution='day'):
+    bucket, table, amount = _bucket_source(user_id, resolution)
+    cursor = get_connection().execute(f"SELECT {bucket} AS bucket, SUM(CASE WHEN type_id = {INCOME} THEN {amount} ELSE -{amount} END) FROM {table} WHERE user_id = ? GROUP BY bucket ORDER BY bucket", (user_id,))
+    dates, nets = [], []
+    for date, net in cursor:
+        dates.append(date)
+        nets.append(net)
+    return dates, np.array(nets, dtype=np.int64)
+
+# Net per day with the day's bucket. Grouping by date follows the
+# (user_id, date) index, where grouping by bucket would need a sort, and
+# lets a week that spans two months be split at the month boundary.
+DAY_NETS = f"""SELECT date, {{bucket}},
+                      SUM(CASE WHEN type_id = {INCOME} THEN amount_cents ELSE -amount_cents END)
+               FROM {{table}}
+               WHERE user_id = ? AND date >= ?
+               GROUP BY date
+               ORDER BY date"""
+
+# Running balance at the end of each bucket: (dates, int64 balances), from
+# start_date ('YYYY-MM-DD') on, or over the whole history. Every balance
+# comes from the month-end balance checkpoints: month and quarter buckets
+# read them directly; day and week buckets start each month from the
+# checkpoint before it and add that month's nets up to the bucket, so a
+# window costs a range scan over the window only.
+def cumulative_net(user_id, resolution='day', start_date=None):
+    if resolution == 'auto':
+        resolution = choose_resolution(user_id)
+    if resolution not in ROLLUP_BUCKETS and resolution not in BUCKETS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    if start_date is not None:
+        start_date = parse_date(start_date) if isinstance(start_date, str) else None
+        if start_date is None:
+            raise ValidationError("Invalid start date.")
+    checkpoints = month_end_balances(user_id)
+    dates, balances = [], []
+    if resolution in ROLLUP_BUCKETS:
+        for year_month, balance in checkpoints:
+            if start_date and year_month < start_date[:7]:
+                continue
+            month = int(year_month[5:7]) if resolution == 'month' else (int(year_month[5:7]) - 1) // 3 * 3 + 1
+            bucket = f"{year_month[:5]}{month:02}-01"
+            if dates and dates[-1] == bucket:
+                balances[-1] = balance
+            else:
+                dates.append(bucket)
+                balances.append(balance)
+        return dates, np.array(balances, dtype=np.int64)
+
+    months = [year_month for year_month, _ in checkpoints]
+    conn = get_connection()
+    cursor = conn.execute(DAY_NETS.format(bucket=BUCKETS[resolution], table=ledger_source(conn)), (user_id, start_date or ''))
+    current_month = balance = None
+    for day, bucket, net in cursor:
+        year_month = day[:7]
+        if year_month != current_month:
+            current_month = year_month
+            if start_date and year_month == start_date[:7]:
+                # The window starts inside this month
+                balance = balance_at(user_id, (date.fromisoformat(start_date) - timedelta(days=1)).isoformat())
+            else:
+                position = bisect_left(months, year_month)
+                balance = checkpoints[position - 1][1] if position else 0
+        balance += net
+        if dates and dates[-1] == bucket:
+            balances[-1] = balance
+        else:
+            dates.append(bucket)
+            balances.append(balance)
+    return dates, np.array(balances, dtype=np.int64)
+
+# Per-bucket totals for every category of one type, from a single grouped
+# query: {category: (dates, amounts)} in category name order
+def category_daily_series(user_id, transaction_type='expense', resolution='day'):
+    bucket, table, amount = _bucket_source(user_id, resolution)
+    cursor = get_connection().execute(f"SELECT category_id, {bucket} AS bucket, SUM({amount}) FROM {table} WHERE user_id = ? AND type_id = ? GROUP BY category_id, bucket ORDER BY category_id, bucket", (user_id, TYPE_IDS.get(transaction_type)))
+    series = {}
+    for category, date, total in cursor:
+        dates, amounts = series.setdefault(category, ([], []))
+        dates.append(date)
+        amounts.append(total)
+    return dict(sorted((category_name(category), data) for category, data in series.items()))
+
+# Individual amounts for every category of one type, from one cursor pass
+# (after the archived ones): {category: [amount, ...]} in category name order
+def category_amounts(user_id, transaction_type='expense'):
+    type_id = TYPE_IDS.get(transaction_type)
+    cursor = get_connection().execute("SELECT category_id, amount_cents FROM transactions WHERE user_id = ? AND type_id = ?", (user_id, type_id))
+    amounts = {}
+    for category, amount in archived_amounts(user_id, type_id):
+        amounts.setdefault(category, []).append(amount)
+    for category, amount in cursor:
+        amounts.setdefault(category, []).append(amount)
+    return dict(sorted((category_name(category), values) for category, values in amounts.items()))
+
+def transaction_amounts(user_id):
+    archived = np.fromiter((amount for _, amount in archived_amounts(user_id)), dtype=np.int64)
+    cursor = get_connection().execute("SELECT amount_cents FROM transactions WHERE user_id = ?", (user_id,))
+    return np.concatenate((archived, np.fromiter((row[0] for row in cursor), dtype=np.int64)))
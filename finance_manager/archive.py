@@ -0,0 +1,187 @@
+import json
+import sqlite3
+import time
+import zlib
+from datetime import date
+from itertools import groupby
+from operator import itemgetter
+
+from .categories import TYPE_IDS, TYPE_NAMES, category_name, find_category_id
+from .database import attach_archive, bump_data_version, get_connection, has_archive
+from .errors import StorageError, ValidationError
+from .models import Transaction
+from .transactions import _id_chunks, unit_of_work
+
+# Archive tier for closed years. archive_years() moves every transaction dated
+# before a year out of the transactions table into the archive database next
+# to the main one (see database.archive_path). There each user's year is kept
+# append-only as batches of zlib-compressed column lists, one batch per run
+# that found rows for it, together with per-day totals by type and category
+# (archived_daily). monthly_rollups and the balance checkpoints keep the
+# archived months, so reports built on them read every year as before;
+# queries that need days read database.ledger_source(), and the few that
+# need single amounts decompress the batches (archived_amounts()).
+#
+# The two files cannot commit atomically together (the main one is in WAL
+# mode), so a batch is committed to the archive first, with a pending_purges
+# row, and its rows are deleted from the hot table afterwards. A run that is
+# interrupted in between is finished by the next one. Archive while nothing
+# else writes to the database.
+
+COLUMNS = ('id', 'date', 'amount_cents', 'category_id', 'description', 'type_id', 'recurring_rule_id')
+
+ARCHIVE_ROWS = f'''SELECT user_id, substr(date, 1, 4), {", ".join(COLUMNS)}
+                   FROM transactions
+                   WHERE date < ?
+                   ORDER BY user_id, date, id'''
+
+ARCHIVE_DAYS = '''INSERT INTO archive.archived_daily (user_id, date, type_id, category_id, total_cents, count)
+                  SELECT user_id, date, type_id, category_id, SUM(amount_cents), COUNT(*)
+                  FROM transactions
+                  WHERE date < ?
+                  GROUP BY user_id, date, type_id, category_id
+                  ON CONFLICT (user_id, date, type_id, category_id)
+                  DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + excluded.count'''
+
+def _encode(rows):
+    columns = dict(zip(COLUMNS, map(list, zip(*rows))))
+    return zlib.compress(json.dumps(columns, separators=(',', ':')).encode(), 9)
+
+def _decode(data):
+    return json.loads(zlib.decompress(data))
+
+# This thread's connection with the archive attached, creating the archive
+# database on first use
+def _open_archive():
+    conn = get_connection()
+    if not conn.archive_attached:
+        try:
+            attach_archive(conn)
+        except sqlite3.Error as e:
+            raise StorageError(f"The archive database could not be opened: {e}") from e
+    with unit_of_work():
+        conn.execute('''CREATE TABLE IF NOT EXISTS archive.archived_batches
+                     (user_id INTEGER NOT NULL,
+                      year TEXT NOT NULL,
+                      batch INTEGER NOT NULL,
+                      count INTEGER NOT NULL,
+                      first_date TEXT NOT NULL,
+                      last_date TEXT NOT NULL,
+                      data BLOB NOT NULL,
+                      PRIMARY KEY (user_id, year, batch))''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS archive.archived_daily
+                     (user_id INTEGER NOT NULL,
+                      date TEXT NOT NULL,
+                      type_id INTEGER NOT NULL,
+                      category_id INTEGER NOT NULL,
+                      total_cents INTEGER NOT NULL,
+                      count INTEGER NOT NULL,
+                      PRIMARY KEY (user_id, date, type_id, category_id)) WITHOUT ROWID''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS archive.pending_purges
+                     (user_id INTEGER NOT NULL,
+                      year TEXT NOT NULL,
+                      batch INTEGER NOT NULL,
+                      PRIMARY KEY (user_id, year, batch))''')
+    return conn
+
+# Delete the rows of archived batches that are still in the hot table. The
+# rollup keeps their months (see database.add_archiving_flag); the search
+# index drops them. Returns the number of rows deleted.
+def _purge_pending(conn):
+    pending = conn.execute('''SELECT b.data FROM archive.pending_purges p
+                           JOIN archive.archived_batches b USING (user_id, year, batch)''').fetchall()
+    if not pending:
+        return 0
+    ids = [row_id for (data,) in pending for row_id in _decode(data)['id']]
+    purged = 0
+    with unit_of_work():
+        conn.execute("INSERT INTO archiving (active) VALUES (1)")
+        # Deleting by id lists rather than one statement per row: the search
+        # index pays a fixed cost per statement
+        for chunk, placeholders in _id_chunks(ids):
+            purged += conn.execute(f"DELETE FROM transactions WHERE id IN ({placeholders})", chunk).rowcount
+        conn.execute("DELETE FROM archiving")
+    with unit_of_work():
+        conn.execute("DELETE FROM archive.pending_purges")
+    return purged
+
+# Move every transaction dated before January 1st of before_year (default:
+# the current year) to the archive. Returns (transactions archived, seconds).
+def archive_years(before_year=None):
+    this_year = date.today().year
+    if before_year is None:
+        before_year = this_year
+    if not isinstance(before_year, int) or isinstance(before_year, bool) or before_year > this_year:
+        raise ValidationError(f"Only years before {this_year} can be archived.")
+    cutoff = f"{before_year:04}-01-01"
+    start = time.perf_counter()
+    conn = _open_archive()
+    _purge_pending(conn)
+
+    archived = 0
+    with unit_of_work():
+        for (user_id, year), rows in groupby(conn.execute(ARCHIVE_ROWS, (cutoff,)), key=itemgetter(0, 1)):
+            rows = [row[2:] for row in rows]
+            batch = conn.execute("SELECT IFNULL(MAX(batch), 0) + 1 FROM archive.archived_batches WHERE user_id = ? AND year = ?",
+                                 (user_id, year)).fetchone()[0]
+            conn.execute('''INSERT INTO archive.archived_batches (user_id, year, batch, count, first_date, last_date, data)
+                         VALUES (?, ?, ?, ?, ?, ?, ?)''', (user_id, year, batch, len(rows), rows[0][1], rows[-1][1], _encode(rows)))
+            conn.execute("INSERT INTO archive.pending_purges (user_id, year, batch) VALUES (?, ?, ?)", (user_id, year, batch))
+            archived += len(rows)
+        if archived:
+            conn.execute(ARCHIVE_DAYS, (cutoff,))
+    _purge_pending(conn)
+    bump_data_version()
+    return archived, time.perf_counter() - start
+
+# Decoded batches of a user as (year, columns), for the years in
+# [first_year, last_year] ('YYYY'; either bound may be None), in year order
+def _columns(user_id, first_year=None, last_year=None):
+    conn = get_connection()
+    if not has_archive(conn):
+        return
+    query = "SELECT year, data FROM archive.archived_batches WHERE user_id = ?"
+    params = [user_id]
+    if first_year is not None:
+        query += " AND year >= ?"
+        params.append(f"{int(first_year):04}")
+    if last_year is not None:
+        query += " AND year <= ?"
+        params.append(f"{int(last_year):04}")
+    for year, data in conn.execute(query + " ORDER BY year, batch", params).fetchall():
+        yield year, _decode(data)
+
+# (category_id, amount_cents) of every archived transaction of a user,
+# optionally of one type id only
+def archived_amounts(user_id, type_id=None):
+    for _, columns in _columns(user_id):
+        for category, amount, row_type in zip(columns['category_id'], columns['amount_cents'], columns['type_id']):
+            if type_id is None or row_type == type_id:
+                yield category, amount
+
+# A user's archived transactions, one year or all, by year and then in date
+# order within each batch
+def archived_transactions(user_id, year=None):
+    for _, columns in _columns(user_id, year, year):
+        for row_id, day, amount, category, description, type_id in zip(*(columns[name] for name in COLUMNS[:-1])):
+            yield Transaction(day, amount, category_name(category), description, TYPE_NAMES.get(type_id), row_id, user_id)
+
+# A user's archived transactions in (date, id) order, filtered like
+# transactions.query_transactions: an inclusive date range, a list of
+# categories and one transaction type. Only the batches of years that
+# overlap the range are decompressed, and one year is sorted at a time.
+def query_archived(user_id, start_date=None, end_date=None, categories=None, transaction_type=None):
+    category_ids = None if not categories else {category for category in map(find_category_id, categories) if category is not None}
+    type_id = TYPE_IDS.get(transaction_type) if transaction_type else None
+    for _, batches in groupby(_columns(user_id, start_date and start_date[:4], end_date and end_date[:4]), key=itemgetter(0)):
+        rows = []
+        for _, columns in batches:
+            for row_id, day, amount, category, description, row_type in zip(*(columns[name] for name in COLUMNS[:-1])):
+                if ((start_date and day < start_date) or (end_date and day > end_date)
+                        or (category_ids is not None and category not in category_ids)
+                        or (type_id is not None and row_type != type_id)):
+                    continue
+                rows.append((day, row_id, amount, category, description, row_type))
+        rows.sort()
+        for day, row_id, amount, category, description, row_type in rows:
+            yield Transaction(day, amount, category_name(category), description, TYPE_NAMES.get(row_type), row_id, user_id)
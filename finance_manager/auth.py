@@ -1,23 +1,139 @@
-import bcrypt
-from .database import c, conn
+import os
 import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
+from .database import get_connection, transaction
+from .errors import TooManyAttempts, UsernameTaken, ValidationError
+
+# bcrypt is imported on first use so it stays off the startup path.
+#
+# Hashing is deliberately slow, so the GUI never runs it on the Tk thread: it
+# calls login_async()/register_async(), which run on a small dedicated pool.
+# The pool is bounded, and attempts beyond MAX_PENDING are refused instead of
+# queueing up. login_user() and register_user() are the synchronous versions.
+
+BCRYPT_ROUNDS = int(os.environ.get('FINANCE_MANAGER_BCRYPT_ROUNDS', 12))
+AUTH_WORKERS = 2
+MAX_PENDING = 8
+
+# Per-username throttling: the first FREE_ATTEMPTS failures are free, after
+# that each failure locks the username for twice as long as the previous one
+FREE_ATTEMPTS = 3
+BASE_LOCKOUT = 1.0   # seconds
+MAX_LOCKOUT = 300.0
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = threading.BoundedSemaphore(MAX_PENDING)
+
+_failures = {}  # username -> (failure count, locked until)
+_failures_lock = threading.Lock()
+
+_dummy_hash = None
+
+def _hash(password, rounds=None):
+    import bcrypt
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds or BCRYPT_ROUNDS))
+
+def _rounds(hashed):
+    return int(hashed.split(b'$')[2])
+
+# Password as bcrypt input. bcrypt only uses the first 72 bytes and
+# newer releases refuse longer input outright.
+def _password_bytes(password):
+    password = password.encode('utf-8')
+    if len(password) > 72:
+        raise ValidationError("Password must be at most 72 bytes long.")
+    return password
+
+def _throttle_key(username):
+    return username.strip().casefold()
+
+def _check_throttle(username):
+    with _failures_lock:
+        count, locked_until = _failures.get(_throttle_key(username), (0, 0.0))
+    wait = locked_until - time.monotonic()
+    if wait > 0:
+        raise TooManyAttempts(f"Too many failed attempts. Try again in {wait:.0f} seconds.", wait)
+
+def _record_failure(username):
+    key = _throttle_key(username)
+    with _failures_lock:
+        count = _failures.get(key, (0, 0.0))[0] + 1
+        lockout = 0.0 if count <= FREE_ATTEMPTS else min(BASE_LOCKOUT * 2 ** (count - FREE_ATTEMPTS - 1), MAX_LOCKOUT)
+        _failures[key] = (count, time.monotonic() + lockout)
+
+def _reset_failures(username):
+    with _failures_lock:
+        _failures.pop(_throttle_key(username), None)
 
 def register_user(username, password):
-    hashed = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    if not username.strip() or not password:
+        raise ValidationError("Username and password are required.")
+    hashed = _hash(_password_bytes(password))
     try:
-        c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed))
-        conn.commit()
-        print("User registered successfully.")
+        with transaction() as conn:
+            return conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed)).lastrowid
     except sqlite3.IntegrityError:
-        print("Username already exists. Please choose a different username.")
+        raise UsernameTaken("Username already exists. Please choose a different username.") from None
 
+# Returns the user id, or None for a wrong username or password. A stored
+# hash with a different work factor than BCRYPT_ROUNDS is replaced after a
+# successful check, so changing the setting upgrades users as they log in.
 def login_user(username, password):
-    c.execute("SELECT id, password FROM users WHERE username = ?", (username,))
-    result = c.fetchone()
-    if result and bcrypt.checkpw(password.encode('utf-8'), result[1]):
-        print("Login successful.")
-        return result[0]
-    else:
-        print("Invalid username or password.")
+    import bcrypt
+    global _dummy_hash
+
+    _check_throttle(username)
+    try:
+        password = _password_bytes(password)
+    except ValidationError:
+        _record_failure(username)
+        return None
+    result = get_connection().execute("SELECT id, password FROM users WHERE username = ?", (username,)).fetchone()
+    if result is None:
+        # Check against a throwaway hash so unknown usernames take as long
+        # as wrong passwords
+        if _dummy_hash is None:
+            _dummy_hash = _hash(b"dummy password")
+        bcrypt.checkpw(password, _dummy_hash)
+        _record_failure(username)
+        return None
+
+    user_id, hashed = result
+    if not bcrypt.checkpw(password, hashed):
+        _record_failure(username)
         return None
+    _reset_failures(username)
+    if _rounds(hashed) != BCRYPT_ROUNDS:
+        with transaction() as conn:
+            conn.execute("UPDATE users SET password = ? WHERE id = ?", (_hash(password), user_id))
+    return user_id
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="finance-auth")
+        return _executor
+
+def _submit(func, *args):
+    if not _pending.acquire(blocking=False):
+        raise TooManyAttempts("Too many sign-in attempts in progress. Please wait.")
+    try:
+        future = _get_executor().submit(func, *args)
+    except BaseException:
+        _pending.release()
+        raise
+    future.add_done_callback(lambda _: _pending.release())
+    return future
+
+# Futures for the pool; the throttle is checked before any work is queued
+def login_async(username, password):
+    _check_throttle(username)
+    return _submit(login_user, username, password)
+
+def register_async(username, password):
+    return _submit(register_user, username, password)
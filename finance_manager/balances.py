@@ -0,0 +1,71 @@
+from .categories import TYPE_IDS
+from .database import get_connection, ledger_source, transaction
+from .errors import ValidationError
+from .models import parse_date
+
+# Running balances (income minus expenses so far) from the month-end
+# checkpoints in balance_checkpoints (see database.add_balance_checkpoints).
+# Writes only mark a user's checkpoints stale from the month they touched;
+# the functions below bring the stale months up to date from monthly_rollups
+# before reading, which costs one rollup range scan over those months.
+
+INCOME, EXPENSE = TYPE_IDS['income'], TYPE_IDS['expense']
+
+# Month-end balances from `since` on, continuing from the last checkpoint
+# before it
+REFRESH_CHECKPOINTS = f'''INSERT INTO balance_checkpoints (user_id, year_month, balance_cents)
+                          SELECT user_id, year_month,
+                                 :opening + SUM(SUM(CASE type_id WHEN {INCOME} THEN total_cents WHEN {EXPENSE} THEN -total_cents ELSE 0 END))
+                                     OVER (ORDER BY year_month)
+                          FROM monthly_rollups
+                          WHERE user_id = :user_id AND year_month >= :since
+                          GROUP BY year_month'''
+
+def _checkpoint_before(conn, user_id, year_month):
+    row = conn.execute("SELECT balance_cents FROM balance_checkpoints WHERE user_id = ? AND year_month < ? ORDER BY year_month DESC LIMIT 1",
+                       (user_id, year_month)).fetchone()
+    return row[0] if row else 0
+
+# Recompute the stale checkpoints of one user, or of every user. Returns the
+# number of users whose checkpoints were stale.
+def refresh_checkpoints(user_id=None):
+    conn = get_connection()
+    query = "SELECT user_id, year_month FROM stale_balance_checkpoints"
+    if user_id is not None:
+        if conn.execute(f"{query} WHERE user_id = ?", (user_id,)).fetchone() is None:
+            return 0
+        query += " WHERE user_id = ?"
+    with transaction():
+        stale = conn.execute(query, () if user_id is None else (user_id,)).fetchall()
+        for stale_user, since in stale:
+            opening = _checkpoint_before(conn, stale_user, since)
+            conn.execute("DELETE FROM balance_checkpoints WHERE user_id = ? AND year_month >= ?", (stale_user, since))
+            conn.execute(REFRESH_CHECKPOINTS, {'user_id': stale_user, 'since': since, 'opening': opening})
+            conn.execute("DELETE FROM stale_balance_checkpoints WHERE user_id = ?", (stale_user,))
+    return len(stale)
+
+# Balance at the end of a day ('YYYY-MM-DD'): the checkpoint of the month
+# before plus that month's transactions up to the day, summed over the
+# (user_id, type_id, date, amount_cents) index (and the archived day totals,
+# for a day in an archived year)
+def balance_at(user_id, date):
+    day = parse_date(date) if isinstance(date, str) else None
+    if day is None:
+        raise ValidationError(f"Invalid date: {date!r}")
+    refresh_checkpoints(user_id)
+    conn = get_connection()
+    opening = _checkpoint_before(conn, user_id, day[:7])
+    month_sum = f"SELECT IFNULL(SUM(amount_cents), 0) FROM {ledger_source(conn)} WHERE user_id = :user_id AND type_id = {{}} AND date BETWEEN :start AND :end"
+    partial = conn.execute(f"SELECT ({month_sum.format(INCOME)}) - ({month_sum.format(EXPENSE)})",
+                           {'user_id': user_id, 'start': day[:7] + "-01", 'end': day}).fetchone()[0]
+    return opening + partial
+
+# Balance after every transaction recorded so far
+def current_balance(user_id):
+    refresh_checkpoints(user_id)
+    return _checkpoint_before(get_connection(), user_id, "9999-99")
+
+# [(year_month, balance_cents)] for every month with activity, in order
+def month_end_balances(user_id):
+    refresh_checkpoints(user_id)
+    return get_connection().execute("SELECT year_month, balance_cents FROM balance_checkpoints WHERE user_id = ? ORDER BY year_month", (user_id,)).fetchall()
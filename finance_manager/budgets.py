@@ -0,0 +1,92 @@
+from datetime import date
+
+from .categories import TYPE_IDS, category_id, find_category_id
+from .database import get_connection
+from .errors import ValidationError
+from .transactions import unit_of_work
+
+# Monthly spending limits per expense category. Spending is never re-summed
+# here: the month's total for a category is its monthly_rollups row, and
+# threshold crossings are recorded by triggers as transactions are written
+# (see database.add_budgets). Reading the state of every budget is one
+# primary key lookup per budget. Budgets are keyed by category id, so they
+# follow the same case- and whitespace-insensitive category names as
+# transactions.
+
+EXPENSE = TYPE_IDS['expense']
+
+WARN_PERCENT = 80
+LEVELS = ('warning', 'exceeded')
+
+def current_month():
+    return date.today().strftime('%Y-%m')
+
+def _level(spent_cents, limit_cents, warn_percent):
+    if spent_cents > limit_cents:
+        return 'exceeded'
+    if spent_cents * 100 >= limit_cents * warn_percent:
+        return 'warning'
+    return None
+
+# Create or change the budget for a category. Alerts already raised for the
+# current month are re-evaluated against the new limit.
+def set_budget(user_id, category, limit_cents, warn_percent=WARN_PERCENT):
+    if not category or not category.strip():
+        raise ValidationError("A budget needs a category.")
+    if not isinstance(limit_cents, int) or isinstance(limit_cents, bool) or limit_cents <= 0:
+        raise ValidationError(f"Invalid budget amount in cents: {limit_cents!r}")
+    if not isinstance(warn_percent, int) or not 1 <= warn_percent <= 100:
+        raise ValidationError(f"Warning threshold must be a percentage from 1 to 100: {warn_percent!r}")
+    month = current_month()
+    with unit_of_work() as conn:
+        category = category_id(category)
+        conn.execute('''INSERT INTO budgets (user_id, category_id, limit_cents, warn_percent) VALUES (?, ?, ?, ?)
+                     ON CONFLICT (user_id, category_id) DO UPDATE SET limit_cents = excluded.limit_cents, warn_percent = excluded.warn_percent''',
+                     (user_id, category, limit_cents, warn_percent))
+        conn.execute("DELETE FROM budget_alerts WHERE user_id = ? AND category_id = ? AND year_month = ?", (user_id, category, month))
+        row = conn.execute("SELECT total_cents FROM monthly_rollups WHERE user_id = ? AND year_month = ? AND type_id = ? AND category_id = ?",
+                           (user_id, month, EXPENSE, category)).fetchone()
+        spent = row[0] if row else 0
+        level = _level(spent, limit_cents, warn_percent)
+        levels = LEVELS if level == 'exceeded' else (level,) if level else ()
+        conn.executemany("INSERT INTO budget_alerts (user_id, category_id, year_month, level, total_cents, limit_cents) VALUES (?, ?, ?, ?, ?, ?)",
+                         [(user_id, category, month, level, spent, limit_cents) for level in levels])
+
+def delete_budget(user_id, category):
+    category = find_category_id(category)
+    if category is None:
+        return False
+    with unit_of_work() as conn:
+        deleted = conn.execute("DELETE FROM budgets WHERE user_id = ? AND category_id = ?", (user_id, category)).rowcount
+        conn.execute("DELETE FROM budget_alerts WHERE user_id = ? AND category_id = ?", (user_id, category))
+    return deleted > 0
+
+# [(category, limit_cents, warn_percent)] by category
+def get_budgets(user_id):
+    return get_connection().execute('''SELECT c.name, b.limit_cents, b.warn_percent FROM budgets b JOIN categories c ON c.id = b.category_id
+                                    WHERE b.user_id = ? ORDER BY c.name''', (user_id,)).fetchall()
+
+# Budget versus actual for a month ('YYYY-MM', default the current one):
+# [(category, spent_cents, limit_cents, level)] with level None, 'warning' or
+# 'exceeded', fullest budgets first
+def budget_status(user_id, year_month=None):
+    rows = get_connection().execute('''SELECT c.name, IFNULL(r.total_cents, 0), b.limit_cents, b.warn_percent
+                                    FROM budgets b
+                                    JOIN categories c ON c.id = b.category_id
+                                    LEFT JOIN monthly_rollups r
+                                      ON r.user_id = b.user_id AND r.year_month = ? AND r.type_id = ? AND r.category_id = b.category_id
+                                    WHERE b.user_id = ?''', (year_month or current_month(), EXPENSE, user_id))
+    status = [(category, spent, limit, _level(spent, limit, warn_percent)) for category, spent, limit, warn_percent in rows]
+    status.sort(key=lambda row: (-row[1] / row[2], row[0]))
+    return status
+
+# Alerts raised since the last call, oldest month first, marked as seen:
+# [(category, year_month, level, total_cents, limit_cents)]
+def take_budget_alerts(user_id):
+    with unit_of_work() as conn:
+        alerts = conn.execute('''SELECT c.name, a.year_month, a.level, a.total_cents, a.limit_cents
+                              FROM budget_alerts a JOIN categories c ON c.id = a.category_id
+                              WHERE a.user_id = ? AND a.seen = 0 ORDER BY a.year_month, c.name, a.level''', (user_id,)).fetchall()
+        if alerts:
+            conn.execute("UPDATE budget_alerts SET seen = 1 WHERE user_id = ? AND seen = 0", (user_id,))
+    return alerts
@@ -0,0 +1,91 @@
+import weakref
+
+from .database import add_transaction_hook, get_connection, transaction
+from .models import category_key, normalize_category
+
+# Categories and transaction types are stored as integer ids (see
+# database.normalize_categories). Writers turn names into ids through a cache
+# kept per connection, so a write does not cost a lookup query per row: the
+# first use loads the whole (small) categories table, and a name not seen
+# before is looked up, or added, once. Ids of categories added inside a
+# transaction are only kept once it commits, since a rollback takes the rows
+# (and so the ids) back.
+
+TYPE_IDS = {'income': 1, 'expense': 2}
+TYPE_NAMES = {type_id: name for name, type_id in TYPE_IDS.items()}
+
+class _Cache:
+    __slots__ = ('ids', 'names', 'pending')
+
+    def __init__(self, conn):
+        self.ids = {}  # spelling or key -> id
+        self.names = {}  # id -> name
+        self.pending = {}  # spelling or key -> id, added by the open transaction
+        for category_id, name, key in conn.execute("SELECT id, name, key FROM categories"):
+            self.ids[key] = self.ids[name] = category_id
+            self.names[category_id] = name
+
+_caches = weakref.WeakKeyDictionary()
+
+def _cache(conn):
+    cache = _caches.get(conn)
+    if cache is None:
+        cache = _caches[conn] = _Cache(conn)
+    return cache
+
+def _transaction_ended(conn, committed):
+    cache = _caches.get(conn)
+    if cache is None or not cache.pending:
+        return
+    if committed:
+        cache.ids.update(cache.pending)
+    else:
+        for category_id in set(cache.pending.values()):
+            cache.names.pop(category_id, None)
+    cache.pending.clear()
+
+add_transaction_hook(_transaction_ended)
+
+# Id of a category name, adding the category if it is new. Inside a
+# transaction the new row is part of it; outside one it is committed at once.
+def category_id(name):
+    conn = get_connection()
+    cache = _cache(conn)
+    found = cache.ids.get(name)
+    if found is None:
+        found = cache.pending.get(name)
+    if found is not None:
+        return found
+    key = category_key(name)
+    found = cache.ids.get(key) or cache.pending.get(key)
+    if found is None:
+        with transaction():
+            row = conn.execute("SELECT id FROM categories WHERE key = ?", (key,)).fetchone()
+            if row:
+                found = row[0]
+            else:
+                normalized = normalize_category(name)
+                found = conn.execute("INSERT INTO categories (name, key) VALUES (?, ?)", (normalized, key)).lastrowid
+                cache.names[found] = normalized
+            cache.pending[key] = found
+    if isinstance(name, str):
+        (cache.pending if conn.in_transaction else cache.ids)[name] = found
+    return found
+
+# Id of an existing category, or None; never adds one
+def find_category_id(name):
+    conn = get_connection()
+    cache = _cache(conn)
+    found = cache.ids.get(name) or cache.pending.get(name)
+    if found is None:
+        row = conn.execute("SELECT id FROM categories WHERE key = ?", (category_key(name),)).fetchone()
+        found = row[0] if row else None
+    return found
+
+def category_name(category_id):
+    cache = _cache(get_connection())
+    name = cache.names.get(category_id)
+    if name is None:
+        row = get_connection().execute("SELECT name FROM categories WHERE id = ?", (category_id,)).fetchone()
+        name = cache.names[category_id] = row[0] if row else ''
+    return name
@@ -0,0 +1,112 @@
+import argparse
+
+from .database import create_tables
+from .models import parse_date
+
+# Whether text is a month in the YYYY-MM form
+def _is_year_month(text):
+    day = parse_date(f"{text}-01")
+    return day is not None and day[:7] == text
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="finance-manager", description="Finance Manager command line tools")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = subparsers.add_parser("import", help="import transactions from a CSV file")
+    import_parser.add_argument("user_id", type=int)
+    import_parser.add_argument("path", help="CSV file with date,amount,category,description[,type] rows")
+    import_parser.add_argument("--batch-size", type=int, default=10000, help="rows per database transaction")
+    import_parser.add_argument("--type", dest="default_type", choices=["income", "expense"], default="expense",
+                               help="type for rows without a type column")
+
+    export_parser = subparsers.add_parser("export", help="export transactions or a monthly summary")
+    export_parser.add_argument("user_id", type=int)
+    export_parser.add_argument("path", help="output file; the format defaults to the extension (.csv, .jsonl, .parquet, .arrow)")
+    export_parser.add_argument("--format", dest="fmt", choices=["csv", "jsonl", "parquet", "arrow"])
+    export_parser.add_argument("--from", dest="start", help="first date (YYYY-MM-DD), or first month (YYYY-MM) with --summary")
+    export_parser.add_argument("--to", dest="end", help="last date (YYYY-MM-DD), or month after the last (YYYY-MM) with --summary")
+    export_parser.add_argument("--category", dest="categories", action="append", help="only this category; may be repeated")
+    export_parser.add_argument("--type", dest="transaction_type", choices=["income", "expense"])
+    export_parser.add_argument("--chunk-size", type=int, default=10000, help="rows fetched per chunk")
+    export_parser.add_argument("--summary", action="store_true", help="export income, expenses and net per month instead")
+
+    recurring_parser = subparsers.add_parser("recurring", help="write due recurring transactions, or forecast them")
+    recurring_parser.add_argument("--until", help="write occurrences dated up to this day (YYYY-MM-DD, default today)")
+    recurring_parser.add_argument("--user", dest="user_id", type=int, help="only this user's rules")
+    recurring_parser.add_argument("--forecast", type=int, metavar="MONTHS", help="print the user's projected cash flow instead of writing")
+
+    statements_parser = subparsers.add_parser("statements", help="write a statement for every user")
+    statements_parser.add_argument("month", help="first month (YYYY-MM)")
+    statements_parser.add_argument("--to", dest="end", help="month after the last (YYYY-MM); default: only the first month")
+    statements_parser.add_argument("--out-dir", help="directory for one text statement per user")
+    statements_parser.add_argument("--jsonl", help="write the statements as JSON Lines to this file")
+    statements_parser.add_argument("--workers", type=int, default=1, help="worker processes; 0 for one per CPU")
+
+    archive_parser = subparsers.add_parser("archive", help="move closed years to the compressed archive database")
+    archive_parser.add_argument("--before", type=int, metavar="YEAR", help="archive transactions dated before this year (default: the current year)")
+    archive_parser.add_argument("--vacuum", action="store_true", help="compact the main database file afterwards")
+
+    args = parser.parse_args(argv)
+    if args.command == "statements" and not (args.out_dir or args.jsonl):
+        parser.error("statements needs --out-dir and/or --jsonl")
+    if args.command == "statements":
+        for month in (args.month, args.end):
+            if month is not None and not _is_year_month(month):
+                parser.error(f"invalid month {month!r}, expected YYYY-MM")
+    if args.command == "recurring" and args.forecast and args.user_id is None:
+        parser.error("--forecast needs --user")
+    create_tables()
+
+    if args.command == "import":
+        from .transactions import import_csv
+        try:
+            import_csv(args.user_id, args.path, batch_size=args.batch_size, default_type=args.default_type)
+        except OSError as e:
+            print(f"An error occurred while importing: {e}")
+    elif args.command == "export":
+        try:
+            if args.summary:
+                from .reports import export_monthly_summary
+                exported = export_monthly_summary(args.user_id, args.path, args.fmt, args.start, args.end)
+                print(f"Exported {exported} months to {args.path}.")
+            else:
+                from .transactions import export_transactions
+                export_transactions(args.user_id, args.path, args.fmt, args.start, args.end, args.categories, args.transaction_type, args.chunk_size)
+        except (RuntimeError, OSError) as e:
+            print(f"An error occurred while exporting: {e}")
+    elif args.command == "statements":
+        import os
+        from .statements import write_statements
+        workers = args.workers or os.cpu_count() or 1
+        try:
+            written, elapsed = write_statements(args.month, args.end, args.out_dir, args.jsonl, workers)
+        except OSError as e:
+            print(f"An error occurred while writing statements: {e}")
+        else:
+            print(f"Wrote {written} statements in {elapsed:.2f}s ({written / elapsed if elapsed else 0:,.0f} statements/s, {workers} worker{'s' if workers != 1 else ''}).")
+    elif args.command == "archive":
+        from .archive import archive_years
+        from .database import archive_path, get_connection
+        from .errors import FinanceError
+        try:
+            archived, elapsed = archive_years(args.before)
+        except FinanceError as e:
+            print(f"An error occurred while archiving: {e}")
+        else:
+            print(f"Archived {archived} transactions to {archive_path()} in {elapsed:.2f}s.")
+            if args.vacuum:
+                get_connection().execute("VACUUM")
+    elif args.command == "recurring":
+        if args.forecast:
+            from .reports import generate_forecast_report
+            print(generate_forecast_report(args.user_id, args.forecast))
+        else:
+            from .errors import FinanceError
+            from .recurring import materialize_due
+            try:
+                print(f"Wrote {materialize_due(args.until, args.user_id)} recurring transactions.")
+            except FinanceError as e:
+                print(f"An error occurred while writing recurring transactions: {e}")
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,725 @@
+import os
+import pathlib
 import sqlite3
+import threading
+from contextlib import contextmanager
+
+from .instrumentation import InstrumentedConnection
+from .models import category_key, normalize_category
 
 # Database setup
-conn = sqlite3.connect('data/finance_manager.db')
-c = conn.cursor()
+DB_PATH = os.environ.get('FINANCE_MANAGER_DB', 'data/finance_manager.db')
+
+# Every thread gets its own connection, opened on first use. WAL mode lets
+# readers in one thread run while another thread writes. Connections record
+# their queries while instrumentation sinks are registered.
+_local = threading.local()
+
+# A read-only connection (for batch readers, e.g. report worker processes)
+# cannot write and leaves the journal mode alone.
+def connect(path=None, readonly=False):
+    if readonly:
+        uri = pathlib.Path(path or DB_PATH).absolute().as_uri() + "?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=10, isolation_level=None, cached_statements=256, factory=InstrumentedConnection)
+    else:
+        conn = sqlite3.connect(path or DB_PATH, timeout=10, isolation_level=None, cached_statements=256, factory=InstrumentedConnection)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA cache_size = -65536")  # 64 MiB
+    conn.execute("PRAGMA mmap_size = 268435456")  # 256 MiB
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.path, conn.readonly, conn.archive_attached = path or DB_PATH, readonly, False
+    attach_existing_archive(conn)
+    return conn
+
+# Closed years can be moved out of the transactions table into an archive
+# database next to the main one (see archive.py). Connections attach it as
+# "archive" once it exists, also when it was created after they were opened
+# (by another thread or process), the next time they are handed out or asked
+# about it. It keeps the default rollback journal, so it is never left with a
+# WAL file of its own.
+def archive_path(path=None):
+    root, ext = os.path.splitext(path or DB_PATH)
+    return f"{root}-archive{ext}"
+
+def attach_archive(conn):
+    target = archive_path(conn.path)
+    if conn.readonly:
+        target = pathlib.Path(target).absolute().as_uri() + "?mode=ro"
+    conn.execute("ATTACH DATABASE ? AS archive", (target,))
+    conn.archive_attached = True
+
+# ATTACH is not allowed inside a transaction; such a connection attaches the
+# archive after it ends
+def attach_existing_archive(conn):
+    if not conn.archive_attached and not conn.in_transaction and os.path.exists(archive_path(conn.path)):
+        attach_archive(conn)
+
+# Whether the archive is attached and holds archived rows' tables (the file
+# exists, empty, from the moment archive.py creates it)
+def has_archive(conn):
+    attach_existing_archive(conn)
+    return conn.archive_attached and conn.execute("SELECT 1 FROM archive.sqlite_master WHERE name = 'archived_daily'").fetchone() is not None
+
+# Hot transactions plus the per-day totals of archived years as one row
+# source with columns (user_id, date, type_id, category_id, amount_cents,
+# count). Archived rows are already summed per day, type and category, so
+# readers sum amount_cents and count instead of counting rows. Filters on
+# user_id and date are pushed down into both halves and their indexes.
+HOT_LEDGER = "SELECT user_id, date, type_id, category_id, amount_cents, 1 AS count FROM transactions"
+ARCHIVED_LEDGER = "SELECT user_id, date, type_id, category_id, total_cents, count FROM archive.archived_daily"
+
+def ledger_source(conn):
+    if has_archive(conn):
+        return f"({HOT_LEDGER} UNION ALL {ARCHIVED_LEDGER})"
+    return f"({HOT_LEDGER})"
+
+def get_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        conn = _local.conn = connect()
+    else:
+        attach_existing_archive(conn)
+    return conn
+
+# Make this thread's connection a read-only one
+def use_readonly_connection(path=None):
+    close_connection()
+    _local.conn = connect(path, readonly=True)
+
+def close_connection():
+    conn = getattr(_local, 'conn', None)
+    if conn is not None:
+        conn.close()
+        _local.conn = None
+
+# Called as hook(conn, committed) when an outermost transaction ends, for
+# caches that hold values written inside it (see categories.py)
+_transaction_hooks = []
+
+def add_transaction_hook(hook):
+    _transaction_hooks.append(hook)
+
+# Connections run in autocommit mode, so every write goes through this
+# context manager. Nested uses join the outermost transaction.
+@contextmanager
+def transaction():
+    conn = get_connection()
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        for hook in _transaction_hooks:
+            hook(conn, False)
+        raise
+    for hook in _transaction_hooks:
+        hook(conn, True)
+
+# In-process change counter per user. Write paths bump it once their changes
+# are committed, and caches store the version they were computed at, so a
+# cached result is discarded as soon as the user's data changes. Bumping
+# without a user (e.g. after a rollup rebuild) invalidates every user.
+_data_versions = {}
+_global_version = 0
+_data_versions_lock = threading.Lock()
+
+def get_data_version(user_id):
+    return (_global_version, _data_versions.get(user_id, 0))
+
+def bump_data_version(user_id=None):
+    global _global_version
+    with _data_versions_lock:
+        if user_id is None:
+            _global_version += 1
+        else:
+            _data_versions[user_id] = _data_versions.get(user_id, 0) + 1
 
 def create_tables():
-    c.execute('''CREATE TABLE IF NOT EXISTS users
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                  username TEXT UNIQUE,
-                  password TEXT)''')
-    c.execute('''CREATE TABLE IF NOT EXISTS transactions
+    with transaction() as conn:
+        conn.execute('''CREATE TABLE IF NOT EXISTS users
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      username TEXT UNIQUE,
+                      password TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS transactions
+                     (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                      user_id INTEGER,
+                      date TEXT,
+                      amount REAL,
+                      category TEXT,
+                      description TEXT,
+                      transaction_type TEXT,
+                      FOREIGN KEY(user_id) REFERENCES users(id))''')
+    migrate()
+
+# Schema migrations, applied in order. PRAGMA user_version records how many
+# of them have already run against the database file.
+def add_transaction_indexes(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_date ON transactions (user_id, date)")
+    # Covering index for the per-type sums used by reports and charts
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_type_date ON transactions (user_id, transaction_type, date, amount)")
+
+# Per-month, per-category totals kept in step with transactions by triggers,
+# so every write updates its rollup row in the same transaction.
+
+def add_monthly_rollups(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS monthly_rollups
+                 (user_id INTEGER NOT NULL,
+                  year_month TEXT NOT NULL,
+                  transaction_type TEXT NOT NULL,
+                  category TEXT NOT NULL,
+                  total REAL NOT NULL DEFAULT 0,
+                  count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (user_id, year_month, transaction_type, category)) WITHOUT ROWID''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_rollups_insert AFTER INSERT ON transactions
+                 BEGIN
+                     INSERT INTO monthly_rollups (user_id, year_month, transaction_type, category, total, count)
+                     VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.transaction_type, IFNULL(NEW.category, ''), NEW.amount, 1)
+                     ON CONFLICT (user_id, year_month, transaction_type, category)
+                     DO UPDATE SET total = total + excluded.total, count = count + 1;
+                 END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_rollups_delete AFTER DELETE ON transactions
+                 BEGIN
+                     UPDATE monthly_rollups SET total = total - OLD.amount, count = count - 1
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND transaction_type = OLD.transaction_type AND category = IFNULL(OLD.category, '');
+                     DELETE FROM monthly_rollups
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND transaction_type = OLD.transaction_type AND category = IFNULL(OLD.category, '')
+                       AND count <= 0;
+                 END''')
+    conn.execute('''CREATE TRIGGER IF NOT EXISTS trg_rollups_update
+                 AFTER UPDATE OF user_id, date, amount, category, transaction_type ON transactions
+                 BEGIN
+                     UPDATE monthly_rollups SET total = total - OLD.amount, count = count - 1
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND transaction_type = OLD.transaction_type AND category = IFNULL(OLD.category, '');
+                     DELETE FROM monthly_rollups
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND transaction_type = OLD.transaction_type AND category = IFNULL(OLD.category, '')
+                       AND count <= 0;
+                     INSERT INTO monthly_rollups (user_id, year_month, transaction_type, category, total, count)
+                     VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.transaction_type, IFNULL(NEW.category, ''), NEW.amount, 1)
+                     ON CONFLICT (user_id, year_month, transaction_type, category)
+                     DO UPDATE SET total = total + excluded.total, count = count + 1;
+                 END''')
+    conn.execute('''INSERT INTO monthly_rollups (user_id, year_month, transaction_type, category, total, count)
+                 SELECT user_id, substr(date, 1, 7), transaction_type, IFNULL(category, ''), SUM(amount), COUNT(*)
+                 FROM transactions
+                 GROUP BY user_id, substr(date, 1, 7), transaction_type, IFNULL(category, '')''')
+
+# (user_id, rowid) index for keyset pagination of a user's transactions by id
+def add_user_id_index(conn):
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user ON transactions (user_id)")
+
+# Store money as INTEGER cents. SQLite cannot change a column's type in
+# place, so the table is rebuilt; that drops its indexes and the rollup
+# triggers, which are recreated against amount_cents.
+def convert_amounts_to_cents(conn):
+    conn.execute('''CREATE TABLE transactions_new
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   user_id INTEGER,
                   date TEXT,
-                  amount REAL,
+                  amount_cents INTEGER NOT NULL,
                   category TEXT,
                   description TEXT,
                   transaction_type TEXT,
                   FOREIGN KEY(user_id) REFERENCES users(id))''')
-    conn.commit()
+    # amount * 100 carries the binary error of the REAL (1.005 is stored as
+    # 1.00499999...), so it is first rounded to 6 places to recover the
+    # decimal value, then rounded half up like models.to_cents
+    conn.execute('''INSERT INTO transactions_new (id, user_id, date, amount_cents, category, description, transaction_type)
+                 SELECT id, user_id, date, CAST(ROUND(ROUND(amount * 100, 6)) AS INTEGER), category, description, transaction_type
+                 FROM transactions''')
+    conn.execute("DROP TABLE transactions")
+    conn.execute("ALTER TABLE transactions_new RENAME TO transactions")
+    conn.execute("CREATE INDEX idx_transactions_user_date ON transactions (user_id, date)")
+    conn.execute("CREATE INDEX idx_transactions_user_type_date ON transactions (user_id, transaction_type, date, amount_cents)")
+    conn.execute("CREATE INDEX idx_transactions_user ON transactions (user_id)")
+
+    conn.execute("DROP TABLE monthly_rollups")
+    conn.execute('''CREATE TABLE monthly_rollups
+                 (user_id INTEGER NOT NULL,
+                  year_month TEXT NOT NULL,
+                  transaction_type TEXT NOT NULL,
+                  category TEXT NOT NULL,
+                  total_cents INTEGER NOT NULL DEFAULT 0,
+                  count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (user_id, year_month, transaction_type, category)) WITHOUT ROWID''')
+    conn.execute('''CREATE TRIGGER trg_rollups_insert AFTER INSERT ON transactions
+                 BEGIN
+                     INSERT INTO monthly_rollups (user_id, year_month, transaction_type, category, total_cents, count)
+                     VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.transaction_type, IFNULL(NEW.category, ''), NEW.amount_cents, 1)
+                     ON CONFLICT (user_id, year_month, transaction_type, category)
+                     DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_rollups_delete AFTER DELETE ON transactions
+                 BEGIN
+                     UPDATE monthly_rollups SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND transaction_type = OLD.transaction_type AND category = IFNULL(OLD.category, '');
+                     DELETE FROM monthly_rollups
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND transaction_type = OLD.transaction_type AND category = IFNULL(OLD.category, '')
+                       AND count <= 0;
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_rollups_update
+                 AFTER UPDATE OF user_id, date, amount_cents, category, transaction_type ON transactions
+                 BEGIN
+                     UPDATE monthly_rollups SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND transaction_type = OLD.transaction_type AND category = IFNULL(OLD.category, '');
+                     DELETE FROM monthly_rollups
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND transaction_type = OLD.transaction_type AND category = IFNULL(OLD.category, '')
+                       AND count <= 0;
+                     INSERT INTO monthly_rollups (user_id, year_month, transaction_type, category, total_cents, count)
+                     VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.transaction_type, IFNULL(NEW.category, ''), NEW.amount_cents, 1)
+                     ON CONFLICT (user_id, year_month, transaction_type, category)
+                     DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+                 END''')
+    conn.execute('''INSERT INTO monthly_rollups (user_id, year_month, transaction_type, category, total_cents, count)
+                 SELECT user_id, substr(date, 1, 7), transaction_type, IFNULL(category, ''), SUM(amount_cents), COUNT(*)
+                 FROM transactions
+                 GROUP BY user_id, substr(date, 1, 7), transaction_type, IFNULL(category, '')''')
+
+# Full-text index over description and category. It is an external-content
+# FTS5 table (rowid = transactions.id) that stores only the index, kept in sync
+# by triggers. Prefix indexes make as-you-type prefix queries cheap.
+def add_transactions_fts(conn):
+    conn.execute('''CREATE VIRTUAL TABLE transactions_fts USING fts5
+                 (description, category, content='transactions', content_rowid='id',
+                  tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    conn.execute('''CREATE TRIGGER trg_fts_insert AFTER INSERT ON transactions
+                 BEGIN
+                     INSERT INTO transactions_fts (rowid, description, category) VALUES (NEW.id, NEW.description, NEW.category);
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_fts_delete AFTER DELETE ON transactions
+                 BEGIN
+                     INSERT INTO transactions_fts (transactions_fts, rowid, description, category) VALUES ('delete', OLD.id, OLD.description, OLD.category);
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_fts_update AFTER UPDATE OF description, category ON transactions
+                 BEGIN
+                     INSERT INTO transactions_fts (transactions_fts, rowid, description, category) VALUES ('delete', OLD.id, OLD.description, OLD.category);
+                     INSERT INTO transactions_fts (rowid, description, category) VALUES (NEW.id, NEW.description, NEW.category);
+                 END''')
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+
+# Monthly per-category spending limits. Threshold crossings are detected by
+# triggers on monthly_rollups: every write already updates exactly one rollup
+# row per affected (user, month, type, category), and comparing its old and
+# new total against the budget is one primary key lookup, so the cost per
+# transaction does not depend on how many budgets or transactions exist.
+# A crossing is recorded once per (budget, month, level) in budget_alerts.
+def add_budgets(conn):
+    conn.execute('''CREATE TABLE budgets
+                 (user_id INTEGER NOT NULL REFERENCES users(id),
+                  category TEXT NOT NULL,
+                  limit_cents INTEGER NOT NULL CHECK (limit_cents > 0),
+                  warn_percent INTEGER NOT NULL DEFAULT 80 CHECK (warn_percent BETWEEN 1 AND 100),
+                  PRIMARY KEY (user_id, category)) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE budget_alerts
+                 (user_id INTEGER NOT NULL,
+                  category TEXT NOT NULL,
+                  year_month TEXT NOT NULL,
+                  level TEXT NOT NULL,
+                  total_cents INTEGER NOT NULL,
+                  limit_cents INTEGER NOT NULL,
+                  seen INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (user_id, category, year_month, level)) WITHOUT ROWID''')
+    conn.execute("CREATE INDEX idx_budget_alerts_unseen ON budget_alerts (user_id) WHERE seen = 0")
+    conn.execute('''CREATE TRIGGER trg_budget_alerts_insert AFTER INSERT ON monthly_rollups
+                 WHEN NEW.transaction_type = 'expense'
+                 BEGIN
+                     INSERT INTO budget_alerts (user_id, category, year_month, level, total_cents, limit_cents)
+                     SELECT user_id, category, NEW.year_month, 'warning', NEW.total_cents, limit_cents FROM budgets
+                     WHERE user_id = NEW.user_id AND category = NEW.category
+                       AND NEW.total_cents * 100 >= limit_cents * warn_percent
+                     ON CONFLICT DO NOTHING;
+                     INSERT INTO budget_alerts (user_id, category, year_month, level, total_cents, limit_cents)
+                     SELECT user_id, category, NEW.year_month, 'exceeded', NEW.total_cents, limit_cents FROM budgets
+                     WHERE user_id = NEW.user_id AND category = NEW.category
+                       AND NEW.total_cents > limit_cents
+                     ON CONFLICT DO NOTHING;
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_budget_alerts_update AFTER UPDATE OF total_cents ON monthly_rollups
+                 WHEN NEW.transaction_type = 'expense' AND NEW.total_cents > OLD.total_cents
+                 BEGIN
+                     INSERT INTO budget_alerts (user_id, category, year_month, level, total_cents, limit_cents)
+                     SELECT user_id, category, NEW.year_month, 'warning', NEW.total_cents, limit_cents FROM budgets
+                     WHERE user_id = NEW.user_id AND category = NEW.category
+                       AND OLD.total_cents * 100 < limit_cents * warn_percent
+                       AND NEW.total_cents * 100 >= limit_cents * warn_percent
+                     ON CONFLICT DO NOTHING;
+                     INSERT INTO budget_alerts (user_id, category, year_month, level, total_cents, limit_cents)
+                     SELECT user_id, category, NEW.year_month, 'exceeded', NEW.total_cents, limit_cents FROM budgets
+                     WHERE user_id = NEW.user_id AND category = NEW.category
+                       AND OLD.total_cents <= limit_cents AND NEW.total_cents > limit_cents
+                     ON CONFLICT DO NOTHING;
+                 END''')
+
+# Rules for transactions that repeat (rent, salary, subscriptions).
+# next_date is the first occurrence not yet written to transactions and
+# generated counts the occurrences written so far; dates are computed from
+# start_date and the occurrence number, so month ends do not drift.
+# Materialized rows carry their rule id, and the unique (rule, date) index
+# makes writing the same occurrence twice a no-op.
+def add_recurring_rules(conn):
+    conn.execute('''CREATE TABLE recurring_rules
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL REFERENCES users(id),
+                  amount_cents INTEGER NOT NULL CHECK (amount_cents > 0),
+                  category TEXT,
+                  description TEXT,
+                  transaction_type TEXT NOT NULL,
+                  interval TEXT NOT NULL CHECK (interval IN ('daily', 'weekly', 'monthly', 'yearly')),
+                  every INTEGER NOT NULL DEFAULT 1 CHECK (every > 0),
+                  start_date TEXT NOT NULL,
+                  end_date TEXT,
+                  next_date TEXT,
+                  generated INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute("CREATE INDEX idx_recurring_rules_next ON recurring_rules (next_date) WHERE next_date IS NOT NULL")
+    conn.execute("CREATE INDEX idx_recurring_rules_user ON recurring_rules (user_id)")
+    conn.execute("ALTER TABLE transactions ADD COLUMN recurring_rule_id INTEGER")
+    conn.execute("CREATE UNIQUE INDEX idx_transactions_recurring ON transactions (recurring_rule_id, date) WHERE recurring_rule_id IS NOT NULL")
+
+# Categories and transaction types move to lookup tables, and every table
+# that named them (transactions, monthly_rollups, budgets, budget_alerts,
+# recurring_rules) stores small integer ids instead. Rows and index entries
+# shrink, and grouping compares integers instead of strings. Spellings that
+# differ only in case or whitespace merge into one category, named after its
+# most used spelling. Each table is rebuilt; the rollups and their triggers
+# are recreated on the id columns, and the search index is rebuilt over the
+# transaction_details view, which joins the names back in for readers.
+def normalize_categories(conn):
+    conn.execute("CREATE TABLE transaction_types (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)")
+    conn.execute("INSERT INTO transaction_types (id, name) VALUES (1, 'income'), (2, 'expense')")
+    conn.execute("INSERT OR IGNORE INTO transaction_types (name) SELECT DISTINCT IFNULL(transaction_type, '') FROM transactions")
+    conn.execute("CREATE TABLE categories (id INTEGER PRIMARY KEY, name TEXT NOT NULL, key TEXT NOT NULL UNIQUE)")
+    spellings = conn.execute('''SELECT spelling, COUNT(*) FROM
+                             (SELECT IFNULL(category, '') AS spelling FROM transactions
+                              UNION ALL SELECT category FROM budgets
+                              UNION ALL SELECT IFNULL(category, '') FROM recurring_rules)
+                             GROUP BY spelling ORDER BY 2 DESC, 1''').fetchall()
+    names = {}
+    for spelling, _ in spellings:
+        names.setdefault(category_key(spelling), normalize_category(spelling))
+    conn.executemany("INSERT INTO categories (name, key) VALUES (?, ?)", [(name, key) for key, name in names.items()])
+    conn.execute("CREATE TEMP TABLE category_spellings (spelling TEXT PRIMARY KEY, category_id INTEGER NOT NULL)")
+    conn.executemany("INSERT INTO category_spellings (spelling, category_id) SELECT ?, id FROM categories WHERE key = ?",
+                     [(spelling, category_key(spelling)) for spelling, _ in spellings])
+
+    conn.execute("DROP TABLE transactions_fts")
+    conn.execute('''CREATE TABLE transactions_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER,
+                  date TEXT,
+                  amount_cents INTEGER NOT NULL,
+                  category_id INTEGER NOT NULL REFERENCES categories(id),
+                  description TEXT,
+                  type_id INTEGER NOT NULL REFERENCES transaction_types(id),
+                  recurring_rule_id INTEGER,
+                  FOREIGN KEY(user_id) REFERENCES users(id))''')
+    conn.execute('''INSERT INTO transactions_new (id, user_id, date, amount_cents, category_id, description, type_id, recurring_rule_id)
+                 SELECT t.id, t.user_id, t.date, t.amount_cents, s.category_id, t.description, y.id, t.recurring_rule_id
+                 FROM transactions t
+                 JOIN category_spellings s ON s.spelling = IFNULL(t.category, '')
+                 JOIN transaction_types y ON y.name = IFNULL(t.transaction_type, '')''')
+    # Keep the id sequence, so ids of deleted rows are not handed out again
+    conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, IFNULL((SELECT seq FROM sqlite_sequence WHERE name = ?), 0)) WHERE name = ?",
+                 ('transactions', 'transactions_new'))
+    conn.execute("DROP TABLE transactions")
+    conn.execute("ALTER TABLE transactions_new RENAME TO transactions")
+    conn.execute("CREATE INDEX idx_transactions_user_date ON transactions (user_id, date)")
+    conn.execute("CREATE INDEX idx_transactions_user_type_date ON transactions (user_id, type_id, date, amount_cents)")
+    conn.execute("CREATE INDEX idx_transactions_user ON transactions (user_id)")
+    conn.execute("CREATE UNIQUE INDEX idx_transactions_recurring ON transactions (recurring_rule_id, date) WHERE recurring_rule_id IS NOT NULL")
+    conn.execute('''CREATE VIEW transaction_details AS
+                 SELECT t.id AS id, t.user_id AS user_id, t.date AS date, t.amount_cents AS amount_cents,
+                        c.name AS category, t.description AS description, y.name AS transaction_type,
+                        t.category_id AS category_id, t.type_id AS type_id, t.recurring_rule_id AS recurring_rule_id
+                 FROM transactions t
+                 JOIN categories c ON c.id = t.category_id
+                 JOIN transaction_types y ON y.id = t.type_id''')
+
+    conn.execute("DROP TABLE monthly_rollups")
+    conn.execute('''CREATE TABLE monthly_rollups
+                 (user_id INTEGER NOT NULL,
+                  year_month TEXT NOT NULL,
+                  type_id INTEGER NOT NULL,
+                  category_id INTEGER NOT NULL,
+                  total_cents INTEGER NOT NULL DEFAULT 0,
+                  count INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (user_id, year_month, type_id, category_id)) WITHOUT ROWID''')
+    conn.execute('''CREATE TRIGGER trg_rollups_insert AFTER INSERT ON transactions
+                 BEGIN
+                     INSERT INTO monthly_rollups (user_id, year_month, type_id, category_id, total_cents, count)
+                     VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.type_id, NEW.category_id, NEW.amount_cents, 1)
+                     ON CONFLICT (user_id, year_month, type_id, category_id)
+                     DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_rollups_delete AFTER DELETE ON transactions
+                 BEGIN
+                     UPDATE monthly_rollups SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND type_id = OLD.type_id AND category_id = OLD.category_id;
+                     DELETE FROM monthly_rollups
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND type_id = OLD.type_id AND category_id = OLD.category_id
+                       AND count <= 0;
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_rollups_update
+                 AFTER UPDATE OF user_id, date, amount_cents, category_id, type_id ON transactions
+                 BEGIN
+                     UPDATE monthly_rollups SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND type_id = OLD.type_id AND category_id = OLD.category_id;
+                     DELETE FROM monthly_rollups
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND type_id = OLD.type_id AND category_id = OLD.category_id
+                       AND count <= 0;
+                     INSERT INTO monthly_rollups (user_id, year_month, type_id, category_id, total_cents, count)
+                     VALUES (NEW.user_id, substr(NEW.date, 1, 7), NEW.type_id, NEW.category_id, NEW.amount_cents, 1)
+                     ON CONFLICT (user_id, year_month, type_id, category_id)
+                     DO UPDATE SET total_cents = total_cents + excluded.total_cents, count = count + 1;
+                 END''')
+    conn.execute('''INSERT INTO monthly_rollups (user_id, year_month, type_id, category_id, total_cents, count)
+                 SELECT user_id, substr(date, 1, 7), type_id, category_id, SUM(amount_cents), COUNT(*)
+                 FROM transactions
+                 GROUP BY user_id, substr(date, 1, 7), type_id, category_id''')
+
+    conn.execute('''CREATE TABLE budgets_new
+                 (user_id INTEGER NOT NULL REFERENCES users(id),
+                  category_id INTEGER NOT NULL REFERENCES categories(id),
+                  limit_cents INTEGER NOT NULL CHECK (limit_cents > 0),
+                  warn_percent INTEGER NOT NULL DEFAULT 80 CHECK (warn_percent BETWEEN 1 AND 100),
+                  PRIMARY KEY (user_id, category_id)) WITHOUT ROWID''')
+    conn.execute('''INSERT INTO budgets_new (user_id, category_id, limit_cents, warn_percent)
+                 SELECT b.user_id, s.category_id, b.limit_cents, b.warn_percent
+                 FROM budgets b JOIN category_spellings s ON s.spelling = b.category
+                 WHERE true ON CONFLICT DO NOTHING''')
+    conn.execute('''CREATE TABLE budget_alerts_new
+                 (user_id INTEGER NOT NULL,
+                  category_id INTEGER NOT NULL,
+                  year_month TEXT NOT NULL,
+                  level TEXT NOT NULL,
+                  total_cents INTEGER NOT NULL,
+                  limit_cents INTEGER NOT NULL,
+                  seen INTEGER NOT NULL DEFAULT 0,
+                  PRIMARY KEY (user_id, category_id, year_month, level)) WITHOUT ROWID''')
+    conn.execute('''INSERT INTO budget_alerts_new (user_id, category_id, year_month, level, total_cents, limit_cents, seen)
+                 SELECT a.user_id, s.category_id, a.year_month, a.level, a.total_cents, a.limit_cents, a.seen
+                 FROM budget_alerts a JOIN category_spellings s ON s.spelling = a.category
+                 WHERE true ON CONFLICT DO NOTHING''')
+    conn.execute("DROP TABLE budgets")
+    conn.execute("DROP TABLE budget_alerts")
+    conn.execute("ALTER TABLE budgets_new RENAME TO budgets")
+    conn.execute("ALTER TABLE budget_alerts_new RENAME TO budget_alerts")
+    conn.execute("CREATE INDEX idx_budget_alerts_unseen ON budget_alerts (user_id) WHERE seen = 0")
+    conn.execute('''CREATE TRIGGER trg_budget_alerts_insert AFTER INSERT ON monthly_rollups
+                 WHEN NEW.type_id = 2
+                 BEGIN
+                     INSERT INTO budget_alerts (user_id, category_id, year_month, level, total_cents, limit_cents)
+                     SELECT user_id, category_id, NEW.year_month, 'warning', NEW.total_cents, limit_cents FROM budgets
+                     WHERE user_id = NEW.user_id AND category_id = NEW.category_id
+                       AND NEW.total_cents * 100 >= limit_cents * warn_percent
+                     ON CONFLICT DO NOTHING;
+                     INSERT INTO budget_alerts (user_id, category_id, year_month, level, total_cents, limit_cents)
+                     SELECT user_id, category_id, NEW.year_month, 'exceeded', NEW.total_cents, limit_cents FROM budgets
+                     WHERE user_id = NEW.user_id AND category_id = NEW.category_id
+                       AND NEW.total_cents > limit_cents
+                     ON CONFLICT DO NOTHING;
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_budget_alerts_update AFTER UPDATE OF total_cents ON monthly_rollups
+                 WHEN NEW.type_id = 2 AND NEW.total_cents > OLD.total_cents
+                 BEGIN
+                     INSERT INTO budget_alerts (user_id, category_id, year_month, level, total_cents, limit_cents)
+                     SELECT user_id, category_id, NEW.year_month, 'warning', NEW.total_cents, limit_cents FROM budgets
+                     WHERE user_id = NEW.user_id AND category_id = NEW.category_id
+                       AND OLD.total_cents * 100 < limit_cents * warn_percent
+                       AND NEW.total_cents * 100 >= limit_cents * warn_percent
+                     ON CONFLICT DO NOTHING;
+                     INSERT INTO budget_alerts (user_id, category_id, year_month, level, total_cents, limit_cents)
+                     SELECT user_id, category_id, NEW.year_month, 'exceeded', NEW.total_cents, limit_cents FROM budgets
+                     WHERE user_id = NEW.user_id AND category_id = NEW.category_id
+                       AND OLD.total_cents <= limit_cents AND NEW.total_cents > limit_cents
+                     ON CONFLICT DO NOTHING;
+                 END''')
+
+    conn.execute('''CREATE TABLE recurring_rules_new
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  user_id INTEGER NOT NULL REFERENCES users(id),
+                  amount_cents INTEGER NOT NULL CHECK (amount_cents > 0),
+                  category_id INTEGER NOT NULL REFERENCES categories(id),
+                  description TEXT,
+                  type_id INTEGER NOT NULL REFERENCES transaction_types(id),
+                  interval TEXT NOT NULL CHECK (interval IN ('daily', 'weekly', 'monthly', 'yearly')),
+                  every INTEGER NOT NULL DEFAULT 1 CHECK (every > 0),
+                  start_date TEXT NOT NULL,
+                  end_date TEXT,
+                  next_date TEXT,
+                  generated INTEGER NOT NULL DEFAULT 0)''')
+    conn.execute('''INSERT INTO recurring_rules_new
+                 (id, user_id, amount_cents, category_id, description, type_id, interval, every, start_date, end_date, next_date, generated)
+                 SELECT r.id, r.user_id, r.amount_cents, s.category_id, r.description, y.id, r.interval, r.every,
+                        r.start_date, r.end_date, r.next_date, r.generated
+                 FROM recurring_rules r
+                 JOIN category_spellings s ON s.spelling = IFNULL(r.category, '')
+                 JOIN transaction_types y ON y.name = r.transaction_type''')
+    conn.execute("UPDATE sqlite_sequence SET seq = MAX(seq, IFNULL((SELECT seq FROM sqlite_sequence WHERE name = ?), 0)) WHERE name = ?",
+                 ('recurring_rules', 'recurring_rules_new'))
+    conn.execute("DROP TABLE recurring_rules")
+    conn.execute("ALTER TABLE recurring_rules_new RENAME TO recurring_rules")
+    conn.execute("CREATE INDEX idx_recurring_rules_next ON recurring_rules (next_date) WHERE next_date IS NOT NULL")
+    conn.execute("CREATE INDEX idx_recurring_rules_user ON recurring_rules (user_id)")
+    conn.execute("DROP TABLE category_spellings")
+
+    conn.execute('''CREATE VIRTUAL TABLE transactions_fts USING fts5
+                 (description, category, content='transaction_details', content_rowid='id',
+                  tokenize='unicode61 remove_diacritics 2', prefix='2 3')''')
+    conn.execute('''CREATE TRIGGER trg_fts_insert AFTER INSERT ON transactions
+                 BEGIN
+                     INSERT INTO transactions_fts (rowid, description, category)
+                     VALUES (NEW.id, NEW.description, (SELECT name FROM categories WHERE id = NEW.category_id));
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_fts_delete AFTER DELETE ON transactions
+                 BEGIN
+                     INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+                     VALUES ('delete', OLD.id, OLD.description, (SELECT name FROM categories WHERE id = OLD.category_id));
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_fts_update AFTER UPDATE OF description, category_id ON transactions
+                 BEGIN
+                     INSERT INTO transactions_fts (transactions_fts, rowid, description, category)
+                     VALUES ('delete', OLD.id, OLD.description, (SELECT name FROM categories WHERE id = OLD.category_id));
+                     INSERT INTO transactions_fts (rowid, description, category)
+                     VALUES (NEW.id, NEW.description, (SELECT name FROM categories WHERE id = NEW.category_id));
+                 END''')
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+    # A rebuilt index is left in many segments, and the next writes would pay
+    # for merging them; merge them all now
+    conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+    # Statistics of the dropped tables went with them
+    conn.execute("ANALYZE")
+
+# Each user's running balance at the end of every month with activity, so a
+# balance at any date is one checkpoint lookup plus the transactions of one
+# partial month. A write only marks the user's checkpoints stale from the
+# month it touched (one primary key upsert, from triggers on monthly_rollups),
+# and the stale months are recomputed from the rollup the next time a
+# balance is read (see balances.py). Editing an old transaction therefore
+# costs the write nothing extra, and the later months are repaired once.
+def add_balance_checkpoints(conn):
+    conn.execute('''CREATE TABLE balance_checkpoints
+                 (user_id INTEGER NOT NULL,
+                  year_month TEXT NOT NULL,
+                  balance_cents INTEGER NOT NULL,
+                  PRIMARY KEY (user_id, year_month)) WITHOUT ROWID''')
+    conn.execute('''CREATE TABLE stale_balance_checkpoints
+                 (user_id INTEGER PRIMARY KEY,
+                  year_month TEXT NOT NULL)''')
+    conn.execute('''CREATE TRIGGER trg_checkpoints_insert AFTER INSERT ON monthly_rollups
+                 BEGIN
+                     INSERT INTO stale_balance_checkpoints (user_id, year_month) VALUES (NEW.user_id, NEW.year_month)
+                     ON CONFLICT (user_id) DO UPDATE SET year_month = MIN(year_month, excluded.year_month);
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_checkpoints_update AFTER UPDATE OF total_cents ON monthly_rollups
+                 BEGIN
+                     INSERT INTO stale_balance_checkpoints (user_id, year_month) VALUES (NEW.user_id, NEW.year_month)
+                     ON CONFLICT (user_id) DO UPDATE SET year_month = MIN(year_month, excluded.year_month);
+                 END''')
+    conn.execute('''CREATE TRIGGER trg_checkpoints_delete AFTER DELETE ON monthly_rollups
+                 BEGIN
+                     INSERT INTO stale_balance_checkpoints (user_id, year_month) VALUES (OLD.user_id, OLD.year_month)
+                     ON CONFLICT (user_id) DO UPDATE SET year_month = MIN(year_month, excluded.year_month);
+                 END''')
+    conn.execute('''INSERT INTO balance_checkpoints (user_id, year_month, balance_cents)
+                 SELECT user_id, year_month,
+                        SUM(SUM(CASE type_id WHEN 1 THEN total_cents WHEN 2 THEN -total_cents ELSE 0 END))
+                            OVER (PARTITION BY user_id ORDER BY year_month)
+                 FROM monthly_rollups
+                 GROUP BY user_id, year_month''')
+
+# Moving rows to the archive deletes them from transactions, but their months
+# stay in monthly_rollups (and so in the balance checkpoints and budget
+# alerts). While the archive process holds a row in archiving, deletes leave
+# the rollup alone.
+def add_archiving_flag(conn):
+    conn.execute("CREATE TABLE archiving (active INTEGER NOT NULL)")
+    conn.execute("DROP TRIGGER trg_rollups_delete")
+    conn.execute('''CREATE TRIGGER trg_rollups_delete AFTER DELETE ON transactions
+                 WHEN NOT EXISTS (SELECT 1 FROM archiving)
+                 BEGIN
+                     UPDATE monthly_rollups SET total_cents = total_cents - OLD.amount_cents, count = count - 1
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND type_id = OLD.type_id AND category_id = OLD.category_id;
+                     DELETE FROM monthly_rollups
+                     WHERE user_id = OLD.user_id AND year_month = substr(OLD.date, 1, 7)
+                       AND type_id = OLD.type_id AND category_id = OLD.category_id
+                       AND count <= 0;
+                 END''')
+
+MIGRATIONS = [
+    add_transaction_indexes,
+    add_monthly_rollups,
+    add_user_id_index,
+    convert_amounts_to_cents,
+    add_transactions_fts,
+    add_budgets,
+    add_recurring_rules,
+    normalize_categories,
+    add_balance_checkpoints,
+    add_archiving_flag,
+]
+
+# Aggregate of the raw table (and the archive, if any) in monthly_rollups'
+# shape, for the repair and consistency checks below
+ROLLUP_SELECT = '''SELECT user_id, substr(date, 1, 7), type_id, category_id, SUM(amount_cents), SUM(count)
+                   FROM {ledger}
+                   GROUP BY user_id, substr(date, 1, 7), type_id, category_id'''
+
+def migrate():
+    conn = get_connection()
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        with transaction():
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {number}")
+
+# Repair path: recompute monthly_rollups from the raw transactions table and
+# the archived day totals.
+# Refilling the rollup re-fires the budget triggers for every month, so
+# afterwards every budget alert is marked as seen rather than shown again.
+def rebuild_rollups():
+    with transaction() as conn:
+        conn.execute("DELETE FROM monthly_rollups")
+        conn.execute("INSERT INTO monthly_rollups (user_id, year_month, type_id, category_id, total_cents, count) "
+                     + ROLLUP_SELECT.format(ledger=ledger_source(conn)))
+        conn.execute("UPDATE budget_alerts SET seen = 1 WHERE seen = 0")
+    bump_data_version()
+
+# Repair path for the full-text index
+def rebuild_search_index():
+    with transaction() as conn:
+        conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('rebuild')")
+        conn.execute("INSERT INTO transactions_fts (transactions_fts) VALUES ('optimize')")
+
+# Consistency check: returns (user_id, year_month, type_id, category_id,
+# rollup total, raw total, rollup count, raw count) for every key where the
+# rollup disagrees with the raw table. An empty list means they match.
+def check_rollups():
+    conn = get_connection()
+    return conn.execute(f'''WITH raw (user_id, year_month, type_id, category_id, total_cents, count) AS ({ROLLUP_SELECT.format(ledger=ledger_source(conn))}),
+                      keys AS (SELECT user_id, year_month, type_id, category_id FROM raw
+                               UNION
+                               SELECT user_id, year_month, type_id, category_id FROM monthly_rollups)
+                 SELECT k.user_id, k.year_month, k.type_id, k.category_id,
+                        IFNULL(r.total_cents, 0), IFNULL(w.total_cents, 0), IFNULL(r.count, 0), IFNULL(w.count, 0)
+                 FROM keys k
+                 LEFT JOIN monthly_rollups r USING (user_id, year_month, type_id, category_id)
+                 LEFT JOIN raw w USING (user_id, year_month, type_id, category_id)
+                 WHERE IFNULL(r.count, 0) != IFNULL(w.count, 0)
+                    OR IFNULL(r.total_cents, 0) != IFNULL(w.total_cents, 0)''').fetchall()
@@ -0,0 +1,35 @@
+# Exceptions raised by the write API. Everything derives from FinanceError,
+# so callers that only need to report a failure can catch that one type.
+
+class FinanceError(Exception):
+    pass
+
+# Input that fails validation, e.g. a malformed date or a non-positive amount
+class ValidationError(FinanceError, ValueError):
+    pass
+
+# One or more transaction ids do not exist for the user
+class TransactionNotFound(FinanceError, LookupError):
+    def __init__(self, ids):
+        self.ids = sorted(ids)
+        shown = ", ".join(str(transaction_id) for transaction_id in self.ids[:10])
+        more = f" and {len(self.ids) - 10} more" if len(self.ids) > 10 else ""
+        super().__init__(f"Transaction not found: {shown}{more}")
+
+# The database rejected or failed a write; the unit of work was rolled back
+class StorageError(FinanceError):
+    pass
+
+class AuthError(FinanceError):
+    pass
+
+# Registration with a username that is already in use
+class UsernameTaken(AuthError):
+    pass
+
+# Too many failed logins for a username, or too many logins queued at once;
+# retry_after is the number of seconds until another attempt is accepted
+class TooManyAttempts(AuthError):
+    def __init__(self, message, retry_after=0):
+        super().__init__(message)
+        self.retry_after = retry_after
@@ -0,0 +1,97 @@
+import csv
+import json
+import os
+
+# Writers for streamed exports. Rows arrive as an iterator of chunks (lists of
+# tuples in the order of `columns`, e.g. straight from cursor.fetchmany), and
+# each chunk is written out before the next one is read, so memory use is
+# bounded by the chunk size no matter how large the export is.
+#
+# Every writer takes `convert`, a mapping of column -> function applied to that
+# column for the text formats (CSV and JSON Lines); the binary formats store
+# the raw values with a typed schema.
+
+FORMATS = ['csv', 'jsonl', 'parquet', 'arrow']
+
+# Format from a file extension, e.g. 'ledger.jsonl' -> 'jsonl'
+def format_for_path(path):
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    extension = {'json': 'jsonl', 'ndjson': 'jsonl', 'pq': 'parquet', 'feather': 'arrow', 'ipc': 'arrow'}.get(extension, extension)
+    return extension if extension in FORMATS else 'csv'
+
+def _converted(chunk, converters):
+    if not any(converters):
+        return chunk
+    return [tuple(convert(value) if convert else value for convert, value in zip(converters, row)) for row in chunk]
+
+def write_csv(chunks, path, columns, convert=None):
+    converters = [(convert or {}).get(column) for column in columns]
+    count = 0
+    with open(path, 'w', newline='', encoding='utf-8') as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(columns)
+        for chunk in chunks:
+            writer.writerows(_converted(chunk, converters))
+            count += len(chunk)
+    return count
+
+def write_jsonl(chunks, path, columns, convert=None):
+    converters = [(convert or {}).get(column) for column in columns]
+    count = 0
+    with open(path, 'w', encoding='utf-8') as jsonl_file:
+        for chunk in chunks:
+            jsonl_file.writelines(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in _converted(chunk, converters))
+            count += len(chunk)
+    return count
+
+# pyarrow is optional: it is only needed for the Parquet and Arrow formats
+def _arrow_batches(chunks, columns, types):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Parquet and Arrow export need pyarrow (pip install pyarrow)") from None
+    schema = pa.schema([(column, getattr(pa, types.get(column, 'string'))()) for column in columns])
+    return pa, schema, (pa.record_batch([pa.array(values, type=field.type) for values, field in zip(zip(*chunk), schema)], schema=schema)
+                        for chunk in chunks if chunk)
+
+def write_parquet(chunks, path, columns, types=None):
+    pa, schema, batches = _arrow_batches(chunks, columns, types or {})
+    import pyarrow.parquet as pq
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+def write_arrow(chunks, path, columns, types=None):
+    pa, schema, batches = _arrow_batches(chunks, columns, types or {})
+    count = 0
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            count += batch.num_rows
+    return count
+
+# Write chunks in the given format (or the one implied by the path's
+# extension) and return the number of rows written. `types` maps columns to
+# pyarrow type names for the binary formats; other columns are strings.
+def write_rows(chunks, path, columns, fmt=None, convert=None, types=None):
+    fmt = fmt or format_for_path(path)
+    if fmt == 'csv':
+        return write_csv(chunks, path, columns, convert)
+    if fmt == 'jsonl':
+        return write_jsonl(chunks, path, columns, convert)
+    if fmt == 'parquet':
+        return write_parquet(chunks, path, columns, types)
+    if fmt == 'arrow':
+        return write_arrow(chunks, path, columns, types)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+# Iterate over a cursor's result set in fetchmany chunks
+def iter_chunks(cursor, chunk_size=10000):
+    while True:
+        chunk = cursor.fetchmany(chunk_size)
+        if not chunk:
+            return
+        yield chunk
@@ -1,13 +1,22 @@
+import base64
 import tkinter as tk
 from tkinter import ttk, messagebox
-from datetime import datetime
-from tkcalendar import DateEntry
 
-from .auth import login_user, register_user
-from .transactions import add_transaction, edit_transaction, delete_transaction, view_transactions, get_transaction_by_id
-from .models import Transaction
-from .visualization import plot_income_expense_trend, plot_monthly_expenses, plot_income_sources, plot_cumulative_savings
-from .reports import generate_yearly_summary, generate_monthly_report
+from .auth import login_async, register_async
+from .budgets import budget_status, set_budget, take_budget_alerts
+from .transactions import (add_transaction, edit_transaction, delete_transaction, get_transaction_by_id,
+                           count_transactions, get_transactions_after, get_transactions_before, get_transactions_at,
+                           search_transactions, transaction_position)
+from .errors import FinanceError
+from .instrumentation import instrument_tk
+from .models import Transaction, format_amount, parse_amount, validate_date, validate_amount
+from .recurring import INTERVALS, add_recurring_rule, materialize_due
+from .tasks import TaskRunner
+from .widgets import VirtualListbox
+
+SEARCH_DELAY_MS = 250  # pause in typing before a search is sent
+SEARCH_RESULTS = 50
+DASHBOARD_BUDGETS = 8  # fullest budgets shown on the dashboard
 
 # Theme Styles
 def apply_light_mode(style, root):
@@ -28,7 +37,7 @@ def toggle_theme(style, dark_mode_var, root):
     else:
         apply_light_mode(style, root)
 
-def create_menu_bar(main_window, user_id, style, dark_mode_var):
+def create_menu_bar(main_window, user_id, style, dark_mode_var, runner, refresh_dashboard, on_posted):
     menu_bar = tk.Menu(main_window)
 
     # File Menu
@@ -43,12 +52,32 @@ def create_menu_bar(main_window, user_id, style, dark_mode_var):
 
     # Reports Menu
     reports_menu = tk.Menu(menu_bar, tearoff=0)
-    reports_menu.add_command(label="Monthly Report", command=lambda: display_report(generate_monthly_report(user_id, '2024', '08')))
-    reports_menu.add_command(label="Yearly Report", command=lambda: display_report(generate_yearly_summary(user_id, '2024')))
-    reports_menu.add_command(label="Income vs Expense", command=lambda: plot_income_expense_trend(user_id))
-    reports_menu.add_command(label="Monthly Expenses", command=lambda: plot_monthly_expenses(user_id, '2024'))
+    # Queries and chart rendering run on the worker pool; only display happens
+    # on the Tk thread. All of them share the "report" key, so picking another
+    # entry while one is still loading replaces the stale request.
+    reports_menu.add_command(label="Monthly Report", command=lambda: show_report(
+        runner, "Monthly report", 'generate_monthly_report', user_id, '2024', '08'))
+    reports_menu.add_command(label="Yearly Report", command=lambda: show_report(
+        runner, "Yearly report", 'generate_yearly_summary', user_id, '2024'))
+    reports_menu.add_command(label="Income vs Expense", command=lambda: show_chart(
+        runner, user_id, "Income vs expense", 'income_expense_trend'))
+    reports_menu.add_command(label="Monthly Expenses", command=lambda: show_chart(
+        runner, user_id, "Monthly expenses", 'monthly_expenses', year='2024'))
     menu_bar.add_cascade(label="Reports", menu=reports_menu)
 
+    # Budgets Menu
+    budgets_menu = tk.Menu(menu_bar, tearoff=0)
+    budgets_menu.add_command(label="Set Budget...", command=lambda: show_budget_window(main_window, user_id, refresh_dashboard))
+    menu_bar.add_cascade(label="Budgets", menu=budgets_menu)
+
+    # Recurring Menu
+    recurring_menu = tk.Menu(menu_bar, tearoff=0)
+    recurring_menu.add_command(label="Add Recurring Transaction...", command=lambda: show_recurring_window(main_window, runner, user_id, on_posted))
+    recurring_menu.add_command(label="Post Due Transactions", command=lambda: post_due_transactions(runner, user_id, on_posted))
+    recurring_menu.add_command(label="Forecast", command=lambda: show_report(
+        runner, "Forecast", 'generate_forecast_report', user_id, 12))
+    menu_bar.add_cascade(label="Recurring", menu=recurring_menu)
+
     # Help Menu
     help_menu = tk.Menu(menu_bar, tearoff=0)
     help_menu.add_command(label="About", command=lambda: messagebox.showinfo("About", "Finance Manager v1.0"))
@@ -56,6 +85,15 @@ def create_menu_bar(main_window, user_id, style, dark_mode_var):
 
     main_window.config(menu=menu_bar)
 
+# The report and chart modules (and with them NumPy and matplotlib) are not
+# needed to show the login window, so they are imported on first use, on the
+# worker thread.
+def show_report(runner, title, name, *args):
+    def run():
+        from . import reports
+        return getattr(reports, name)(*args)
+    runner.submit("report", run, on_success=display_report, description=title)
+
 def display_report(report):
     report_window = tk.Toplevel()
     report_window.title("Report")
@@ -64,23 +102,103 @@ def display_report(report):
     report_text.pack(padx=10, pady=10)
     report_text.insert(tk.END, report)
 
+# Charts are rendered to PNG off the Tk thread (and cached until the user's
+# data changes); the Tk thread only decodes the image.
+def show_chart(runner, user_id, title, kind, **params):
+    def run():
+        from .visualization import render_chart
+        return render_chart(user_id, kind, **params)
+    runner.submit("report", run, on_success=lambda image: display_chart(image, title), description=title)
+
+def display_chart(image, title):
+    chart_window = tk.Toplevel()
+    chart_window.title(title)
+
+    photo = tk.PhotoImage(master=chart_window, data=base64.b64encode(image))
+    chart_label = tk.Label(chart_window, image=photo)
+    chart_label.image = photo  # Keep a reference so Tk does not drop the image
+    chart_label.pack(padx=10, pady=10)
+
 def show_dashboard(user_id, frame):
+    from .reports import summary
+
     # Clear the frame
     for widget in frame.winfo_children():
         widget.destroy()
 
     # Fetching financial summary
-    total_income = sum(row[3] for row in view_transactions(user_id) if row[6] == 'income')
-    total_expenses = sum(row[3] for row in view_transactions(user_id) if row[6] == 'expense')
-    net_savings = total_income - total_expenses
+    financial_summary = summary(user_id)
+    total_income = financial_summary['income']
+    total_expenses = financial_summary['expense']
+    net_savings = financial_summary['net']
 
     # Display the summary
     ttk.Label(frame, text="Dashboard", font=("Arial", 16)).grid(row=0, column=0, pady=10, sticky='w')
-    ttk.Label(frame, text=f"Total Income: ${total_income:.2f}", font=("Arial", 12)).grid(row=1, column=0, padx=10, pady=5, sticky='w')
-    ttk.Label(frame, text=f"Total Expenses: ${total_expenses:.2f}", font=("Arial", 12)).grid(row=2, column=0, padx=10, pady=5, sticky='w')
-    ttk.Label(frame, text=f"Net Savings: ${net_savings:.2f}", font=("Arial", 12)).grid(row=3, column=0, padx=10, pady=5, sticky='w')
+    ttk.Label(frame, text=f"Total Income: ${format_amount(total_income)}", font=("Arial", 12)).grid(row=1, column=0, padx=10, pady=5, sticky='w')
+    ttk.Label(frame, text=f"Total Expenses: ${format_amount(total_expenses)}", font=("Arial", 12)).grid(row=2, column=0, padx=10, pady=5, sticky='w')
+    ttk.Label(frame, text=f"Net Savings: ${format_amount(net_savings)}", font=("Arial", 12)).grid(row=3, column=0, padx=10, pady=5, sticky='w')
+
+    # Budget versus actual for the current month, read from the rollups
+    budgets = budget_status(user_id)
+    if budgets:
+        ttk.Label(frame, text="Budgets this month", font=("Arial", 12, "bold")).grid(row=4, column=0, padx=10, pady=(15, 5), sticky='w')
+    for row, (category, spent, limit, level) in enumerate(budgets[:DASHBOARD_BUDGETS], start=5):
+        budget_frame = ttk.Frame(frame)
+        budget_frame.grid(row=row, column=0, padx=10, pady=2, sticky='ew')
+        text = f"{category}: ${format_amount(spent)} of ${format_amount(limit)} ({spent * 100 // limit}%)"
+        label = ttk.Label(budget_frame, text=text, font=("Arial", 10))
+        if level == 'exceeded':
+            label.config(foreground='red')
+        label.grid(row=0, column=0, sticky='w')
+        ttk.Progressbar(budget_frame, length=200, maximum=100, value=min(spent * 100 / limit, 100)).grid(row=1, column=0, sticky='w')
+    if len(budgets) > DASHBOARD_BUDGETS:
+        ttk.Label(frame, text=f"and {len(budgets) - DASHBOARD_BUDGETS} more", font=("Arial", 9)).grid(row=5 + DASHBOARD_BUDGETS, column=0, padx=10, sticky='w')
+
+# Tell the user about budget thresholds crossed since the last check
+def show_budget_alerts(user_id):
+    alerts = take_budget_alerts(user_id)
+    if not alerts:
+        return
+    lines = []
+    for category, year_month, level, total, limit in alerts[:10]:
+        if level == 'exceeded':
+            lines.append(f"{category} ({year_month}): ${format_amount(total)} spent, over the ${format_amount(limit)} budget")
+        else:
+            lines.append(f"{category} ({year_month}): ${format_amount(total)} spent, {total * 100 // limit}% of the ${format_amount(limit)} budget")
+    if len(alerts) > 10:
+        lines.append(f"and {len(alerts) - 10} more")
+    messagebox.showwarning("Budget", "\n".join(lines))
+
+def show_budget_window(parent_window, user_id, on_saved):
+    budget_window = tk.Toplevel(parent_window)
+    budget_window.title("Set Budget")
+
+    ttk.Label(budget_window, text="Category:").grid(row=0, column=0, padx=10, pady=10)
+    ttk.Label(budget_window, text="Monthly limit:").grid(row=1, column=0, padx=10, pady=10)
+
+    category_entry = ttk.Entry(budget_window)
+    limit_entry = ttk.Entry(budget_window)
+
+    category_entry.grid(row=0, column=1, padx=10, pady=10)
+    limit_entry.grid(row=1, column=1, padx=10, pady=10)
+
+    def save_action():
+        limit_cents = parse_amount(limit_entry.get())
+        if limit_cents is None:
+            messagebox.showerror("Budget", "Invalid amount.")
+            return
+        try:
+            set_budget(user_id, category_entry.get().strip(), limit_cents)
+        except FinanceError as e:
+            messagebox.showerror("Budget", str(e))
+            return
+        budget_window.destroy()
+        on_saved()
+
+    ttk.Button(budget_window, text="Save", command=save_action).grid(row=2, column=1, pady=10)
 
 def show_login_window():
+    instrument_tk()  # Tk callback timings, recorded while profiling is on
     login_window = tk.Tk()
     login_window.title("Login")
 
@@ -93,20 +211,40 @@ def show_login_window():
     username_entry.grid(row=0, column=1, padx=10, pady=10)
     password_entry.grid(row=1, column=1, padx=10, pady=10)
 
-    def login_action():
-        username = username_entry.get()
-        password = password_entry.get()
-        user_id = login_user(username, password)
+    # Password hashing runs on the auth pool; the window stays responsive
+    # and the button is disabled until the result is back
+    runner = TaskRunner(login_window)
+
+    def login_done(user_id):
+        login_button.config(state=tk.NORMAL)
         if user_id:
             login_window.destroy()
             show_main_window(user_id)
+        else:
+            messagebox.showerror("Login", "Invalid username or password.")
 
-    ttk.Button(login_window, text="Login", command=login_action).grid(row=2, column=1, pady=10)
-    ttk.Button(login_window, text="Register", command=lambda: show_register_window(login_window)).grid(row=2, column=0, pady=10)
+    def login_failed(error):
+        login_button.config(state=tk.NORMAL)
+        messagebox.showerror("Login", str(error))
+
+    def login_action():
+        try:
+            future = login_async(username_entry.get(), password_entry.get())
+        except FinanceError as e:
+            messagebox.showerror("Login", str(e))
+            return
+        login_button.config(state=tk.DISABLED)
+        runner.watch("login", future, on_success=login_done, on_error=login_failed)
+
+    login_button = ttk.Button(login_window, text="Login", command=login_action)
+    login_button.grid(row=2, column=1, pady=10)
+    ttk.Button(login_window, text="Register", command=lambda: show_register_window(login_window, runner)).grid(row=2, column=0, pady=10)
+    login_window.bind("<Return>", lambda event: login_action())
 
     login_window.mainloop()
+    runner.shutdown()
 
-def show_register_window(parent_window):
+def show_register_window(parent_window, runner):
     register_window = tk.Toplevel(parent_window)
     register_window.title("Register")
 
@@ -119,16 +257,81 @@ def show_register_window(parent_window):
     username_entry.grid(row=0, column=1, padx=10, pady=10)
     password_entry.grid(row=1, column=1, padx=10, pady=10)
 
-    def register_action():
-        username = username_entry.get()
-        password = password_entry.get()
-        register_user(username, password)
+    def register_done(user_id):
         messagebox.showinfo("Registration", "Registration successful!")
         register_window.destroy()
 
-    ttk.Button(register_window, text="Register", command=register_action).grid(row=2, column=1, pady=10)
+    def register_failed(error):
+        register_button.config(state=tk.NORMAL)
+        messagebox.showerror("Registration", str(error))
+
+    def register_action():
+        try:
+            future = register_async(username_entry.get(), password_entry.get())
+        except FinanceError as e:
+            messagebox.showerror("Registration", str(e))
+            return
+        register_button.config(state=tk.DISABLED)
+        runner.watch("register", future, on_success=register_done, on_error=register_failed)
+
+    register_button = ttk.Button(register_window, text="Register", command=register_action)
+    register_button.grid(row=2, column=1, pady=10)
+
+# Write the user's due recurring transactions on the worker pool; quietly
+# (no message unless something fails) when done on its own, e.g. after login
+def post_due_transactions(runner, user_id, on_posted, announce=True):
+    def done(written):
+        if announce:
+            messagebox.showinfo("Recurring", f"Posted {written} recurring transactions.")
+        if written:
+            on_posted()
+    runner.submit("recurring", materialize_due, None, user_id, on_success=done,
+                  on_error=lambda error: messagebox.showerror("Recurring", str(error)), description="Recurring transactions")
+
+def show_recurring_window(parent_window, runner, user_id, on_posted):
+    recurring_window = tk.Toplevel(parent_window)
+    recurring_window.title("Add Recurring Transaction")
+
+    labels = ["First date (YYYY-MM-DD):", "Amount:", "Category:", "Description:", "Type:", "Repeats:", "Every:", "Until (optional):"]
+    for row, text in enumerate(labels):
+        ttk.Label(recurring_window, text=text).grid(row=row, column=0, padx=10, pady=5, sticky="e")
+
+    date_entry = ttk.Entry(recurring_window)
+    amount_entry = ttk.Entry(recurring_window)
+    category_entry = ttk.Entry(recurring_window)
+    description_entry = ttk.Entry(recurring_window)
+    type_box = ttk.Combobox(recurring_window, values=["expense", "income"], state="readonly")
+    type_box.set("expense")
+    interval_box = ttk.Combobox(recurring_window, values=list(INTERVALS), state="readonly")
+    interval_box.set("monthly")
+    every_box = ttk.Spinbox(recurring_window, from_=1, to=365, width=5)
+    every_box.set(1)
+    end_entry = ttk.Entry(recurring_window)
+
+    for row, widget in enumerate([date_entry, amount_entry, category_entry, description_entry, type_box, interval_box, every_box, end_entry]):
+        widget.grid(row=row, column=1, padx=10, pady=5, sticky="ew")
+
+    def save_action():
+        amount_cents = parse_amount(amount_entry.get())
+        if not validate_date(date_entry.get()) or amount_cents is None or not every_box.get().isdigit():
+            messagebox.showerror("Recurring", "Invalid input.")
+            return
+        transaction = Transaction(date_entry.get(), amount_cents, category_entry.get(), description_entry.get(), type_box.get())
+        try:
+            add_recurring_rule(user_id, transaction, interval_box.get(), int(every_box.get()), end_entry.get().strip() or None)
+        except FinanceError as e:
+            messagebox.showerror("Recurring", str(e))
+            return
+        recurring_window.destroy()
+        # Occurrences already due, e.g. a start date in the past
+        post_due_transactions(runner, user_id, on_posted, announce=False)
+
+    ttk.Button(recurring_window, text="Save", command=save_action).grid(row=len(labels), column=1, pady=10)
 
 def show_main_window(user_id):
+    # Only the main window needs the date picker
+    from tkcalendar import DateEntry
+
     main_window = tk.Tk()
     main_window.title("Finance Manager")
 
@@ -137,7 +340,25 @@ def show_main_window(user_id):
     dark_mode_var = tk.BooleanVar(value=False)
     apply_light_mode(style, main_window)
 
-    create_menu_bar(main_window, user_id, style, dark_mode_var)
+    # Status bar showing background work
+    status_frame = ttk.Frame(main_window)
+    status_frame.grid(row=1, column=0, padx=10, pady=(0, 5), sticky="ew")
+    status_frame.columnconfigure(0, weight=1)
+    status_label = ttk.Label(status_frame, text="", font=("Arial", 9))
+    status_label.grid(row=0, column=0, sticky="w")
+    progress_bar = ttk.Progressbar(status_frame, mode="indeterminate", length=120)
+
+    def show_status(description):
+        if description:
+            status_label.config(text=f"Loading: {description}...")
+            progress_bar.grid(row=0, column=1, sticky="e")
+            progress_bar.start(10)
+        else:
+            status_label.config(text="")
+            progress_bar.stop()
+            progress_bar.grid_remove()
+
+    runner = TaskRunner(main_window, on_status=show_status)
 
     # Configure grid layout
     main_window.columnconfigure(0, weight=1)
@@ -148,14 +369,28 @@ def show_main_window(user_id):
     main_frame.grid(row=0, column=0, padx=10, pady=10, sticky="nsew")
     main_frame.columnconfigure(0, weight=1)
 
+    # Dashboard beside the form; refreshed after every change, which also
+    # reports any budget threshold the change crossed
+    dashboard_frame = ttk.Frame(main_window)
+    dashboard_frame.grid(row=0, column=1, padx=10, pady=10, sticky="n")
+
+    def refresh_dashboard():
+        show_dashboard(user_id, dashboard_frame)
+        show_budget_alerts(user_id)
+
+    # Recurring transactions posted from the menu change the list as well
+    def on_posted():
+        transaction_list.reload()
+        refresh_dashboard()
+
+    create_menu_bar(main_window, user_id, style, dark_mode_var, runner, refresh_dashboard, on_posted)
+
     # Show dashboard on startup
-    show_dashboard(user_id, main_frame)
+    refresh_dashboard()
 
     style.configure("TButton", font=("Arial", 10))
     style.configure("TLabel", font=("Arial", 12))
 
-    global transaction_listbox
-
     def add_transaction_action():
         date = date_entry.get()
         amount = amount_entry.get()
@@ -163,11 +398,16 @@ def show_main_window(user_id):
         description = description_entry.get()
         transaction_type = "income" if income_switch.get() else "expense"
         if validate_date(date) and validate_amount(amount):
-            transaction = Transaction(date, float(amount), category, description, transaction_type)
-            add_transaction(user_id, transaction)
+            transaction = Transaction(date, parse_amount(amount), category, description, transaction_type)
+            try:
+                transaction_id = add_transaction(user_id, transaction)
+            except FinanceError as e:
+                messagebox.showerror("Error", str(e))
+                return
             messagebox.showinfo("Success", "Transaction added successfully!")
             clear_entries()
-            refresh_transaction_listbox()
+            transaction_list.insert_row(get_transaction_by_id(user_id, transaction_id))
+            refresh_dashboard()
         else:
             messagebox.showerror("Error", "Invalid input.")
 
@@ -178,53 +418,55 @@ def show_main_window(user_id):
         summary_text = tk.Text(transactions_window, wrap=tk.WORD, width=100, height=20)
         summary_text.pack(padx=10, pady=10)
 
-        rows = view_transactions(user_id)
-        if rows:
-            financials = {}
-            for transaction in rows:
-                year_month = transaction[2][:7]
-                if year_month not in financials:
-                    financials[year_month] = {"income": 0, "expense": 0}
-                if transaction[6] == "income":
-                    financials[year_month]["income"] += transaction[3]
-                else:
-                    financials[year_month]["expense"] += transaction[3]
-
+        from .reports import summary
+        financials = summary(user_id)['by_month']
+        if financials:
             for year_month, values in financials.items():
                 net_amount = values["income"] - values["expense"]
-                summary_text.insert(tk.END, f"{year_month}: Income: ${values['income']:.2f}, Expense: ${values['expense']:.2f}, Net: ${net_amount:.2f}\n")
+                summary_text.insert(tk.END, f"{year_month}: Income: ${format_amount(values['income'])}, Expense: ${format_amount(values['expense'])}, Net: ${format_amount(net_amount)}\n")
         else:
             summary_text.insert(tk.END, "No transactions found.")
 
     def edit_transaction_action():
-        selected_transaction = transaction_listbox.curselection()
+        selected_transaction = transaction_list.selected_row()
         if selected_transaction:
-            transaction_id = transaction_listbox.get(selected_transaction[0]).split('|')[0].strip()
+            transaction_id = selected_transaction.id
             transaction = get_transaction_by_id(user_id, transaction_id)
             if transaction:
                 date_entry.delete(0, tk.END)
-                date_entry.insert(0, transaction[2])
+                date_entry.insert(0, transaction.date)
                 amount_entry.delete(0, tk.END)
-                amount_entry.insert(0, transaction[3])
+                amount_entry.insert(0, format_amount(transaction.amount_cents))
                 category_entry.delete(0, tk.END)
-                category_entry.insert(0, transaction[4])
+                category_entry.insert(0, transaction.category)
                 description_entry.delete(0, tk.END)
-                description_entry.insert(0, transaction[5])
-                income_switch.set(transaction[6] == "income")
+                description_entry.insert(0, transaction.description)
+                income_switch.set(transaction.transaction_type == "income")
                 toggle_income_expense(income_button, income_switch)
 
                 def save_changes():
+                    amount_cents = parse_amount(amount_entry.get())
+                    if not validate_date(date_entry.get()) or amount_cents is None:
+                        messagebox.showerror("Error", "Invalid input.")
+                        return
                     updated_transaction = Transaction(
-                        date_entry.get(), 
-                        float(amount_entry.get()), 
+                        date_entry.get(),
+                        amount_cents,
                         category_entry.get(), 
                         description_entry.get(), 
                         "income" if income_switch.get() else "expense"
                     )
-                    edit_transaction(user_id, transaction_id, updated_transaction.date, updated_transaction.amount, updated_transaction.category, updated_transaction.description, updated_transaction.transaction_type)
+                    try:
+                        edit_transaction(user_id, transaction_id, updated_transaction.date, updated_transaction.amount_cents, updated_transaction.category, updated_transaction.description, updated_transaction.transaction_type)
+                    except FinanceError as e:
+                        messagebox.showerror("Error", str(e))
+                        return
                     messagebox.showinfo("Success", "Transaction updated successfully!")
-                    refresh_transaction_listbox()
+                    updated_row = get_transaction_by_id(user_id, transaction_id)
+                    if updated_row:
+                        transaction_list.update_row(updated_row)
                     clear_entries()
+                    refresh_dashboard()
 
                 save_button = ttk.Button(main_frame, text="Save Changes", command=save_changes)
                 save_button.grid(row=9, column=1, pady=10)
@@ -232,19 +474,21 @@ def show_main_window(user_id):
             messagebox.showerror("Error", "Please select a transaction to edit.")
 
     def delete_transaction_action():
-        selected_transaction = transaction_listbox.curselection()
+        selected_transaction = transaction_list.selected_row()
         if selected_transaction:
-            transaction_id = transaction_listbox.get(selected_transaction[0]).split('|')[0].strip()
-            delete_transaction(user_id, transaction_id)
-            refresh_transaction_listbox()
+            transaction_id = selected_transaction.id
+            try:
+                delete_transaction(user_id, transaction_id)
+            except FinanceError as e:
+                messagebox.showerror("Error", str(e))
+                return
+            transaction_list.delete_row(transaction_id)
+            refresh_dashboard()
         else:
             messagebox.showerror("Error", "Please select a transaction to delete.")
 
-    def refresh_transaction_listbox():
-        transaction_listbox.delete(0, tk.END)
-        rows = view_transactions(user_id)
-        for transaction in rows:
-            transaction_listbox.insert(tk.END, f"{transaction[0]} | Date: {transaction[2]} | Amount: {transaction[3]} | Category: {transaction[4]} | Description: {transaction[5]} | Type: {transaction[6]}")
+    def format_transaction(transaction):
+        return f"{transaction.id} | Date: {transaction.date} | Amount: {format_amount(transaction.amount_cents)} | Category: {transaction.category} | Description: {transaction.description} | Type: {transaction.transaction_type}"
 
     def clear_entries():
         date_entry.delete(0, tk.END)
@@ -286,19 +530,68 @@ def show_main_window(user_id):
     ttk.Button(main_frame, text="Add Transaction", command=add_transaction_action).grid(row=5, column=1, pady=10, sticky="ew")
     ttk.Button(main_frame, text="View Financials", command=view_transactions_action).grid(row=6, column=1, pady=10, sticky="ew")
 
-    transaction_listbox = tk.Listbox(main_frame, height=10)
-    transaction_listbox.grid(row=7, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+    # Only the visible rows are fetched; scrolling pages through the ledger by id
+    transaction_list = VirtualListbox(
+        main_frame,
+        count=lambda: count_transactions(user_id),
+        fetch_after=lambda transaction_id, limit: get_transactions_after(user_id, transaction_id, limit),
+        fetch_before=lambda transaction_id, limit: get_transactions_before(user_id, transaction_id, limit),
+        fetch_at=lambda offset, limit: get_transactions_at(user_id, offset, limit),
+        format_row=format_transaction,
+        row_key=lambda transaction: transaction.id,
+        height=10)
+    transaction_list.grid(row=7, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
 
     ttk.Button(main_frame, text="Edit Transaction", command=edit_transaction_action).grid(row=8, column=0, pady=10, sticky="ew")
     ttk.Button(main_frame, text="Delete Transaction", command=delete_transaction_action).grid(row=8, column=1, pady=10, sticky="ew")
 
+    # Search as you type: the query runs on the worker pool once typing pauses,
+    # and picking a result scrolls the transaction list to it
+    search_var = tk.StringVar()
+    search_after = [None]
+    search_results = []
+
+    def show_search_results(transactions):
+        search_results[:] = transactions
+        results_listbox.delete(0, tk.END)
+        for transaction in transactions:
+            results_listbox.insert(tk.END, format_transaction(transaction))
+
+    def run_search():
+        search_after[0] = None
+        query = search_var.get()
+        runner.submit("search", search_transactions, user_id, query, SEARCH_RESULTS, on_success=show_search_results, description="Search")
+
+    def schedule_search(*args):
+        if search_after[0] is not None:
+            main_window.after_cancel(search_after[0])
+        search_after[0] = main_window.after(SEARCH_DELAY_MS, run_search)
+
+    def show_search_result(event):
+        selection = results_listbox.curselection()
+        if selection and selection[0] < len(search_results):
+            transaction = search_results[selection[0]]
+            transaction_list.show_row(transaction_position(user_id, transaction.id), transaction.id)
+
+    ttk.Label(main_frame, text="Search:").grid(row=10, column=0, padx=10, pady=(10, 0), sticky="e")
+    search_entry = ttk.Entry(main_frame, textvariable=search_var)
+    search_entry.grid(row=10, column=1, padx=10, pady=(10, 0), sticky="ew")
+    search_var.trace_add("write", schedule_search)
+    results_listbox = tk.Listbox(main_frame, height=5, exportselection=False)
+    results_listbox.grid(row=11, column=0, columnspan=2, padx=10, pady=10, sticky="nsew")
+    results_listbox.bind("<<ListboxSelect>>", show_search_result)
+
     # Configure weights to ensure responsiveness
     main_frame.rowconfigure(7, weight=1)  # Make the listbox grow in height
     main_frame.columnconfigure(1, weight=1)  # Make the form elements grow in width
 
-    refresh_transaction_listbox()
+    transaction_list.reload()
+
+    # Recurring transactions that fell due since the last run
+    post_due_transactions(runner, user_id, on_posted, announce=False)
 
     main_window.mainloop()
+    runner.shutdown()
 
 def toggle_income_expense(button, switch):
     if switch.get():
@@ -307,17 +600,3 @@ def toggle_income_expense(button, switch):
     else:
         button.config(text="Income")
         switch.set(True)
-
-def validate_date(date_text):
-    try:
-        datetime.strptime(date_text, '%Y-%m-%d')
-        return True
-    except ValueError:
-        return False
-
-def validate_amount(amount_text):
-    try:
-        amount = float(amount_text)
-        return amount > 0
-    except ValueError:
-        return False
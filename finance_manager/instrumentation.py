@@ -0,0 +1,396 @@
+import atexit
+import json
+import logging
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Timing of database queries, Tk callbacks, background tasks and chart
+# renders. Every measurement becomes an event (a plain dict) that is handed
+# to the registered sinks; with no sinks registered nothing is measured and
+# the hooks cost one attribute check.
+#
+# Events always have kind ('query', 'callback', 'task' or 'render'), name,
+# duration_ms, timestamp and thread. For queries the name is the statement
+# with its whitespace collapsed, and they add rows and caller (the function
+# outside this module that ran the query); slow queries add the EXPLAIN QUERY
+# PLAN output as plan.
+#
+# Sinks can also be set up from the environment, see configure_from_environment().
+
+logger = logging.getLogger("finance_manager.instrumentation")
+
+_sinks = ()
+_sinks_lock = threading.Lock()
+_slow_query_ms = None
+
+def add_sink(sink):
+    global _sinks
+    with _sinks_lock:
+        _sinks = _sinks + (sink,)
+    return sink
+
+def remove_sink(sink):
+    global _sinks
+    with _sinks_lock:
+        _sinks = tuple(existing for existing in _sinks if existing is not sink)
+
+def enabled():
+    return bool(_sinks)
+
+def record(kind, name, duration_ms, **fields):
+    event = {"kind": kind, "name": name, "duration_ms": round(duration_ms, 3),
+             "timestamp": time.time(), "thread": threading.current_thread().name}
+    event.update(fields)
+    for sink in _sinks:
+        try:
+            sink.record(event)
+        except Exception:
+            logger.exception("Instrumentation sink %r failed", sink)
+
+@contextmanager
+def timed(kind, name, **fields):
+    if not _sinks:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, name, (time.perf_counter() - start) * 1000, **fields)
+
+# Sinks. Each one takes an optional filter: only some kinds, only events of
+# at least min_ms, or only slow queries (those that carry a plan).
+class Sink:
+    def __init__(self, kinds=None, min_ms=0.0, slow_only=False):
+        self.kinds = kinds
+        self.min_ms = min_ms
+        self.slow_only = slow_only
+
+    def accepts(self, event):
+        return ((self.kinds is None or event["kind"] in self.kinds)
+                and event["duration_ms"] >= self.min_ms
+                and (not self.slow_only or "plan" in event))
+
+    def record(self, event):
+        if self.accepts(event):
+            self.write(event)
+
+    def write(self, event):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+def format_event(event):
+    text = f"{event['kind']} {event['duration_ms']:.2f} ms {event['name']}"
+    if event["kind"] == "query":
+        text += f" [{event['rows']} rows, {event['caller']}]"
+    for line in event.get("plan", ()):
+        text += f"\n    {line}"
+    return text
+
+# Log records on a logger; slow queries are logged as warnings
+class LoggingSink(Sink):
+    def __init__(self, logger=None, level=logging.DEBUG, **filters):
+        super().__init__(**filters)
+        self.logger = logger or logging.getLogger("finance_manager.profile")
+        self.level = level
+
+    def write(self, event):
+        level = logging.WARNING if "plan" in event else self.level
+        if self.logger.isEnabledFor(level):
+            self.logger.log(level, "%s", format_event(event))
+
+# One JSON object per line, appended to a file
+class JsonFileSink(Sink):
+    def __init__(self, path, **filters):
+        super().__init__(**filters)
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+
+    def write(self, event):
+        line = json.dumps(event, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+# Latency histograms per (kind, name) in memory. Buckets are log-spaced, four
+# per doubling from 10 µs, so percentiles are accurate to about 20%.
+class HistogramSink(Sink):
+    BUCKETS_PER_DOUBLING = 4
+    SMALLEST_MS = 0.01
+
+    def __init__(self, **filters):
+        super().__init__(**filters)
+        self.lock = threading.Lock()
+        self.histograms = {}  # (kind, name) -> [count, total_ms, max_ms, {bucket: count}]
+
+    def _bucket(self, duration_ms):
+        if duration_ms <= self.SMALLEST_MS:
+            return 0
+        return math.ceil(math.log2(duration_ms / self.SMALLEST_MS) * self.BUCKETS_PER_DOUBLING)
+
+    def _bucket_limit(self, bucket):
+        return self.SMALLEST_MS * 2 ** (bucket / self.BUCKETS_PER_DOUBLING)
+
+    def write(self, event):
+        key = (event["kind"], event["name"])
+        duration_ms = event["duration_ms"]
+        bucket = self._bucket(duration_ms)
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [0, 0.0, 0.0, {}]
+            histogram[0] += 1
+            histogram[1] += duration_ms
+            histogram[2] = max(histogram[2], duration_ms)
+            histogram[3][bucket] = histogram[3].get(bucket, 0) + 1
+
+    def _percentile(self, histogram, fraction):
+        count, _, max_ms, buckets = histogram
+        rank = math.ceil(count * fraction)
+        seen = 0
+        for bucket in sorted(buckets):
+            seen += buckets[bucket]
+            if seen >= rank:
+                return min(self._bucket_limit(bucket), max_ms)
+        return max_ms
+
+    # One dict per (kind, name), most total time first
+    def stats(self):
+        with self.lock:
+            histograms = {key: [value[0], value[1], value[2], dict(value[3])] for key, value in self.histograms.items()}
+        stats = [{"kind": kind, "name": name, "count": histogram[0], "total_ms": histogram[1],
+                  "mean_ms": histogram[1] / histogram[0], "p50_ms": self._percentile(histogram, 0.5),
+                  "p95_ms": self._percentile(histogram, 0.95), "max_ms": histogram[2]}
+                 for (kind, name), histogram in histograms.items()]
+        return sorted(stats, key=lambda stat: stat["total_ms"], reverse=True)
+
+    def report(self, limit=20):
+        lines = [f"{'kind':<9} {'count':>7} {'total ms':>10} {'p50':>8} {'p95':>8} {'max':>8}  name"]
+        for stat in self.stats()[:limit]:
+            lines.append(f"{stat['kind']:<9} {stat['count']:>7} {stat['total_ms']:>10.1f} {stat['p50_ms']:>8.2f} "
+                         f"{stat['p95_ms']:>8.2f} {stat['max_ms']:>8.2f}  {stat['name'][:100]}")
+        return "\n".join(lines)
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+
+# Queries taking at least threshold_ms get their plan captured and go to a
+# slow query log: a JSON lines file, or the finance_manager.slow_queries
+# logger when no path is given. None as the threshold turns plans off again.
+def set_slow_query_threshold(threshold_ms):
+    global _slow_query_ms
+    _slow_query_ms = threshold_ms
+
+def enable_slow_query_log(threshold_ms, path=None):
+    set_slow_query_threshold(threshold_ms)
+    if path:
+        return add_sink(JsonFileSink(path, kinds=("query",), slow_only=True))
+    return add_sink(LoggingSink(logging.getLogger("finance_manager.slow_queries"), kinds=("query",), slow_only=True))
+
+# Environment settings, read once at startup:
+#   FINANCE_MANAGER_PROFILE          comma separated sinks: 'log', 'histogram'
+#                                    (printed to stderr at exit) or a file path
+#                                    for JSON lines
+#   FINANCE_MANAGER_SLOW_QUERY_MS    slow query threshold in milliseconds
+#   FINANCE_MANAGER_SLOW_QUERY_LOG   file for the slow query log (default: logging)
+def configure_from_environment(environ=os.environ):
+    for target in filter(None, (part.strip() for part in environ.get("FINANCE_MANAGER_PROFILE", "").split(","))):
+        if target == "log":
+            add_sink(LoggingSink())
+        elif target == "histogram":
+            histogram = add_sink(HistogramSink())
+            atexit.register(lambda: print(histogram.report(), file=sys.stderr))
+        else:
+            atexit.register(add_sink(JsonFileSink(target)).close)
+    if environ.get("FINANCE_MANAGER_SLOW_QUERY_MS"):
+        enable_slow_query_log(float(environ["FINANCE_MANAGER_SLOW_QUERY_MS"]), environ.get("FINANCE_MANAGER_SLOW_QUERY_LOG"))
+
+# The first function on the stack outside this module and contextlib, as
+# module.function:line
+def _caller():
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_globals.get("__name__") in (__name__, "contextlib"):
+        frame = frame.f_back
+    if frame is None:
+        return None
+    code = frame.f_code
+    return f"{frame.f_globals.get('__name__')}.{getattr(code, 'co_qualname', code.co_name)}:{frame.f_lineno}"
+
+def _statement(sql):
+    return " ".join(sql.split())
+
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE", "REPLACE")
+
+# EXPLAIN QUERY PLAN as indented lines, through the base class so the plan
+# query itself is not recorded
+def query_plan(conn, sql, parameters=()):
+    if not sql.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    try:
+        rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    except sqlite3.Error as e:
+        return [f"(no plan: {e})"]
+    depth = {0: -1}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, -1) + 1
+        lines.append("  " * depth[node] + detail)
+    return lines
+
+# Cursor that records each statement once it is finished with: DML right
+# after it runs, SELECTs once their rows are exhausted or the cursor is
+# closed, reused or collected. The duration covers executing and fetching.
+class InstrumentedCursor(sqlite3.Cursor):
+    _pending = None  # [sql, parameters, elapsed seconds, rows, caller]
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        caller = _caller()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = [sql, parameters, time.perf_counter() - start, 0, caller]
+        if self.description is None:
+            self._pending[3] = max(self.rowcount, 0)
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        caller = _caller()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._pending = [sql, None, time.perf_counter() - start, max(self.rowcount, 0), caller]
+        self._finish()
+        return self
+
+    def executescript(self, sql_script):
+        self._finish()
+        caller = _caller()
+        start = time.perf_counter()
+        super().executescript(sql_script)
+        self._pending = [sql_script, None, time.perf_counter() - start, 0, caller]
+        self._finish()
+        return self
+
+    def _fetched(self, start, rows, exhausted):
+        pending = self._pending
+        if pending is not None:
+            pending[2] += time.perf_counter() - start
+            pending[3] += rows
+            if exhausted:
+                self._finish()
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(start, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        start = time.perf_counter()
+        rows = super().fetchmany(size)
+        self._fetched(start, len(rows), len(rows) < size)
+        return rows
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(start, len(rows), True)
+        return rows
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(start, 0, True)
+            raise
+        self._fetched(start, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+    def _finish(self):
+        pending = self._pending
+        if pending is None:
+            return
+        self._pending = None
+        sql, parameters, elapsed, rows, caller = pending
+        duration_ms = elapsed * 1000
+        fields = {"rows": rows, "caller": caller}
+        if _slow_query_ms is not None and duration_ms >= _slow_query_ms and parameters is not None:
+            fields["plan"] = query_plan(self.connection, sql, parameters)
+        record("query", _statement(sql), duration_ms, **fields)
+
+# Connection whose cursors are instrumented while any sink is registered.
+# database.connect() opens every connection with it.
+class InstrumentedConnection(sqlite3.Connection):
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = InstrumentedCursor if _sinks else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if not _sinks:
+            return super().execute(sql, parameters)
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if not _sinks:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        if not _sinks:
+            return super().commit()
+        caller = _caller()
+        start = time.perf_counter()
+        super().commit()
+        record("query", "COMMIT", (time.perf_counter() - start) * 1000, rows=0, caller=caller)
+
+# Time every Python callback Tk runs (commands, bindings, after() callbacks)
+# by wrapping tkinter's CallWrapper. Safe to call more than once.
+def instrument_tk():
+    import tkinter
+    if getattr(tkinter.CallWrapper, "instrumented", False):
+        return
+
+    class TimedCallWrapper(tkinter.CallWrapper):
+        instrumented = True
+
+        def __call__(self, *args):
+            if not _sinks:
+                return super().__call__(*args)
+            start = time.perf_counter()
+            try:
+                return super().__call__(*args)
+            finally:
+                record("callback", _callable_name(self.func), (time.perf_counter() - start) * 1000)
+
+    tkinter.CallWrapper = TimedCallWrapper
+
+def _callable_name(func):
+    name = getattr(func, "__qualname__", None) or repr(func)
+    if name.endswith("after.<locals>.callit"):
+        # after() wraps the callback in a closure that carries its name
+        name = f"after:{func.__name__}"
+    return name
@@ -1,10 +1,164 @@
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+# Money is handled as integer minor units (cents) everywhere below the GUI,
+# so sums are exact no matter how many rows they cover.
+#
+# Transactions are slotted: no per-instance __dict__, which matters when a
+# whole ledger is loaded. Rows read from the database also carry id and
+# user_id; new transactions leave them as None.
 class Transaction:
-    def __init__(self, date, amount, category, description, transaction_type="expense"):
+    __slots__ = ('id', 'user_id', 'date', 'amount_cents', 'category', 'description', 'transaction_type')
+
+    def __init__(self, date, amount_cents, category, description, transaction_type="expense", id=None, user_id=None):
+        self.id = id
+        self.user_id = user_id
         self.date = date
-        self.amount = amount
+        self.amount_cents = amount_cents
         self.category = category
         self.description = description
         self.transaction_type = transaction_type  # 'income' or 'expense'
 
+    # Build from a row in TRANSACTION_COLUMNS order without going through
+    # __init__'s keyword handling
+    @classmethod
+    def from_row(cls, row):
+        transaction = cls.__new__(cls)
+        (transaction.id, transaction.user_id, transaction.date, transaction.amount_cents,
+         transaction.category, transaction.description, transaction.transaction_type) = row
+        return transaction
+
+    def __eq__(self, other):
+        if not isinstance(other, Transaction):
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self.__slots__)
+
+    def __repr__(self):
+        return f"Transaction(id={self.id!r}, date={self.date!r}, amount_cents={self.amount_cents!r}, category={self.category!r}, transaction_type={self.transaction_type!r})"
+
     def __str__(self):
-        return f"{self.date} | {self.amount} | {self.category} | {self.description} | {self.transaction_type}"
+        return f"{self.date} | {format_amount(self.amount_cents)} | {self.category} | {self.description} | {self.transaction_type}"
+
+# Column order expected by Transaction.from_row
+TRANSACTION_COLUMNS = "id, user_id, date, amount_cents, category, description, transaction_type"
+
+# sqlite3 row factory: cursor.row_factory = transaction_row_factory
+def transaction_row_factory(cursor, row):
+    return Transaction.from_row(row)
+
+# Column-oriented view of many transactions for whole-ledger analytics. Each
+# field is one NumPy array instead of one Python object per row:
+#
+#   ids            int64
+#   days           int32, days since 1970-01-01
+#   amounts_cents  int64
+#   category_codes int32, indexes into categories
+#   is_income      bool
+class TransactionBatch:
+    __slots__ = ('ids', 'days', 'amounts_cents', 'category_codes', 'is_income', 'categories')
+
+    def __init__(self, ids, days, amounts_cents, category_codes, is_income, categories):
+        self.ids = ids
+        self.days = days
+        self.amounts_cents = amounts_cents
+        self.category_codes = category_codes
+        self.is_income = is_income
+        self.categories = categories
+
+    # Read (id, date, amount_cents, category, is_income) rows from a cursor in
+    # chunks, so only one chunk of Python tuples exists at a time. Categories
+    # can be names or ids; category_name maps them for the categories list.
+    @classmethod
+    def from_cursor(cls, cursor, chunk_size=50000, category_name=None):
+        import numpy as np  # Deferred: only batch loads need NumPy
+
+        codes = {}
+        columns = ([], [], [], [], [])
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            ids, dates, amounts, categories, incomes = zip(*rows)
+            columns[0].append(np.array(ids, dtype=np.int64))
+            columns[1].append(np.array(dates, dtype='datetime64[D]').astype(np.int32))
+            columns[2].append(np.array(amounts, dtype=np.int64))
+            columns[3].append(np.array([codes.setdefault(category, len(codes)) for category in categories], dtype=np.int32))
+            columns[4].append(np.array(incomes, dtype=bool))
+        if not columns[0]:
+            empty = [np.empty(0, dtype=dtype) for dtype in (np.int64, np.int32, np.int64, np.int32, bool)]
+            return cls(*empty, [])
+        categories = [category_name(category) for category in codes] if category_name else list(codes)
+        return cls(*(np.concatenate(column) for column in columns), categories)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def dates(self):
+        return self.days.astype('datetime64[D]')
+
+    def signed_amounts(self):
+        import numpy as np
+        return np.where(self.is_income, self.amounts_cents, -self.amounts_cents)
+
+    def totals(self):
+        income = int(self.amounts_cents[self.is_income].sum())
+        expense = int(self.amounts_cents[~self.is_income].sum())
+        return income, expense
+
+    # Exact int64 totals per category for one type: {category: cents}
+    def totals_by_category(self, income=False):
+        import numpy as np
+
+        mask = self.is_income if income else ~self.is_income
+        sums = np.zeros(len(self.categories), dtype=np.int64)
+        np.add.at(sums, self.category_codes[mask], self.amounts_cents[mask])
+        counts = np.bincount(self.category_codes[mask], minlength=len(self.categories))
+        return {self.categories[code]: int(sums[code]) for code in np.flatnonzero(counts)}
+
+# Input validation shared by the GUI and the CSV importer. The parse_*
+# helpers return the cleaned value, or None when the input is invalid.
+def parse_date(date_text):
+    # Fast path for the canonical YYYY-MM-DD form
+    if len(date_text) == 10 and date_text[4] == '-' and date_text[7] == '-':
+        try:
+            return date.fromisoformat(date_text).isoformat()
+        except ValueError:
+            return None
+    try:
+        return datetime.strptime(date_text, '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return None
+
+# Returns the amount in cents (see to_cents), or None unless it is positive
+def parse_amount(amount_text):
+    try:
+        cents = to_cents(amount_text)
+    except (InvalidOperation, ValueError):
+        return None
+    return cents if cents > 0 else None
+
+# Category names are compared without regard to case or runs of whitespace,
+# so "Food", "food " and "FOOD" are one category. normalize_category gives the
+# spelling that is stored, category_key the form categories are matched on.
+def normalize_category(category):
+    return " ".join(str(category).split()) if category is not None else ''
+
+def category_key(category):
+    return normalize_category(category).casefold()
+
+# The one rule for turning an amount (a number or its text) into cents: its
+# decimal value rounded half up to the cent. The migration to integer cents
+# (database.convert_amounts_to_cents) does the same in SQL.
+def to_cents(amount):
+    return int(Decimal(str(amount).strip()).quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+
+def format_amount(cents):
+    sign = '-' if cents < 0 else ''
+    units, remainder = divmod(abs(int(cents)), 100)
+    return f"{sign}{units}.{remainder:02}"
+
+def validate_date(date_text):
+    return parse_date(date_text) is not None
+
+def validate_amount(amount_text):
+    return parse_amount(amount_text) is not None
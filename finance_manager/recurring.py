@@ -0,0 +1,140 @@
+import calendar
+from collections import namedtuple
+from datetime import date, timedelta
+
+from .balances import current_balance
+from .categories import TYPE_IDS, category_id
+from .database import get_connection
+from .errors import ValidationError
+from .models import parse_date
+from .transactions import _record_change, _validated, unit_of_work
+
+# Recurring transactions. A rule is a template transaction plus a schedule;
+# occurrence n of a rule is computed from its start date, so a monthly rule
+# started on the 31st lands on the last day of shorter months without
+# drifting. materialize_due() writes every occurrence that is due, for all
+# rules at once; forecast() projects the rules forward without writing.
+
+INTERVALS = ('daily', 'weekly', 'monthly', 'yearly')
+DAY_STEPS = {'daily': 1, 'weekly': 7}
+MONTH_STEPS = {'monthly': 1, 'yearly': 12}
+
+Rule = namedtuple('Rule', "id user_id amount_cents category description transaction_type interval every start_date end_date next_date generated category_id type_id")
+# Rules with their category and type names, in Rule's field order
+RULE_QUERY = '''SELECT r.id, r.user_id, r.amount_cents, c.name, r.description, y.name, r.interval, r.every,
+                       r.start_date, r.end_date, r.next_date, r.generated, r.category_id, r.type_id
+                FROM recurring_rules r
+                JOIN categories c ON c.id = r.category_id
+                JOIN transaction_types y ON y.id = r.type_id'''
+
+INSERT_OCCURRENCE = '''INSERT OR IGNORE INTO transactions (user_id, date, amount_cents, category_id, description, type_id, recurring_rule_id)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)'''
+
+# Date of occurrence number (0 is the start date)
+def occurrence(rule, number):
+    start = date.fromisoformat(rule.start_date)
+    if rule.interval in DAY_STEPS:
+        return start + timedelta(days=DAY_STEPS[rule.interval] * rule.every * number)
+    year, month = divmod(start.month - 1 + number * rule.every * MONTH_STEPS[rule.interval], 12)
+    year += start.year
+    return date(year, month + 1, min(start.day, calendar.monthrange(year, month + 1)[1]))
+
+# The transaction's date is the first occurrence. Returns the rule id;
+# nothing is written to transactions until materialize_due() runs.
+def add_recurring_rule(user_id, transaction, interval, every=1, end_date=None):
+    if interval not in INTERVALS:
+        raise ValidationError(f"Invalid interval: {interval!r}")
+    if not isinstance(every, int) or isinstance(every, bool) or every <= 0:
+        raise ValidationError(f"Invalid repeat count: {every!r}")
+    start_date = _validated('date', transaction.date)
+    if end_date is not None:
+        end_date = parse_date(end_date) if isinstance(end_date, str) else None
+        if end_date is None or end_date < start_date:
+            raise ValidationError("The end date must be a date on or after the start date.")
+    amount_cents = _validated('amount_cents', transaction.amount_cents)
+    type_id = TYPE_IDS[_validated('transaction_type', transaction.transaction_type)]
+    with unit_of_work() as conn:
+        values = (user_id, amount_cents, category_id(transaction.category), transaction.description,
+                  type_id, interval, every, start_date, end_date, start_date)
+        return conn.execute('''INSERT INTO recurring_rules
+                            (user_id, amount_cents, category_id, description, type_id, interval, every, start_date, end_date, next_date)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', values).lastrowid
+
+# Transactions already written for the rule are kept
+def delete_recurring_rule(user_id, rule_id):
+    with unit_of_work() as conn:
+        return conn.execute("DELETE FROM recurring_rules WHERE id = ? AND user_id = ?", (rule_id, user_id)).rowcount > 0
+
+def get_recurring_rules(user_id):
+    rows = get_connection().execute(f"{RULE_QUERY} WHERE r.user_id = ? ORDER BY r.id", (user_id,))
+    return [Rule(*row) for row in rows]
+
+# Write every occurrence dated up to and including up_to (default today) for
+# all rules, or one user's, in a single batched insert. Returns the number of
+# transactions written. Safe to run any number of times: each rule resumes
+# at its next_date, and an occurrence that already exists is skipped.
+def materialize_due(up_to=None, user_id=None):
+    up_to = parse_date(up_to) if up_to else date.today().isoformat()
+    if up_to is None:
+        raise ValidationError("Invalid date.")
+    query = f"{RULE_QUERY} WHERE r.next_date <= ?"
+    params = [up_to]
+    if user_id is not None:
+        query += " AND r.user_id = ?"
+        params.append(user_id)
+
+    with unit_of_work() as conn:
+        occurrences, progress = [], []
+        for rule in map(Rule._make, conn.execute(query, params).fetchall()):
+            last = min(up_to, rule.end_date) if rule.end_date else up_to
+            number = rule.generated
+            day = occurrence(rule, number).isoformat()
+            while day <= last:
+                occurrences.append((rule.user_id, day, rule.amount_cents, rule.category_id, rule.description, rule.type_id, rule.id))
+                number += 1
+                day = occurrence(rule, number).isoformat()
+            progress.append((day if not rule.end_date or day <= rule.end_date else None, number, rule.id))
+            _record_change(rule.user_id)
+        written = conn.executemany(INSERT_OCCURRENCE, occurrences).rowcount if occurrences else 0
+        conn.executemany("UPDATE recurring_rules SET next_date = ?, generated = ? WHERE id = ?", progress)
+    return written
+
+# Occurrences of a rule in one calendar month that are not written yet.
+# Constant time whatever the interval, so long projections stay cheap.
+def _count_in_month(rule, year, month):
+    first = date(year, month, 1)
+    last = date(year, month, calendar.monthrange(year, month)[1])
+    low = max(first, date.fromisoformat(rule.next_date))
+    high = min(last, date.fromisoformat(rule.end_date)) if rule.end_date else last
+    if low > high:
+        return 0
+    start = date.fromisoformat(rule.start_date)
+    if rule.interval in DAY_STEPS:
+        step = DAY_STEPS[rule.interval] * rule.every
+        first_number = max(0, -(-(low - start).days // step))
+        last_number = (high - start).days // step
+        return max(0, last_number - first_number + 1)
+    step = MONTH_STEPS[rule.interval] * rule.every
+    offset = (year - start.year) * 12 + month - start.month
+    if offset < 0 or offset % step:
+        return 0
+    return 1 if low <= occurrence(rule, offset // step) <= high else 0
+
+# Projected cash flow from the user's rules for `months` calendar months
+# starting with the current one, without writing anything:
+# [(year_month, income_cents, expense_cents, balance_cents)], where the
+# balance starts from the net of every transaction recorded so far.
+def forecast(user_id, months=12, today=None):
+    today = today or date.today()
+    rules = [rule for rule in get_recurring_rules(user_id) if rule.next_date]
+    balance = current_balance(user_id)
+    year, month = today.year, today.month
+    projection = []
+    for _ in range(months):
+        totals = {'income': 0, 'expense': 0}
+        for rule in rules:
+            totals[rule.transaction_type] += rule.amount_cents * _count_in_month(rule, year, month)
+        balance += totals['income'] - totals['expense']
+        projection.append((f"{year:04}-{month:02}", totals['income'], totals['expense'], balance))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return projection
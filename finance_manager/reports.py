@@ -1,50 +1,118 @@
-from .database import c
+import threading
+
+from .aggregation import EXPENSE, INCOME, date_range_totals, next_year_month, period_totals
+from .categories import TYPE_NAMES, category_name
+from .database import get_connection, get_data_version
+from .export import format_for_path, iter_chunks, write_rows
+from .models import format_amount
+from .recurring import forecast
+
+# Per-user summary cache: user_id -> (data version, summary)
+_summary_cache = {}
+_summary_lock = threading.Lock()
+
+# Totals, per-month totals and per-category totals for a user, all folded from
+# one read of the monthly rollup. Results are memoized until the next write
+# to the user's transactions bumps their data version.
+#
+# Amounts are integer cents:
+#
+#   {'income': int, 'expense': int, 'net': int,
+#    'by_month': {'YYYY-MM': {'income': int, 'expense': int}},
+#    'by_category': {'income': {category: int}, 'expense': {category: int}}}
+def summary(user_id):
+    version = get_data_version(user_id)
+    cached = _summary_cache.get(user_id)
+    if cached and cached[0] == version:
+        return cached[1]
+
+    result = {'income': 0, 'expense': 0, 'by_month': {}, 'by_category': {'income': {}, 'expense': {}}}
+    rows = get_connection().execute("SELECT year_month, type_id, category_id, total_cents FROM monthly_rollups WHERE user_id = ? ORDER BY year_month", (user_id,))
+    for year_month, type_id, category, total in rows:
+        transaction_type = TYPE_NAMES.get(type_id)
+        if transaction_type is None:
+            continue
+        category = category_name(category)
+        result[transaction_type] += total
+        month = result['by_month'].setdefault(year_month, {'income': 0, 'expense': 0})
+        month[transaction_type] += total
+        categories = result['by_category'][transaction_type]
+        categories[category] = categories.get(category, 0) + total
+    result['net'] = result['income'] - result['expense']
+
+    with _summary_lock:
+        _summary_cache[user_id] = (version, result)
+    return result
 
 def generate_monthly_report(user_id, year, month):
     try:
-        c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'income' AND strftime('%Y', date) = ? AND strftime('%m', date) = ?", (user_id, year, month))
-        income = c.fetchone()[0] or 0
-        c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'expense' AND strftime('%Y', date) = ? AND strftime('%m', date) = ?", (user_id, year, month))
-        expenses = c.fetchone()[0] or 0
+        year_month = f"{int(year):04}-{int(month):02}"
+        income, expenses = period_totals(user_id, year_month, next_year_month(year_month))
     except Exception as e:
         return f"An error occurred while generating the monthly report: {e}"
 
     report = f"\n--- {month}-{year} Report ---\n"
-    report += f"Total Income: ${income:.2f}\n"
-    report += f"Total Expenses: ${expenses:.2f}\n"
-    report += f"Net Savings: ${income - expenses:.2f}\n"
-    
+    report += f"Total Income: ${format_amount(income)}\n"
+    report += f"Total Expenses: ${format_amount(expenses)}\n"
+    report += f"Net Savings: ${format_amount(income - expenses)}\n"
+
     return report
 
 def generate_yearly_summary(user_id, year):
     try:
-        c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'income' AND strftime('%Y', date) = ?", (user_id, year))
-        income = c.fetchone()[0] or 0
-        c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'expense' AND strftime('%Y', date) = ?", (user_id, year))
-        expenses = c.fetchone()[0] or 0
+        income, expenses = period_totals(user_id, f"{int(year):04}-01", f"{int(year) + 1:04}-01")
     except Exception as e:
         return f"An error occurred while generating the yearly summary: {e}"
 
     report = f"\n--- {year} Yearly Summary ---\n"
-    report += f"Total Income: ${income:.2f}\n"
-    report += f"Total Expenses: ${expenses:.2f}\n"
-    report += f"Net Savings: ${income - expenses:.2f}\n"
-    
+    report += f"Total Income: ${format_amount(income)}\n"
+    report += f"Total Expenses: ${format_amount(expenses)}\n"
+    report += f"Net Savings: ${format_amount(income - expenses)}\n"
+
+    return report
+
+# Cash flow projected from the user's recurring rules, month by month
+def generate_forecast_report(user_id, months=12):
+    try:
+        projection = forecast(user_id, months)
+    except Exception as e:
+        return f"An error occurred while generating the forecast: {e}"
+
+    report = f"\n--- Forecast for the next {months} months ---\n"
+    for year_month, income, expenses, balance in projection:
+        report += f"{year_month}: Income: ${format_amount(income)}, Expenses: ${format_amount(expenses)}, Balance: ${format_amount(balance)}\n"
+
     return report
 
 def generate_custom_report(user_id, start_date, end_date):
     try:
-        c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'income' AND date BETWEEN ? AND ?", (user_id, start_date, end_date))
-        income = c.fetchone()[0] or 0
-        c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'expense' AND date BETWEEN ? AND ?", (user_id, start_date, end_date))
-        expenses = c.fetchone()[0] or 0
+        income, expenses = date_range_totals(user_id, start_date, end_date)
     except Exception as e:
         print(f"An error occurred while generating the custom report: {e}")
         return
 
     print(f"\n--- Report from {start_date} to {end_date} ---")
-    print(f"Total Income: ${income:.2f}")
-    print(f"Total Expenses: ${expenses:.2f}")
-    print(f"Net Savings: ${income - expenses:.2f}")
-
+    print(f"Total Income: ${format_amount(income)}")
+    print(f"Total Expenses: ${format_amount(expenses)}")
+    print(f"Net Savings: ${format_amount(income - expenses)}")
 
+# Income, expenses and net per month from the rollup, for months in
+# [start_month, end_month) given as 'YYYY-MM', streamed to a CSV, JSON Lines,
+# Parquet or Arrow file (the binary formats keep integer cents). Returns the
+# number of months written.
+def export_monthly_summary(user_id, path, fmt=None, start_month=None, end_month=None, chunk_size=1000):
+    query = f"SELECT year_month, SUM(CASE WHEN type_id = {INCOME} THEN total_cents ELSE 0 END) AS income, SUM(CASE WHEN type_id = {EXPENSE} THEN total_cents ELSE 0 END) AS expense FROM monthly_rollups WHERE user_id = ?"
+    params = [user_id]
+    if start_month:
+        query += " AND year_month >= ?"
+        params.append(start_month)
+    if end_month:
+        query += " AND year_month < ?"
+        params.append(end_month)
+    cursor = get_connection().execute(f"SELECT year_month, income, expense, income - expense FROM ({query} GROUP BY year_month) ORDER BY year_month", params)
+    fmt = fmt or format_for_path(path)
+    if fmt in ('csv', 'jsonl'):
+        columns = ['month', 'income', 'expense', 'net']
+        return write_rows(iter_chunks(cursor, chunk_size), path, columns, fmt, convert=dict.fromkeys(columns[1:], format_amount))
+    columns = ['month', 'income_cents', 'expense_cents', 'net_cents']
+    return write_rows(iter_chunks(cursor, chunk_size), path, columns, fmt, types=dict.fromkeys(columns[1:], 'int64'))
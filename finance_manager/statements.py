@@ -0,0 +1,146 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from . import database
+from .aggregation import next_year_month
+from .categories import TYPE_NAMES, category_name
+from .models import format_amount
+
+# Period statements for every user at once, for batch jobs such as month-end
+# runs. All users are covered by one grouped scan of monthly_rollups in user
+# order, so each statement is complete (and can be written out) as soon as
+# the scan moves on to the next user. With workers > 1 the users are split
+# into contiguous id ranges, each scanned and written by a worker process
+# over its own read-only connection.
+#
+# Statements are dicts with amounts in integer cents:
+#
+#   {'user_id': int, 'username': str, 'start_month': 'YYYY-MM', 'end_month': 'YYYY-MM',
+#    'income': int, 'expense': int, 'net': int, 'count': int,
+#    'by_category': {'income': {category: int}, 'expense': {category: int}}}
+
+MIN_ID, MAX_ID = -2 ** 63, 2 ** 63 - 1
+SHARDS_PER_WORKER = 4  # smaller shards even out users with very different activity
+
+# Users in id order, each joined to its rollup rows through the rollup's
+# primary key. There is no GROUP BY or ORDER BY that would need a sort, so
+# rows stream out as the scan goes; months are summed while reading, and
+# category names are attached from the category cache.
+STATEMENT_QUERY = '''SELECT u.id, u.username, r.type_id, r.category_id, r.total_cents, r.count
+                     FROM users u
+                     LEFT JOIN monthly_rollups r ON r.user_id = u.id AND r.year_month >= ? AND r.year_month < ?
+                     WHERE u.id BETWEEN ? AND ?
+                     ORDER BY u.id'''
+
+# Statements for months in [start_month, end_month) (default: just
+# start_month), one per user with an id in [first_user, last_user], in id
+# order. Users without transactions in the period get an all-zero statement.
+def iter_statements(start_month, end_month=None, first_user=None, last_user=None):
+    end_month = end_month or next_year_month(start_month)
+    rows = database.get_connection().execute(STATEMENT_QUERY, (start_month, end_month,
+                                                              MIN_ID if first_user is None else first_user,
+                                                              MAX_ID if last_user is None else last_user))
+    statement = None
+    for user_id, username, type_id, category, total, count in rows:
+        if statement is None or statement['user_id'] != user_id:
+            if statement is not None:
+                yield statement
+            statement = {'user_id': user_id, 'username': username, 'start_month': start_month, 'end_month': end_month,
+                         'income': 0, 'expense': 0, 'net': 0, 'count': 0, 'by_category': {'income': {}, 'expense': {}}}
+        transaction_type = TYPE_NAMES.get(type_id)
+        if transaction_type is not None:
+            category = category_name(category)
+            statement[transaction_type] += total
+            statement['net'] += total if transaction_type == 'income' else -total
+            statement['count'] += count
+            categories = statement['by_category'][transaction_type]
+            categories[category] = categories.get(category, 0) + total
+    if statement is not None:
+        yield statement
+
+def render_statement(statement):
+    start_month, end_month = statement['start_month'], statement['end_month']
+    period = start_month if next_year_month(start_month) == end_month else f"{start_month} up to {end_month}"
+    report = f"\n--- Statement for {statement['username']} ({period}) ---\n"
+    report += f"Transactions: {statement['count']}\n"
+    report += f"Total Income: ${format_amount(statement['income'])}\n"
+    report += f"Total Expenses: ${format_amount(statement['expense'])}\n"
+    report += f"Net Savings: ${format_amount(statement['net'])}\n"
+    for transaction_type, title in (('income', "Income"), ('expense', "Expenses")):
+        categories = statement['by_category'][transaction_type]
+        if categories:
+            report += f"\n{title} by category:\n"
+            for category, total in sorted(categories.items(), key=lambda item: (-item[1], item[0] or '')):
+                report += f"  {category or '(none)'}: ${format_amount(total)}\n"
+    return report
+
+def statement_path(out_dir, statement):
+    return os.path.join(out_dir, f"statement-{statement['user_id']}-{statement['start_month']}.txt")
+
+def _write_text(out_dir, statement):
+    with open(statement_path(out_dir, statement), 'w', encoding='utf-8') as statement_file:
+        statement_file.write(render_statement(statement))
+
+# Scan one id range and write each statement as soon as it is complete.
+# Returns the statements when collect is set, else just how many there were.
+def _write_shard(start_month, end_month, first_user, last_user, out_dir, collect):
+    statements = []
+    count = 0
+    for statement in iter_statements(start_month, end_month, first_user, last_user):
+        if out_dir:
+            _write_text(out_dir, statement)
+        if collect:
+            statements.append(statement)
+        count += 1
+    return statements if collect else count
+
+def _start_worker(db_path):
+    database.DB_PATH = db_path
+    database.use_readonly_connection()
+
+# Contiguous (first, last) user id ranges with about the same number of users
+def _shards(count):
+    ids = [row[0] for row in database.get_connection().execute("SELECT id FROM users ORDER BY id")]
+    size = max(1, -(-len(ids) // count))
+    return [(ids[start], ids[min(start + size, len(ids)) - 1]) for start in range(0, len(ids), size)]
+
+# Write a rendered statement per user into out_dir (statement-<user>-<month>.txt)
+# and/or the structured statements as JSON Lines to jsonl_path, streaming
+# both as statements are completed. Returns (statements written, seconds).
+def write_statements(start_month, end_month=None, out_dir=None, jsonl_path=None, workers=1):
+    end_month = end_month or next_year_month(start_month)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+    start = time.perf_counter()
+    jsonl_file = open(jsonl_path, 'w', encoding='utf-8') if jsonl_path else None
+    written = 0
+    try:
+        if workers <= 1:
+            for statement in iter_statements(start_month, end_month):
+                if out_dir:
+                    _write_text(out_dir, statement)
+                if jsonl_file:
+                    jsonl_file.write(json.dumps(statement) + "\n")
+                written += 1
+        else:
+            # Worker processes are spawned rather than forked, so none of them
+            # inherits this process's open connection
+            with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                                     initializer=_start_worker, initargs=(database.DB_PATH,)) as pool:
+                futures = [pool.submit(_write_shard, start_month, end_month, first, last, out_dir, jsonl_file is not None)
+                           for first, last in _shards(workers * SHARDS_PER_WORKER)]
+                for future in as_completed(futures):
+                    result = future.result()
+                    if jsonl_file:
+                        for statement in result:
+                            jsonl_file.write(json.dumps(statement) + "\n")
+                        written += len(result)
+                    else:
+                        written += result
+    finally:
+        if jsonl_file:
+            jsonl_file.close()
+    return written, time.perf_counter() - start
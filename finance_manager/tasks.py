@@ -0,0 +1,74 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import instrumentation
+
+# Runs slow work (queries, aggregation, report formatting) on a worker pool
+# and hands the result back on the Tk thread. Tk is not thread-safe, so the
+# workers never touch widgets: the Tk thread polls the futures with after().
+#
+# Every task has a key. Submitting a new task under a key that is still
+# running cancels the older one, and its result is dropped if it finishes
+# anyway, so only the most recent request for e.g. "report" is ever shown.
+class TaskRunner:
+    def __init__(self, root, max_workers=2, poll_interval=50, on_status=None):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.on_status = on_status  # called with a description, or None when idle
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="finance-worker")
+        self.generations = {}
+        self.running = {}
+
+    def submit(self, key, func, *args, on_success=None, on_error=None, description=None):
+        return self.watch(key, self.executor.submit(func, *args), on_success=on_success, on_error=on_error, description=description)
+
+    # Deliver the result of a future started elsewhere (e.g. on another pool)
+    # the same way as a submitted task
+    def watch(self, key, future, on_success=None, on_error=None, description=None):
+        generation = self.generations.get(key, 0) + 1
+        self.generations[key] = generation
+        previous = self.running.pop(key, None)
+        if previous is not None:
+            previous[0].cancel()
+
+        self.running[key] = (future, description or key)
+        self._update_status()
+        self.root.after(self.poll_interval, self._poll, key, generation, future, on_success, on_error, time.perf_counter())
+        return future
+
+    def cancel(self, key):
+        self.generations[key] = self.generations.get(key, 0) + 1
+        previous = self.running.pop(key, None)
+        if previous is not None:
+            previous[0].cancel()
+        self._update_status()
+
+    def shutdown(self):
+        self.running.clear()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def _poll(self, key, generation, future, on_success, on_error, started):
+        if not future.done():
+            self.root.after(self.poll_interval, self._poll, key, generation, future, on_success, on_error, started)
+            return
+        if self.generations.get(key) != generation or future.cancelled():
+            return  # A newer request replaced this one
+        del self.running[key]
+        self._update_status()
+        # Time from submission until the result reached the Tk thread
+        if instrumentation.enabled():
+            instrumentation.record("task", key, (time.perf_counter() - started) * 1000, failed=future.exception() is not None)
+
+        error = future.exception()
+        if error is not None:
+            if on_error:
+                on_error(error)
+            else:
+                print(f"An error occurred while running {key}: {error}")
+        elif on_success:
+            on_success(future.result())
+
+    def _update_status(self):
+        if self.on_status:
+            descriptions = [description for _, description in self.running.values()]
+            self.on_status(", ".join(descriptions) if descriptions else None)
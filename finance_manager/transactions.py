@@ -1,22 +1,158 @@
-from .database import c, conn
+import csv
+import heapq
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from itertools import islice
+from operator import attrgetter, itemgetter
 
-def add_transaction(user_id, transaction):
+from .categories import TYPE_IDS, category_id, category_name, find_category_id
+from .database import bump_data_version, get_connection, has_archive, transaction as db_transaction
+from .errors import StorageError, TransactionNotFound, ValidationError
+from .export import format_for_path, iter_chunks, write_rows
+from .models import TRANSACTION_COLUMNS, TransactionBatch, format_amount, parse_amount, parse_date, transaction_row_factory
+
+TRANSACTION_TYPES = ('income', 'expense')
+UPDATABLE_COLUMNS = ('date', 'amount_cents', 'category', 'description', 'transaction_type')
+INSERT_TRANSACTION = "INSERT INTO transactions (user_id, date, amount_cents, category_id, description, type_id) VALUES (?, ?, ?, ?, ?, ?)"
+# Category and type are stored as ids (see categories.py)
+STORED_COLUMNS = {'category': 'category_id', 'transaction_type': 'type_id'}
+ID_CHUNK_SIZE = 500  # ids per IN (...) list, well under SQLite's variable limit
+
+# Users whose data the current thread's unit of work has changed, or None
+# outside a unit of work
+_unit = threading.local()
+
+# Groups any number of writes into one database transaction (one commit, one
+# fsync). Nested units join the outermost one. Database errors are raised as
+# StorageError after the rollback; on commit the data version of every user
+# touched is bumped once.
+#
+#   with unit_of_work():
+#       add_transactions(user_id, new_rows)
+#       bulk_update(user_id, ids, category="Groceries")
+@contextmanager
+def unit_of_work():
+    if getattr(_unit, 'changed', None) is not None:
+        yield get_connection()
+        return
+    _unit.changed = changed = set()
     try:
-        c.execute("INSERT INTO transactions (user_id, date, amount, category, description, transaction_type) VALUES (?, ?, ?, ?, ?, ?)",
-                  (user_id, transaction.date, transaction.amount, transaction.category, transaction.description, transaction.transaction_type))
-        conn.commit()
-    except Exception as e:
-        print(f"An error occurred while adding the transaction: {e}")
+        with db_transaction() as conn:
+            yield conn
+    except sqlite3.Error as e:
+        raise StorageError(f"The database rejected the change: {e}") from e
+    finally:
+        _unit.changed = None
+    for user_id in changed:
+        bump_data_version(user_id)
+
+def _record_change(user_id):
+    _unit.changed.add(user_id)
+
+# Normalized value for a column, or ValidationError
+def _validated(column, value):
+    if column == 'date':
+        date = parse_date(value) if isinstance(value, str) else None
+        if date is None:
+            raise ValidationError(f"Invalid date: {value!r}")
+        return date
+    if column == 'amount_cents':
+        if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+            raise ValidationError(f"Invalid amount in cents: {value!r}")
+        return value
+    if column == 'transaction_type' and value not in TRANSACTION_TYPES:
+        raise ValidationError(f"Invalid transaction type: {value!r}")
+    return value
+
+# Value of a column as stored in the transactions table
+def _stored(column, value):
+    value = _validated(column, value)
+    if column == 'category':
+        return category_id(value)
+    if column == 'transaction_type':
+        return TYPE_IDS[value]
+    return value
+
+def _insert_row(user_id, transaction):
+    return (user_id, _validated('date', transaction.date), _validated('amount_cents', transaction.amount_cents),
+            _stored('category', transaction.category), transaction.description, _stored('transaction_type', transaction.transaction_type))
+
+def _id_chunks(ids):
+    for start in range(0, len(ids), ID_CHUNK_SIZE):
+        chunk = ids[start:start + ID_CHUNK_SIZE]
+        yield chunk, ", ".join("?" * len(chunk))
+
+def _check_ids_exist(conn, user_id, ids):
+    found = set()
+    for chunk, placeholders in _id_chunks(ids):
+        found.update(row[0] for row in conn.execute(f"SELECT id FROM transactions WHERE user_id = ? AND id IN ({placeholders})", (user_id, *chunk)))
+    if len(found) < len(ids):
+        raise TransactionNotFound(set(ids) - found)
+
+# Insert Transaction objects from any iterable, streaming them into one
+# executemany. Returns the number inserted. An invalid row raises
+# ValidationError and nothing is inserted.
+def add_transactions(user_id, transactions):
+    with unit_of_work() as conn:
+        cursor = conn.executemany(INSERT_TRANSACTION, (_insert_row(user_id, transaction) for transaction in transactions))
+        _record_change(user_id)
+    return cursor.rowcount
+
+# Set the given columns on every listed transaction, e.g.
+# bulk_update(user_id, ids, category="Groceries"). All ids must belong to the
+# user, otherwise TransactionNotFound is raised and nothing changes.
+def bulk_update(user_id, ids, **changes):
+    unknown = set(changes) - set(UPDATABLE_COLUMNS)
+    if unknown or not changes:
+        raise ValidationError(f"Columns that can be updated: {', '.join(UPDATABLE_COLUMNS)}")
+    for column, value in changes.items():
+        _validated(column, value)
+    assignments = ", ".join(f"{STORED_COLUMNS.get(column, column)} = ?" for column in changes)
+    ids = sorted(set(ids))
+    updated = 0
+    with unit_of_work() as conn:
+        _check_ids_exist(conn, user_id, ids)
+        values = [_stored(column, value) for column, value in changes.items()]
+        for chunk, placeholders in _id_chunks(ids):
+            updated += conn.execute(f"UPDATE transactions SET {assignments} WHERE user_id = ? AND id IN ({placeholders})", (*values, user_id, *chunk)).rowcount
+        _record_change(user_id)
+    return updated
+
+# Delete every listed transaction; all ids must belong to the user
+def bulk_delete(user_id, ids):
+    ids = sorted(set(ids))
+    deleted = 0
+    with unit_of_work() as conn:
+        _check_ids_exist(conn, user_id, ids)
+        for chunk, placeholders in _id_chunks(ids):
+            deleted += conn.execute(f"DELETE FROM transactions WHERE user_id = ? AND id IN ({placeholders})", (user_id, *chunk)).rowcount
+        _record_change(user_id)
+    return deleted
+
+# Insert one transaction and return its id
+def add_transaction(user_id, transaction):
+    with unit_of_work() as conn:
+        transaction_id = conn.execute(INSERT_TRANSACTION, _insert_row(user_id, transaction)).lastrowid
+        _record_change(user_id)
+    return transaction_id
+
+# Cursor whose rows come back as Transaction objects
+def transaction_cursor():
+    cursor = get_connection().cursor()
+    cursor.row_factory = transaction_row_factory
+    return cursor
 
 def view_transactions(user_id):
     try:
-        c.execute("SELECT * FROM transactions WHERE user_id = ?", (user_id,))
-        rows = c.fetchall()
+        rows = transaction_cursor().execute(f"SELECT {TRANSACTION_COLUMNS} FROM transaction_details WHERE user_id = ?", (user_id,)).fetchall()
         if rows:
             print("Date       | Amount | Category     | Description        | Type")
             print("--------------------------------------------------------------")
             for row in rows:
-                print(f"{row[2]} | {row[3]} | {row[4]} | {row[5]} | {row[6]}")
+                print(row)
             return rows  # Return the fetched rows
         else:
             print("No transactions found.")
@@ -25,30 +161,186 @@ def view_transactions(user_id):
         print(f"An error occurred while viewing the transactions: {e}")
         return []
 
+# Keyset pagination over a user's transactions in id order. Each page is an
+# index range scan starting at the boundary id, so the cost of a page does not
+# depend on how deep into the ledger it is.
+def get_transactions_after(user_id, after_id=0, limit=50):
+    return transaction_cursor().execute(f"SELECT {TRANSACTION_COLUMNS} FROM transaction_details WHERE user_id = ? AND id > ? ORDER BY id LIMIT ?", (user_id, after_id, limit)).fetchall()
+
+def get_transactions_before(user_id, before_id, limit=50):
+    rows = transaction_cursor().execute(f"SELECT {TRANSACTION_COLUMNS} FROM transaction_details WHERE user_id = ? AND id < ? ORDER BY id DESC LIMIT ?", (user_id, before_id, limit)).fetchall()
+    rows.reverse()
+    return rows
+
+# Positional access, for jumping straight to a scrollbar position. The offset
+# is skipped over the (user_id) index alone, and only the page is joined to
+# its category and type names.
+def get_transactions_at(user_id, offset, limit=50):
+    return transaction_cursor().execute(f'''SELECT {TRANSACTION_COLUMNS} FROM transaction_details
+                                         WHERE user_id = ? AND id >= (SELECT id FROM transactions WHERE user_id = ? ORDER BY id LIMIT 1 OFFSET ?)
+                                         ORDER BY id LIMIT ?''', (user_id, user_id, offset, limit)).fetchall()
+
+# Full-text search over description and category. Every word of the query
+# must match, as a prefix, so results narrow as the user types. Ranking every
+# hit of a common word would cost hundreds of milliseconds on a large ledger,
+# so the user's SEARCH_WINDOW most recent hits are ranked by relevance (bm25)
+# and paged with offset. Returns Transaction objects.
+SEARCH_WINDOW = 2000
+
+def search_transactions(user_id, query, limit=50, offset=0):
+    match = " ".join(f'"{word}"*' for word in re.findall(r"\w+", query))
+    if not match:
+        return []
+    columns = ", ".join(f"t.{column}" for column in TRANSACTION_COLUMNS.split(", "))
+    return transaction_cursor().execute(f"""WITH hits AS (SELECT transactions_fts.rowid AS id, transactions_fts.rank AS rank
+                                                          FROM transactions_fts JOIN transactions t ON t.id = transactions_fts.rowid
+                                                          WHERE transactions_fts MATCH ? AND t.user_id = ?
+                                                          ORDER BY transactions_fts.rowid DESC LIMIT ?)
+                                            SELECT {columns} FROM hits JOIN transaction_details t ON t.id = hits.id
+                                            ORDER BY hits.rank, t.id DESC LIMIT ? OFFSET ?""",
+                                        (match, user_id, SEARCH_WINDOW, limit, offset)).fetchall()
+
+# Position of a transaction in the id-ordered list, for scrolling to it
+def transaction_position(user_id, transaction_id):
+    return get_connection().execute("SELECT COUNT(*) FROM transactions WHERE user_id = ? AND id < ?", (user_id, transaction_id)).fetchone()[0]
+
+# Row count from the rollup instead of counting the whole ledger. The rollup
+# also counts archived transactions, which are no longer in the table.
+def count_transactions(user_id):
+    conn = get_connection()
+    total = conn.execute("SELECT IFNULL(SUM(count), 0) FROM monthly_rollups WHERE user_id = ?", (user_id,)).fetchone()[0]
+    if has_archive(conn):
+        total -= conn.execute("SELECT IFNULL(SUM(count), 0) FROM archive.archived_batches WHERE user_id = ?", (user_id,)).fetchone()[0]
+    return total
+
+def iter_transactions(user_id, after_id=0, limit=None, page_size=1000):
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = page_size if remaining is None else min(page_size, remaining)
+        rows = get_transactions_after(user_id, after_id, size)
+        yield from rows
+        if len(rows) < size:
+            return
+        after_id = rows[-1].id
+        if remaining is not None:
+            remaining -= len(rows)
+
+# Whole ledger as a columnar TransactionBatch, for analytics that scan everything.
+# Rows carry category ids; names are looked up once per category.
+def load_transaction_batch(user_id, chunk_size=50000):
+    cursor = get_connection().execute(f"SELECT id, date, amount_cents, category_id, type_id = {TYPE_IDS['income']} FROM transactions WHERE user_id = ? ORDER BY id", (user_id,))
+    return TransactionBatch.from_cursor(cursor, chunk_size, category_name)
+
 def get_transaction_by_id(user_id, transaction_id):
     try:
-        c.execute("SELECT * FROM transactions WHERE id = ? AND user_id = ?", (transaction_id, user_id))
-        return c.fetchone()
+        return transaction_cursor().execute(f"SELECT {TRANSACTION_COLUMNS} FROM transaction_details WHERE id = ? AND user_id = ?", (transaction_id, user_id)).fetchone()
     except Exception as e:
         print(f"An error occurred while retrieving the transaction: {e}")
         return None
 
-def edit_transaction(user_id, transaction_id, new_date, new_amount, new_category, new_description, new_transaction_type):
-    try:
-        c.execute("UPDATE transactions SET date = ?, amount = ?, category = ?, description = ?, transaction_type = ? WHERE id = ? AND user_id = ?",
-                  (new_date, new_amount, new_category, new_description, new_transaction_type, transaction_id, user_id))
-        conn.commit()
-        print("Transaction updated successfully.")
-    except Exception as e:
-        print(f"An error occurred while updating the transaction: {e}")
+def edit_transaction(user_id, transaction_id, new_date, new_amount_cents, new_category, new_description, new_transaction_type):
+    bulk_update(user_id, [transaction_id], date=new_date, amount_cents=new_amount_cents, category=new_category,
+                description=new_description, transaction_type=new_transaction_type)
 
 def delete_transaction(user_id, transaction_id):
-    try:
-        c.execute("DELETE FROM transactions WHERE id = ? AND user_id = ?", (transaction_id, user_id))
-        conn.commit()
-        if c.rowcount > 0:
-            print("Transaction deleted successfully.")
-        else:
-            print("Transaction not found.")
-    except Exception as e:
-        print(f"An error occurred while deleting the transaction: {e}")
+    bulk_delete(user_id, [transaction_id])
+
+# CSV rows are date,amount,category,description with an optional fifth
+# transaction_type column. Rows are parsed lazily so only one batch is ever
+# held in memory; rows that fail validation are counted in stats['skipped'].
+def read_csv_transactions(path, user_id, default_type="expense", stats=None):
+    if stats is None:
+        stats = {}
+    stats.setdefault("skipped", 0)
+    with open(path, newline='', encoding='utf-8') as csv_file:
+        for line_number, record in enumerate(csv.reader(csv_file)):
+            if not record or (line_number == 0 and record[0].strip().lower() == "date"):
+                continue
+            if len(record) < 4:
+                stats["skipped"] += 1
+                continue
+            date = parse_date(record[0].strip())
+            amount = parse_amount(record[1].strip())
+            transaction_type = record[4].strip().lower() if len(record) > 4 and record[4].strip() else default_type
+            if date is None or amount is None or transaction_type not in ("income", "expense"):
+                stats["skipped"] += 1
+                continue
+            yield (user_id, date, amount, record[2].strip(), record[3].strip(), transaction_type)
+
+def import_csv(user_id, path, batch_size=10000, default_type="expense"):
+    stats = {"skipped": 0}
+    imported = 0
+    start = time.perf_counter()
+    rows = read_csv_transactions(path, user_id, default_type, stats)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+        # One explicit transaction (and one fsync) per batch
+        with unit_of_work() as conn:
+            conn.executemany(INSERT_TRANSACTION, [(user_id, date, amount, category_id(category), description, TYPE_IDS[transaction_type])
+                                                  for user_id, date, amount, category, description, transaction_type in batch])
+            _record_change(user_id)
+        imported += len(batch)
+    elapsed = time.perf_counter() - start
+    rate = imported / elapsed if elapsed > 0 else 0
+    print(f"Imported {imported} transactions ({stats['skipped']} skipped) in {elapsed:.2f}s ({rate:,.0f} rows/s).")
+    return imported, stats["skipped"], elapsed
+
+# A user's transactions in date order, optionally limited to an inclusive
+# date range, a list of categories and one transaction type. The date bounds
+# are a range scan on the (user_id, date) index; category and type filters
+# compare ids. Reads the hot table only; archive.query_archived() answers
+# the same question for archived years.
+def query_transactions(user_id, columns=TRANSACTION_COLUMNS, start_date=None, end_date=None, categories=None, transaction_type=None):
+    query = f"SELECT {columns} FROM transaction_details WHERE user_id = ?"
+    params = [user_id]
+    if start_date:
+        query += " AND date >= ?"
+        params.append(start_date)
+    if end_date:
+        query += " AND date <= ?"
+        params.append(end_date)
+    if categories:
+        ids = [category for category in map(find_category_id, categories) if category is not None]
+        query += f" AND category_id IN ({', '.join('?' * len(ids))})"
+        params.extend(ids)
+    if transaction_type:
+        query += " AND type_id = ?"
+        params.append(TYPE_IDS.get(transaction_type))
+    return get_connection().execute(query + " ORDER BY date, id", params)
+
+# CSV and JSON Lines exports use the import layout (amounts as decimal
+# strings, so a CSV export can be imported again); Parquet and Arrow keep
+# exact integer cents.
+TEXT_EXPORT_COLUMNS = ['date', 'amount', 'category', 'description', 'type', 'id']
+EXPORT_COLUMNS = ['id', 'date', 'amount_cents', 'category', 'description', 'transaction_type']
+EXPORT_TYPES = {'id': 'int64', 'amount_cents': 'int64'}
+
+# Stream a user's transactions to a file in fetchmany chunks, so memory use
+# stays flat however large the ledger is. The format defaults to the one
+# implied by the file extension. Archived transactions in the range are
+# merged in by (date, id), decompressed one year at a time.
+def export_transactions(user_id, path, fmt=None, start_date=None, end_date=None, categories=None, transaction_type=None, chunk_size=10000):
+    fmt = fmt or format_for_path(path)
+    start = time.perf_counter()
+    if fmt in ('csv', 'jsonl'):
+        columns, convert = TEXT_EXPORT_COLUMNS, {'amount': format_amount}
+        select = "date, amount_cents, category, description, transaction_type, id"
+    else:
+        columns, convert = EXPORT_COLUMNS, None
+        select = ", ".join(EXPORT_COLUMNS)
+    cursor = query_transactions(user_id, select, start_date, end_date, categories, transaction_type)
+    chunks = iter_chunks(cursor, chunk_size)
+    if has_archive(get_connection()):
+        from .archive import query_archived
+        names = [name.strip() for name in select.split(",")]
+        as_row = attrgetter(*names)
+        order = itemgetter(names.index('date'), names.index('id'))
+        rows = heapq.merge(map(as_row, query_archived(user_id, start_date, end_date, categories, transaction_type)), cursor, key=order)
+        chunks = iter(lambda: list(islice(rows, chunk_size)), [])
+    exported = write_rows(chunks, path, columns, fmt, convert, EXPORT_TYPES)
+    elapsed = time.perf_counter() - start
+    rate = exported / elapsed if elapsed > 0 else 0
+    print(f"Exported {exported} transactions to {path} in {elapsed:.2f}s ({rate:,.0f} rows/s).")
+    return exported, elapsed
@@ -1,164 +1,285 @@
-import matplotlib.pyplot as plt
-from .database import c
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
 
-def plot_monthly_expenses(user_id, year):
+import numpy as np
+from matplotlib import dates as mdates
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# Charts are built with the object-oriented Figure API on the Agg canvas, never
+# through pyplot's global state, so they render headless and can be drawn on a
+# worker thread. Each chart kind has a loader (the matching aggregation query)
+# and a builder that turns the loaded data into a Figure. Aggregates come back
+# in integer cents and are scaled to dollars only here.
+from .aggregation import MONTHS, monthly_totals, daily_totals, cumulative_net, category_totals, category_daily_series, category_amounts, transaction_amounts, choose_resolution
+from .database import get_data_version
+from .instrumentation import timed
+
+FIGSIZE = (10, 6)
+RENDER_CACHE_SIZE = 64
+MAX_POINTS = 500     # per line series, after downsampling
+MARKER_POINTS = 60   # draw point markers only on series this short
+
+def _new_figure():
+    figure = Figure(figsize=FIGSIZE)
+    FigureCanvasAgg(figure)
+    return figure, figure.add_subplot()
+
+# Largest-Triangle-Three-Buckets downsampling of a line series to at most
+# max_points points. The first and last points are kept; the points between
+# are split into equal buckets, and from each bucket the point forming the
+# largest triangle with the previously kept point and the mean of the next
+# bucket is kept. Peaks and dips survive, unlike with plain decimation.
+def downsample(x, y, max_points=MAX_POINTS):
+    n = len(x)
+    if n <= max_points or max_points < 3:
+        return x, y
+    xs = x.astype('datetime64[D]').astype(np.float64) if np.issubdtype(x.dtype, np.datetime64) else x.astype(np.float64)
+    ys = y.astype(np.float64)
+    edges = np.append(np.linspace(1, n - 1, max_points - 1).astype(np.int64), n)
+    keep = np.empty(max_points, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_x = xs[end:edges[i + 2]].mean()
+        next_y = ys[end:edges[i + 2]].mean()
+        px, py = xs[previous], ys[previous]
+        areas = np.abs((px - next_x) * (ys[start:end] - py) - (px - xs[start:end]) * (next_y - py))
+        previous = keep[i + 1] = start + int(areas.argmax())
+    return x[keep], y[keep]
+
+# Plot a series of ('YYYY-MM-DD', cents) points on a real date axis
+def _plot_series(ax, dates, amounts, **kwargs):
+    x, y = downsample(np.array(dates, dtype='datetime64[D]'), np.asarray(amounts, dtype=np.int64) / 100)
+    ax.plot(x, y, marker='o' if len(x) <= MARKER_POINTS else None, **kwargs)
+
+def _date_axis(ax):
+    locator = mdates.AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(mdates.ConciseDateFormatter(locator))
+
+RESOLUTION_LABELS = {'day': 'Daily', 'week': 'Weekly', 'month': 'Monthly', 'quarter': 'Quarterly'}
+
+def _resolution_title(title, resolution):
+    return f"{RESOLUTION_LABELS[resolution]} {title}" if resolution in RESOLUTION_LABELS else title
+
+def monthly_expenses_figure(data, year):
+    figure, ax = _new_figure()
+    ax.bar(MONTHS, data['expense'] / 100)
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Expenses ($)')
+    ax.set_title(f'Expenses by Month for {year}')
+    return figure
+
+def income_expense_trend_figure(data, resolution='auto'):
+    dates, incomes, expenses = data
+    figure, ax = _new_figure()
+    _plot_series(ax, dates, incomes, label='Income')
+    _plot_series(ax, dates, expenses, label='Expenses')
+    _date_axis(ax)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Amount ($)')
+    ax.set_title(_resolution_title('Income and Expenses Over Time', resolution))
+    ax.legend()
+    figure.tight_layout()
+    return figure
+
+def income_sources_figure(data):
+    figure, ax = _new_figure()
+    if data:
+        ax.pie([row[1] / 100 for row in data], labels=[row[0] for row in data], autopct='%1.1f%%')
+    else:
+        ax.text(0.5, 0.5, 'No income data to show.', ha='center', va='center')
+        ax.set_axis_off()
+    ax.set_title('Income Sources Distribution')
+    return figure
+
+def monthly_income_vs_expenses_figure(data, year):
+    incomes = data['income'] / 100
+    figure, ax = _new_figure()
+    ax.bar(MONTHS, incomes, label='Income', color='green')
+    ax.bar(MONTHS, data['expense'] / 100, bottom=incomes, label='Expenses', color='red')
+    ax.set_xlabel('Month')
+    ax.set_ylabel('Amount ($)')
+    ax.set_title(f'Monthly Income vs. Expenses for {year}')
+    ax.legend()
+    return figure
+
+def cumulative_savings_figure(data, resolution='auto', start_date=None):
+    dates, balances = data
+    figure, ax = _new_figure()
+    _plot_series(ax, dates, balances, label='Cumulative Savings', color='blue')
+    _date_axis(ax)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Cumulative Savings ($)')
+    ax.set_title(_resolution_title(f'Cumulative Savings Since {start_date}' if start_date else 'Cumulative Savings Over Time', resolution))
+    figure.tight_layout()
+    return figure
+
+def transaction_amounts_histogram_figure(data):
+    figure, ax = _new_figure()
+    ax.hist(data / 100, bins=20, edgecolor='black')
+    ax.set_xlabel('Transaction Amount ($)')
+    ax.set_ylabel('Frequency')
+    ax.set_title('Distribution of Transaction Amounts')
+    return figure
+
+def category_spending_trend_figure(data, resolution='auto'):
+    figure, ax = _new_figure()
+    for category, (dates, amounts) in data.items():
+        _plot_series(ax, dates, amounts, label=category)
+    _date_axis(ax)
+    ax.set_xlabel('Date')
+    ax.set_ylabel('Spending ($)')
+    ax.set_title(_resolution_title('Spending Trend by Category Over Time', resolution))
+    ax.legend()
+    figure.tight_layout()
+    return figure
+
+def transaction_amounts_by_category_figure(data):
+    categories = list(data)
+    category_data = [np.array(data[category], dtype=np.int64) / 100 for category in categories]
+    figure, ax = _new_figure()
+    if not categories:
+        ax.text(0.5, 0.5, 'No expense data to show.', ha='center', va='center')
+        ax.set_axis_off()
+        ax.set_title('Transaction Amounts by Category')
+        return figure
+    try:
+        ax.boxplot(category_data, tick_labels=categories)
+    except TypeError:
+        # matplotlib < 3.9 calls the keyword 'labels'
+        ax.boxplot(category_data, labels=categories)
+    ax.set_xlabel('Category')
+    ax.set_ylabel('Transaction Amount ($)')
+    ax.set_title('Transaction Amounts by Category')
+    return figure
+
+# kind -> (loader(user_id, **params), builder(data, **params)). The trend
+# charts take a resolution ('day', 'week', 'month', 'quarter'); by default it
+# is picked from the length of the user's history. Cumulative savings can
+# start at a start_date instead of the first transaction.
+CHARTS = {
+    'monthly_expenses': (monthly_totals, monthly_expenses_figure),
+    'income_expense_trend': (lambda user_id, resolution='auto': daily_totals(user_id, resolution), income_expense_trend_figure),
+    'income_sources': (lambda user_id: category_totals(user_id, 'income'), income_sources_figure),
+    'monthly_income_vs_expenses': (monthly_totals, monthly_income_vs_expenses_figure),
+    'cumulative_savings': (lambda user_id, resolution='auto', start_date=None: cumulative_net(user_id, resolution, start_date), cumulative_savings_figure),
+    'transaction_amounts_histogram': (transaction_amounts, transaction_amounts_histogram_figure),
+    'category_spending_trend': (lambda user_id, resolution='auto': category_daily_series(user_id, 'expense', resolution), category_spending_trend_figure),
+    'transaction_amounts_by_category': (lambda user_id: category_amounts(user_id, 'expense'), transaction_amounts_by_category_figure),
+}
+TREND_CHARTS = {'income_expense_trend', 'cumulative_savings', 'category_spending_trend'}
+
+# Build the Figure for a chart. Pass data to skip the query, e.g. when it was
+# already loaded on a background worker. An 'auto' resolution is resolved
+# here, so the loader and the title use the same bucket size.
+def chart_figure(user_id, kind, data=None, **params):
+    loader, builder = CHARTS[kind]
+    if kind in TREND_CHARTS and params.get('resolution', 'auto') == 'auto':
+        params['resolution'] = choose_resolution(user_id)
+    if data is None:
+        data = loader(user_id, **params)
+    return builder(data, **params)
+
+# Rendered images: cache key -> bytes, least recently used first
+_render_cache = OrderedDict()
+_render_lock = threading.Lock()
+
+def _render_key(user_id, kind, fmt, params):
+    # The data version changes on every write to the user's transactions, so
+    # an entry can never be served for data it was not rendered from.
+    key = repr((user_id, kind, fmt, sorted(params.items()), get_data_version(user_id)))
+    return hashlib.sha256(key.encode()).hexdigest()
+
+# Render a chart to PNG or SVG bytes without a display. Re-rendering an
+# unchanged chart with the same parameters is served from the cache.
+def render_chart(user_id, kind, fmt='png', dpi=100, **params):
+    key = _render_key(user_id, kind, fmt, dict(params, dpi=dpi))
+    with _render_lock:
+        image = _render_cache.get(key)
+        if image is not None:
+            _render_cache.move_to_end(key)
+            return image
+
+    buffer = BytesIO()
+    with timed("render", kind, fmt=fmt, dpi=dpi):
+        chart_figure(user_id, kind, **params).savefig(buffer, format=fmt, dpi=dpi)
+    image = buffer.getvalue()
+
+    with _render_lock:
+        _render_cache[key] = image
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return image
+
+def clear_render_cache():
+    with _render_lock:
+        _render_cache.clear()
+
+# Show a Figure in its own Tk window with the interactive toolbar. Must be
+# called on the Tk thread.
+def show_figure(figure, title=None):
+    import tkinter as tk
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg, NavigationToolbar2Tk
+
+    window = tk.Toplevel()
+    window.title(title or (figure.axes[0].get_title() if figure.axes else "Chart"))
+    canvas = FigureCanvasTkAgg(figure, master=window)
+    NavigationToolbar2Tk(canvas, window)
+    canvas.get_tk_widget().pack(fill=tk.BOTH, expand=True)
+    canvas.draw()
+    return window
+
+# Each plot function loads its own data unless it is handed the result of the
+# matching aggregation query, and opens the chart in a Tk window.
+def plot_monthly_expenses(user_id, year, data=None):
     try:
-        months = [f"{i:02}" for i in range(1, 13)]
-        expenses = []
-        for month in months:
-            c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'expense' AND strftime('%Y', date) = ? AND strftime('%m', date) = ?", (user_id, year, month))
-            expense = c.fetchone()[0] or 0
-            expenses.append(expense)
-
-        plt.figure(figsize=(10, 6))
-        plt.bar(months, expenses)
-        plt.xlabel('Month')
-        plt.ylabel('Expenses ($)')
-        plt.title(f'Expenses by Month for {year}')
-        plt.show()
+        show_figure(chart_figure(user_id, 'monthly_expenses', data, year=year))
     except Exception as e:
         print(f"An error occurred while plotting monthly expenses: {e}")
 
-def plot_income_expense_trend(user_id):
+def plot_income_expense_trend(user_id, data=None):
     try:
-        c.execute("SELECT date, SUM(CASE WHEN transaction_type = 'income' THEN amount ELSE 0 END) as income, SUM(CASE WHEN transaction_type = 'expense' THEN amount ELSE 0 END) as expense FROM transactions WHERE user_id = ? GROUP BY date ORDER BY date", (user_id,))
-        data = c.fetchall()
-
-        dates = [row[0] for row in data]
-        incomes = [row[1] for row in data]
-        expenses = [row[2] for row in data]
-
-        plt.figure(figsize=(10, 6))
-        plt.plot(dates, incomes, label='Income', marker='o')
-        plt.plot(dates, expenses, label='Expenses', marker='o')
-        plt.xlabel('Date')
-        plt.ylabel('Amount ($)')
-        plt.title('Income and Expenses Over Time')
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+        show_figure(chart_figure(user_id, 'income_expense_trend', data))
     except Exception as e:
         print(f"An error occurred while plotting income and expenses: {e}")
 
-def plot_income_sources(user_id):
+def plot_income_sources(user_id, data=None):
     try:
-        c.execute("SELECT category, SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'income' GROUP BY category", (user_id,))
-        income_sources = c.fetchall()
-        if income_sources:
-            labels = [row[0] for row in income_sources]
-            sizes = [row[1] for row in income_sources]
-
-            plt.figure(figsize=(10, 6))
-            plt.pie(sizes, labels=labels, autopct='%1.1f%%')
-            plt.title('Income Sources Distribution')
-            plt.show()
-        else:
-            print("No income data to show.")
+        show_figure(chart_figure(user_id, 'income_sources', data))
     except Exception as e:
         print(f"An error occurred while plotting income sources: {e}")
 
-def plot_monthly_income_vs_expenses(user_id, year):
+def plot_monthly_income_vs_expenses(user_id, year, data=None):
     try:
-        months = [f"{i:02}" for i in range(1, 13)]
-        incomes = []
-        expenses = []
-        for month in months:
-            c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'income' AND strftime('%Y', date) = ? AND strftime('%m', date) = ?", (user_id, year, month))
-            income = c.fetchone()[0] or 0
-            incomes.append(income)
-
-            c.execute("SELECT SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'expense' AND strftime('%Y', date) = ? AND strftime('%m', date) = ?", (user_id, year, month))
-            expense = c.fetchone()[0] or 0
-            expenses.append(expense)
-
-        plt.figure(figsize=(10, 6))
-        plt.bar(months, incomes, label='Income', color='green')
-        plt.bar(months, expenses, bottom=incomes, label='Expenses', color='red')
-        plt.xlabel('Month')
-        plt.ylabel('Amount ($)')
-        plt.title(f'Monthly Income vs. Expenses for {year}')
-        plt.legend()
-        plt.show()
+        show_figure(chart_figure(user_id, 'monthly_income_vs_expenses', data, year=year))
     except Exception as e:
         print(f"An error occurred while plotting monthly income vs. expenses: {e}")
 
-def plot_cumulative_savings(user_id):
+def plot_cumulative_savings(user_id, data=None):
     try:
-        c.execute("SELECT date, SUM(CASE WHEN transaction_type = 'income' THEN amount ELSE -amount END) as net FROM transactions WHERE user_id = ? GROUP BY date ORDER BY date", (user_id,))
-        data = c.fetchall()
-
-        dates = [row[0] for row in data]
-        cumulative_savings = []
-        total = 0
-        for row in data:
-            total += row[1]
-            cumulative_savings.append(total)
-
-        plt.figure(figsize=(10, 6))
-        plt.plot(dates, cumulative_savings, label='Cumulative Savings', color='blue', marker='o')
-        plt.xlabel('Date')
-        plt.ylabel('Cumulative Savings ($)')
-        plt.title('Cumulative Savings Over Time')
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+        show_figure(chart_figure(user_id, 'cumulative_savings', data))
     except Exception as e:
         print(f"An error occurred while plotting cumulative savings: {e}")
 
-def plot_transaction_amounts_histogram(user_id):
+def plot_transaction_amounts_histogram(user_id, data=None):
     try:
-        c.execute("SELECT amount FROM transactions WHERE user_id = ?", (user_id,))
-        amounts = [row[0] for row in c.fetchall()]
-
-        plt.figure(figsize=(10, 6))
-        plt.hist(amounts, bins=20, edgecolor='black')
-        plt.xlabel('Transaction Amount ($)')
-        plt.ylabel('Frequency')
-        plt.title('Distribution of Transaction Amounts')
-        plt.show()
+        show_figure(chart_figure(user_id, 'transaction_amounts_histogram', data))
     except Exception as e:
         print(f"An error occurred while plotting transaction amounts histogram: {e}")
 
-def plot_category_spending_trend(user_id):
+def plot_category_spending_trend(user_id, data=None):
     try:
-        c.execute("SELECT DISTINCT category FROM transactions WHERE user_id = ? AND transaction_type = 'expense'", (user_id,))
-        categories = [row[0] for row in c.fetchall()]
-
-        plt.figure(figsize=(10, 6))
-        for category in categories:
-            c.execute("SELECT date, SUM(amount) FROM transactions WHERE user_id = ? AND transaction_type = 'expense' AND category = ? GROUP BY date ORDER BY date", (user_id, category))
-            data = c.fetchall()
-            dates = [row[0] for row in data]
-            amounts = [row[1] for row in data]
-            plt.plot(dates, amounts, label=category, marker='o')
-
-        plt.xlabel('Date')
-        plt.ylabel('Spending ($)')
-        plt.title('Spending Trend by Category Over Time')
-        plt.legend()
-        plt.xticks(rotation=45)
-        plt.tight_layout()
-        plt.show()
+        show_figure(chart_figure(user_id, 'category_spending_trend', data))
     except Exception as e:
         print(f"An error occurred while plotting category spending trends: {e}")
 
-def plot_transaction_amounts_by_category(user_id):
+def plot_transaction_amounts_by_category(user_id, data=None):
     try:
-        c.execute("SELECT DISTINCT category FROM transactions WHERE user_id = ? AND transaction_type = 'expense'", (user_id,))
-        categories = [row[0] for row in c.fetchall()]
-        category_data = []
-
-        for category in categories:
-            c.execute("SELECT amount FROM transactions WHERE user_id = ? AND transaction_type = 'expense' AND category = ?", (user_id, category))
-            amounts = [row[0] for row in c.fetchall()]
-            category_data.append(amounts)
-
-        plt.figure(figsize=(10, 6))
-        plt.boxplot(category_data, labels=categories)
-        plt.xlabel('Category')
-        plt.ylabel('Transaction Amount ($)')
-        plt.title('Transaction Amounts by Category')
-        plt.show()
+        show_figure(chart_figure(user_id, 'transaction_amounts_by_category', data))
     except Exception as e:
         print(f"An error occurred while plotting transaction amounts by category: {e}")
@@ -0,0 +1,150 @@
+import tkinter as tk
+from tkinter import ttk
+
+# A Listbox that only ever holds the rows currently on screen. The scrollbar
+# is driven from the total row count, and scrolling asks the data source for
+# just the rows that come into view:
+#
+#   count()                  -> total number of rows
+#   fetch_after(key, n)      -> up to n rows following the row with this key
+#   fetch_before(key, n)     -> up to n rows preceding it, in display order
+#   fetch_at(offset, n)      -> up to n rows starting at a position
+#
+# Small scrolls page by key from the visible edge; only scrollbar jumps fall
+# back to a positional fetch.
+class VirtualListbox(ttk.Frame):
+    def __init__(self, parent, count, fetch_after, fetch_before, fetch_at, format_row, row_key=lambda row: row[0], height=10, **kwargs):
+        super().__init__(parent, **kwargs)
+        self.count = count
+        self.fetch_after = fetch_after
+        self.fetch_before = fetch_before
+        self.fetch_at = fetch_at
+        self.format_row = format_row
+        self.row_key = row_key
+
+        self.total = 0
+        self.top = 0
+        self.rows = []
+        self.visible = height
+        self.selected_key = None
+
+        self.columnconfigure(0, weight=1)
+        self.rowconfigure(0, weight=1)
+        self.listbox = tk.Listbox(self, height=height, exportselection=False)
+        self.listbox.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self.listbox.bind("<<ListboxSelect>>", self._on_select)
+        self.listbox.bind("<Configure>", self._on_resize)
+        self.listbox.bind("<MouseWheel>", lambda event: self.scroll(-1 if event.delta > 0 else 1))
+        self.listbox.bind("<Button-4>", lambda event: self.scroll(-1))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll(1))
+
+    # Re-read the row count and the visible window, keeping the position
+    def reload(self):
+        self.total = self.count()
+        self._load_at(min(self.top, max(self.total - self.visible, 0)))
+
+    def selected_row(self):
+        for row in self.rows:
+            if self.row_key(row) == self.selected_key:
+                return row
+        return None
+
+    # Scroll so the row at this position is on screen and select it
+    def show_row(self, offset, key):
+        self.selected_key = key
+        self._load_at(min(max(offset - self.visible // 2, 0), max(self.total - self.visible, 0)))
+
+    # Incremental updates touch only the visible window. New rows have the
+    # highest id, so they belong at the end of the list.
+    def insert_row(self, row):
+        at_end = self.top + len(self.rows) >= self.total
+        self.total += 1
+        if not at_end:
+            self._update_scrollbar()
+            return
+        self.rows.append(row)
+        if len(self.rows) > self.visible:
+            self.rows.pop(0)
+            self.top += 1
+        self._render()
+
+    def update_row(self, row):
+        key = self.row_key(row)
+        for index, existing in enumerate(self.rows):
+            if self.row_key(existing) == key:
+                self.rows[index] = row
+                self._render()
+                return
+
+    def delete_row(self, key):
+        if self.selected_key == key:
+            self.selected_key = None
+        self.total = max(self.total - 1, 0)
+        keys = [self.row_key(row) for row in self.rows]
+        if key in keys:
+            # Refill the window from its first remaining row
+            self._load_at(min(self.top, max(self.total - self.visible, 0)))
+        else:
+            self._update_scrollbar()
+
+    def scroll(self, delta):
+        if not self.rows:
+            return
+        delta = max(0, min(self.top + delta, max(self.total - self.visible, 0))) - self.top
+        if delta > 0:
+            rows = self.rows + self.fetch_after(self.row_key(self.rows[-1]), delta)
+            self.rows = rows[-self.visible:]
+            self.top += len(rows) - len(self.rows)
+        elif delta < 0:
+            new_rows = self.fetch_before(self.row_key(self.rows[0]), -delta)
+            self.rows = (new_rows + self.rows)[:self.visible]
+            self.top -= len(new_rows)
+        self._render()
+
+    def _load_at(self, offset):
+        self.top = max(offset, 0)
+        self.rows = self.fetch_at(self.top, self.visible) if self.total else []
+        self._render()
+
+    def _on_scrollbar(self, action, amount, unit=None):
+        if action == "moveto":
+            offset = int(float(amount) * self.total)
+            offset = max(0, min(offset, max(self.total - self.visible, 0)))
+            if abs(offset - self.top) <= self.visible:
+                self.scroll(offset - self.top)
+            else:
+                self._load_at(offset)
+        elif action == "scroll":
+            step = int(amount) * (self.visible if unit == "pages" else 1)
+            self.scroll(step)
+
+    def _on_resize(self, event):
+        line_height = self.listbox.bbox(0)[3] + 1 if self.rows and self.listbox.bbox(0) else 0
+        if not line_height:
+            return
+        visible = max(event.height // line_height, 1)
+        if visible != self.visible:
+            self.visible = visible
+            self._load_at(min(self.top, max(self.total - visible, 0)))
+
+    def _on_select(self, event):
+        selection = self.listbox.curselection()
+        if selection and selection[0] < len(self.rows):
+            self.selected_key = self.row_key(self.rows[selection[0]])
+
+    def _render(self):
+        self.listbox.delete(0, tk.END)
+        for index, row in enumerate(self.rows):
+            self.listbox.insert(tk.END, self.format_row(row))
+            if self.row_key(row) == self.selected_key:
+                self.listbox.selection_set(index)
+        self._update_scrollbar()
+
+    def _update_scrollbar(self):
+        if self.total:
+            self.scrollbar.set(self.top / self.total, min((self.top + len(self.rows)) / self.total, 1.0))
+        else:
+            self.scrollbar.set(0.0, 1.0)
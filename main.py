@@ -1,8 +1,16 @@
+import sys
+
 from finance_manager.database import create_tables
-from finance_manager.gui import show_login_window
-from finance_manager.transactions import add_transaction, view_transactions, get_transaction_by_id, edit_transaction, delete_transaction
-from finance_manager.models import Transaction  # Keep only the Transaction import
+from finance_manager.instrumentation import configure_from_environment
 
 if __name__ == "__main__":
-    create_tables()  # Only create tables if they don't exist
-    show_login_window()
+    configure_from_environment()  # FINANCE_MANAGER_PROFILE, FINANCE_MANAGER_SLOW_QUERY_MS
+    if len(sys.argv) > 1:
+        # Command line tools, e.g. `python main.py import 1 data/transactions.csv`
+        from finance_manager.cli import main
+        main(sys.argv[1:])
+    else:
+        # The GUI (and Tk) is only imported when it is going to be shown
+        from finance_manager.gui import show_login_window
+        create_tables()  # Only create tables if they don't exist
+        show_login_window()
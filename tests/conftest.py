@@ -0,0 +1,47 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir, "benchmarks"))
+
+from finance_manager import database
+from ledger import build_ledger
+
+# The seeded synthetic ledger of benchmarks/ledger.py, built once per session;
+# each test gets a fresh copy as the app's database.
+LEDGER_ROWS, LEDGER_USERS, LEDGER_SEED = 100000, 5, 0
+
+@pytest.fixture(scope="session")
+def ledger_path(tmp_path_factory):
+    return build_ledger(str(tmp_path_factory.mktemp("ledger") / "ledger.db"), LEDGER_ROWS, LEDGER_USERS, LEDGER_SEED)
+
+# Point the app at a database file for one test
+@pytest.fixture
+def use_database():
+    previous = database.DB_PATH
+
+    def use(path):
+        database.close_connection()
+        database.DB_PATH = path
+        # Caches are keyed by user and data version, not by database file
+        database.bump_data_version()
+
+    yield use
+    database.close_connection()
+    database.DB_PATH = previous
+
+@pytest.fixture
+def ledger_db(ledger_path, tmp_path, use_database):
+    path = str(tmp_path / "ledger.db")
+    shutil.copyfile(ledger_path, path)
+    use_database(path)
+    database.create_tables()
+    return path
+
+@pytest.fixture
+def empty_db(tmp_path, use_database):
+    path = str(tmp_path / "empty.db")
+    use_database(path)
+    return path
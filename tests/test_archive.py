@@ -0,0 +1,19 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from finance_manager import aggregation, archive, database
+
+# Every thread has its own connection. One opened before the archive existed
+# must read the archived years once another thread has moved them there.
+
+def read_totals(user_id):
+    return aggregation.date_range_totals(user_id, '2016-01-01', '2018-12-31'), aggregation.daily_totals(user_id, 'day')
+
+def test_connections_opened_before_archiving_read_the_archive(ledger_db):
+    with ThreadPoolExecutor(max_workers=1) as worker:
+        before = worker.submit(read_totals, 1).result()
+        archived, _ = archive.archive_years(2020)
+        after = worker.submit(read_totals, 1).result()
+        worker.submit(database.close_connection).result()
+    assert archived
+    assert before[0] != (0, 0)
+    assert after == before
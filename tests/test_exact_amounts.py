@@ -0,0 +1,83 @@
+from collections import defaultdict
+from itertools import accumulate
+
+import numpy as np
+import pytest
+
+from conftest import LEDGER_ROWS, LEDGER_SEED, LEDGER_USERS
+from finance_manager import aggregation, database, models, reports
+from ledger import generate_rows
+
+# Amounts are integer cents end to end, so totals over the whole synthetic
+# ledger must equal the exact integer sums of the generated rows, with no
+# float drift however many rows are added up.
+
+@pytest.fixture(scope="module")
+def expected():
+    totals = defaultdict(lambda: {'income': 0, 'expense': 0, 'by_month': defaultdict(lambda: {'income': 0, 'expense': 0}), 'by_day': defaultdict(int)})
+    for user_id, date, amount, _, _, transaction_type in generate_rows(LEDGER_ROWS, LEDGER_USERS, seed=LEDGER_SEED):
+        user = totals[user_id]
+        user[transaction_type] += amount
+        user['by_month'][date[:7]][transaction_type] += amount
+        user['by_day'][date] += amount if transaction_type == 'income' else -amount
+    return totals
+
+def test_summary_is_exact(ledger_db, expected):
+    for user_id, totals in expected.items():
+        result = reports.summary(user_id)
+        assert all(isinstance(result[key], int) for key in ('income', 'expense', 'net'))
+        assert (result['income'], result['expense']) == (totals['income'], totals['expense'])
+        assert result['net'] == totals['income'] - totals['expense']
+        assert result['by_month'] == totals['by_month']
+
+def test_monthly_totals_are_exact(ledger_db, expected):
+    for user_id, totals in expected.items():
+        for year in sorted({year_month[:4] for year_month in totals['by_month']}):
+            series = aggregation.monthly_totals(user_id, year)
+            for transaction_type in ('income', 'expense'):
+                months = [totals['by_month'].get(f"{year}-{month}", {}).get(transaction_type, 0) for month in aggregation.MONTHS]
+                assert series[transaction_type].dtype == np.int64
+                assert series[transaction_type].tolist() == months
+
+def test_cumulative_net_is_exact(ledger_db, expected):
+    for user_id, totals in expected.items():
+        days = sorted(totals['by_day'])
+        dates, balances = aggregation.cumulative_net(user_id, 'day')
+        assert balances.dtype == np.int64
+        assert (dates, balances.tolist()) == (days, list(accumulate(totals['by_day'][day] for day in days)))
+
+        months = sorted(totals['by_month'])
+        nets = [totals['by_month'][month]['income'] - totals['by_month'][month]['expense'] for month in months]
+        dates, balances = aggregation.cumulative_net(user_id, 'month')
+        assert (dates, balances.tolist()) == ([f"{month}-01" for month in months], list(accumulate(nets)))
+
+# A window seeded from the checkpoints ends every bucket on the same balance
+# as the whole history does, also mid-month and for weeks across months
+def test_cumulative_net_window_matches_history(ledger_db):
+    def buckets(*args):
+        dates, balances = aggregation.cumulative_net(*args)
+        return list(zip(dates, balances.tolist()))
+
+    for user_id in range(1, LEDGER_USERS + 1):
+        for resolution in aggregation.RESOLUTIONS:
+            history = buckets(user_id, resolution)
+            for start_date in ('2019-03-01', '2021-07-16', '2024-12-31'):
+                window = buckets(user_id, resolution, start_date)
+                assert window and window == history[len(history) - len(window):]
+                assert [bucket for bucket in history if bucket[0] >= start_date] == [bucket for bucket in window if bucket[0] >= start_date]
+
+# REAL amounts whose binary value lies just below the half cent
+# (0.285 is 0.28499999...) round half up, as typed amounts do (to_cents)
+def test_migration_rounds_real_amounts_half_up(empty_db, monkeypatch):
+    amounts = {0.285: 29, 1.005: 101, 2.675: 268, 19.99: 1999, 0.1: 10, 1234567.895: 123456790}
+    assert [models.to_cents(amount) for amount in amounts] == list(amounts.values())
+    monkeypatch.setattr(database, 'MIGRATIONS', database.MIGRATIONS[:3])
+    database.create_tables()
+    with database.transaction() as conn:
+        conn.executemany("INSERT INTO transactions (user_id, date, amount, category, description, transaction_type) VALUES (1, '2024-01-15', ?, 'Food', '', 'expense')",
+                         [(amount,) for amount in amounts])
+    monkeypatch.undo()
+    database.migrate()
+    rows = database.get_connection().execute("SELECT amount_cents FROM transactions ORDER BY id").fetchall()
+    assert [row[0] for row in rows] == list(amounts.values())
+    assert database.check_rollups() == []
@@ -0,0 +1,71 @@
+import pytest
+
+from finance_manager import aggregation, archive, balances, instrumentation, reports, visualization
+
+# Every query the reports, charts and aggregations run must reach
+# transactions through an index: a plan step that scans the table (or a
+# whole index of it) fails the test, naming the statement.
+
+YEAR = 2024
+
+class PlanSink(instrumentation.Sink):
+    def __init__(self):
+        super().__init__(kinds={"query"}, slow_only=True)
+        self.events = []
+
+    def write(self, event):
+        self.events.append(event)
+
+@pytest.fixture
+def plans():
+    sink = instrumentation.add_sink(PlanSink())
+    # A threshold of 0 attaches the EXPLAIN QUERY PLAN to every query
+    instrumentation.set_slow_query_threshold(0)
+    yield sink.events
+    instrumentation.set_slow_query_threshold(None)
+    instrumentation.remove_sink(sink)
+
+def run_reports_and_charts(user_id, tmp_path):
+    reports.summary(user_id)
+    reports.generate_monthly_report(user_id, YEAR, 6)
+    reports.generate_yearly_summary(user_id, YEAR)
+    reports.generate_custom_report(user_id, f"{YEAR}-01-01", f"{YEAR}-06-30")
+    reports.export_monthly_summary(user_id, str(tmp_path / "summary.csv"), start_month=f"{YEAR}-01")
+
+    aggregation.period_totals(user_id, f"{YEAR}-01", f"{YEAR + 1}-01")
+    aggregation.date_range_totals(user_id, f"{YEAR}-03-15", f"{YEAR}-09-15")
+    aggregation.monthly_totals(user_id, YEAR)
+    aggregation.category_totals(user_id, "expense")
+    aggregation.choose_resolution(user_id)
+    for resolution in aggregation.RESOLUTIONS + ["auto"]:
+        aggregation.daily_totals(user_id, resolution)
+        aggregation.daily_net(user_id, resolution)
+        aggregation.cumulative_net(user_id, resolution)
+        aggregation.cumulative_net(user_id, resolution, f"{YEAR}-06-15")
+        aggregation.category_daily_series(user_id, "expense", resolution)
+    aggregation.category_amounts(user_id, "expense")
+    aggregation.transaction_amounts(user_id)
+    balances.balance_at(user_id, f"{YEAR}-06-15")
+    balances.balance_at(user_id, f"{YEAR - 5}-06-15")
+    balances.month_end_balances(user_id)
+
+    visualization.clear_render_cache()
+    for kind in visualization.CHARTS:
+        params = {"year": YEAR} if kind.startswith("monthly") else {}
+        visualization.render_chart(user_id, kind, **params)
+
+def table_scans(events):
+    return [(event["name"], line.strip()) for event in events for line in event["plan"]
+            if line.strip().startswith("SCAN transactions")]
+
+def test_report_and_chart_queries_use_indexes(ledger_db, plans, tmp_path, capsys):
+    run_reports_and_charts(1, tmp_path)
+    assert plans
+    assert table_scans(plans) == []
+
+def test_queries_across_the_archive_use_indexes(ledger_db, plans, tmp_path, capsys):
+    archive.archive_years(YEAR - 1)
+    plans.clear()
+    run_reports_and_charts(1, tmp_path)
+    assert any("archive." in event["name"] for event in plans)
+    assert table_scans(plans) == []
@@ -0,0 +1,11 @@
+from finance_manager import aggregation, visualization
+
+# Trend charts drawn with the default resolution name the bucket size that was
+# picked for the user's history in their title.
+
+def test_auto_resolution_is_named_in_trend_titles(ledger_db):
+    label = visualization.RESOLUTION_LABELS[aggregation.choose_resolution(1)]
+    for kind in visualization.TREND_CHARTS:
+        title = visualization.chart_figure(1, kind).axes[0].get_title()
+        assert title.startswith(f"{label} "), (kind, title)
+        assert visualization.chart_figure(1, kind, resolution='quarter').axes[0].get_title().startswith("Quarterly ")